@@ -1,10 +1,14 @@
 import pandas as pd
-import numpy as np
-import plotly.express as px
 import streamlit as st
+from modules import diagnostics
 from modules import helper_functions as hlp
+from modules.computations import reuse_figure
+from modules.geography import MAP_MEASURES, SCHEMATIC_CAPTION, DistrictGeometry, map_figure
+from modules.home_figures import kpi_figure, rei_figure
+from modules.refresh import REFRESHER
 
 def draw_line(df: pd.DataFrame, x_data: str, y_data: str, graph_title:str, x_axis_title: str, y_axis_title: str):
+    import plotly.express as px
     fig = px.line(df, x=x_data, y=y_data, markers=True)
     fig.update_traces(hovertemplate=None)
     fig.update_layout(
@@ -19,11 +23,11 @@ def draw_line(df: pd.DataFrame, x_data: str, y_data: str, graph_title:str, x_axi
     return fig
 
 
-df = pd.read_csv('real_estate_index.csv', delimiter=";")
-df_inflation = pd.read_csv('inflation_rate.csv', delimiter=";")
-
-hlp.transform_dtype(df_inflation, 'KPI')
-hlp.transform_dtype(df_inflation, 'KPIF')
+hlp.INSTRUMENTATION.start_rerun('home')
+hlp.ImportData.pin_versions()
+df = hlp.REAL_ESTATE_INDEX_DATA.load()
+df_inflation = hlp.INFLATION_DATA.load()
+REFRESHER.start()
 
 
 st.set_page_config(
@@ -32,6 +36,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+if diagnostics.requested():
+    diagnostics.render()
+    hlp.INSTRUMENTATION.finish_rerun()
+    st.stop()
+
 
 
 def sidebar():
@@ -50,8 +59,13 @@ def sidebar():
 
 def first_section():
     col1, col2 = st.columns(2)
-    coords = pd.DataFrame(np.random.randn(1, 2) / [100, 100] + [hlp.MALMÖ_COORDINATES[0], hlp.MALMÖ_COORDINATES[1]],columns=['lat', 'lon'])
-    col1.map(coords,10, use_container_width=True)
+    measures = {label: measure for measure, label in MAP_MEASURES.items()}
+    measure = measures[col1.radio('Map', list(measures), horizontal=True, label_visibility='collapsed')]
+    geometry = DistrictGeometry.from_file()
+    inputs = (hlp.HOUSING_DATA.version, geometry.version, measure)
+    hlp.plotly_chart(col1, reuse_figure('home.map', inputs, lambda: map_figure(measure, hlp.CHART_WIDTH, 450)), use_container_width=True)
+    if geometry.schematic:
+        col1.caption(SCHEMATIC_CAPTION)
     col2.markdown("# :city_sunset: in-Malmö")
     col2.write(f"{hlp.APP_DESCRIPTION}")
     #col2.markdown(f"""{hlp.APP_DESCRIPTION}""")
@@ -71,16 +85,12 @@ def second_section():
         f"""
         ### :arrow_lower_right: A sharp price correction is coming
        {hlp.INTRODUCTION_DESCRIPTION}""")
-    fig = hlp.draw_multiple_graphs(df, df.columns[1:])
-    fig.update_layout(
-        title='Real Estate Index (REI) in Sweden from 1970-',
-        xaxis_title = 'DATE',
-        yaxis_title = 'REI',
-        font_family="Courier New",
-        title_font_family="Times New Roman",
-        hovermode='x unified')
-
-    col4.plotly_chart(fig)
+    if hlp.lazy_section('Show Real Estate Index chart', 'section_rei', col4):
+        window = hlp.zoom_range(col4, df['DATE'], 'zoom_rei')
+        real = col4.checkbox('Adjust for inflation (KPI)', key='rei_real')
+        versions = (hlp.REAL_ESTATE_INDEX_DATA.version,) + ((hlp.HOUSING_DATA.version, hlp.INFLATION_DATA.version) if real else ())
+        fig = reuse_figure('home.rei', versions + (window, real), lambda: rei_figure(window, real))
+        hlp.plotly_chart(col4, fig)
     st.subheader('Real Estate Index: A Key Indicator of the Health of the Market')
     st.markdown(f"{hlp.REAL_ESTATE_INDEX_DESCRIPTION}")
     st.markdown("---")
@@ -88,21 +98,10 @@ def second_section():
 def third_section():
     col5, col6 = st.columns(2)    
     #fig = hlp.draw_line(df_inflation, df_inflation['DATE'], ['KPI', 'KPIF'], 'KPI - Consumer Price Index','Date', 'KPI in %')
-    fig = hlp.draw_multiple_graphs(df_inflation,['KPIF',"KPI"])
-    fig.update_layout(
-        title='Consumer Price Index w/o fixed rate, KPIF & KPI',
-        xaxis_title = 'DATE',
-        yaxis_title = 'in %',
-        font_family="Courier New",
-        title_font_family="Times New Roman",
-        hovermode='x unified')
-    fig.data[0].update(marker={
-    'color': '#463f3a'
-    })
-    fig.data[1].update(marker={
-        'color':'#2a9d8f'
-    })
-    col5.plotly_chart(fig, use_container_width=True)
+    if hlp.lazy_section('Show KPI & KPIF chart', 'section_kpi', col5):
+        window = hlp.zoom_range(col5, df_inflation['DATE'], 'zoom_kpi')
+        fig = reuse_figure('home.kpi', (hlp.INFLATION_DATA.version, window), lambda: kpi_figure(window))
+        hlp.plotly_chart(col5, fig, use_container_width=True)
     col6.markdown(
         f"""
         ### :scales: Global recession may not bring down the demand?
@@ -123,4 +122,5 @@ sidebar()
 first_section()
 second_section()
 third_section()
-fourth_section()
\ No newline at end of file
+fourth_section()
+hlp.INSTRUMENTATION.finish_rerun()
@@ -0,0 +1,170 @@
+"""
+Requests/sec of the read-only data API (modules/api.py).
+
+Starts the API in its own process (or targets --url) and lets concurrent clients with
+keep-alive connections request a mix of endpoints for a fixed time per scenario:
+
+json         full JSON bodies
+gzip         the same, gzip-compressed
+arrow        Arrow IPC streams
+revalidate   If-None-Match with the ETag of an earlier response (304s)
+
+Usage:
+python benchmarks/api_bench.py --clients 8 --duration 5
+python benchmarks/api_bench.py --scale 100 --output /tmp/api.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import percentile
+
+PATHS = [
+    '/series/{district}?sma=3,6,12',
+    '/series/{district}?metric=NOS',
+    '/summary/{district}',
+    '/metric/PPSM',
+    '/districts',
+]
+SCENARIOS = {
+    'json': {'Accept-Encoding': 'identity'},
+    'gzip': {'Accept-Encoding': 'gzip'},
+    'arrow': {'Accept-Encoding': 'identity', 'Accept': 'application/vnd.apache.arrow.stream'},
+    'revalidate': {'Accept-Encoding': 'gzip'},
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: dict):
+    """Runs python -m modules.api in a child process; returns (process, base URL) once it answers."""
+    import requests
+
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'modules.api', '--port', str(port)], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}/v1'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            requests.get(f'{url}/districts', timeout=1)
+            return process, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('API did not start')
+
+
+def client(url: str, paths: list[str], headers: dict, revalidate: bool, duration: float, seed: int) -> dict:
+    import requests
+
+    rng = random.Random(seed)
+    session = requests.Session()
+    etags = {}
+    latencies, statuses, received = [], {}, 0
+    if revalidate:
+        for path in paths:
+            etags[path] = session.get(url + path, headers=headers).headers.get('ETag')
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        path = rng.choice(paths)
+        request_headers = dict(headers, **({'If-None-Match': etags[path]} if revalidate and etags.get(path) else {}))
+        start = time.perf_counter()
+        response = session.get(url + path, headers=request_headers, stream=True)
+        # Read the raw bytes, as a consumer that stores or forwards them would, without decompressing
+        body = response.raw.read()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        received += len(body)
+    return {'latencies': latencies, 'statuses': statuses, 'bytes': received}
+
+
+def run_scenario(url: str, paths: list[str], name: str, clients: int, duration: float, seed: int) -> dict:
+    results = [None] * clients
+
+    def work(i: int):
+        results[i] = client(url, paths, SCENARIOS[name], name == 'revalidate', duration, seed + i)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    statuses = {}
+    for result in results:
+        for status, count in result['statuses'].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_kib': sum(result['bytes'] for result in results) / max(len(latencies), 1) / 1024,
+        'statuses': statuses,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running API instead of starting one, e.g. http://127.0.0.1:8080/v1')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients, one keep-alive connection each')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--scale', type=int, help='serve a synthetic dataset of this scale (see benchmarks/synthetic.py)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the summary as JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='in-malmoe-api-') as directory:
+        env = dict(os.environ)
+        if args.scale:
+            import synthetic
+            synthetic.write_dataset(args.scale, directory)
+            env['IN_MALMOE_DATA_DIR'] = directory
+
+        process, url = (None, args.url.rstrip('/')) if args.url else start_server(env)
+        try:
+            import requests
+
+            districts = sorted({row[0] for row in requests.get(f'{url}/districts').json()['data']})
+            paths = [path.format(district=district) for path in PATHS for district in districts if '{district}' in path]
+            paths += [path for path in PATHS if '{district}' not in path]
+
+            summary = {'clients': args.clients, 'duration_s': args.duration, 'scenarios': {}}
+            print(f'{"scenario":<14}{"requests":>10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"KiB/resp":>10}  statuses')
+            for name in args.scenarios:
+                row = run_scenario(url, paths, name, args.clients, args.duration, args.seed)
+                summary['scenarios'][name] = row
+                print(f'{name:<14}{row["requests"]:>10}{row["rps"]:>10.0f}{row["p50_ms"]:>10.2f}{row["p99_ms"]:>10.2f}{row["mean_kib"]:>10.1f}  {row["statuses"]}')
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
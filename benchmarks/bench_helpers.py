@@ -0,0 +1,174 @@
+"""
+Benchmarks of the helper_functions data layer, calculations, draw methods and a headless
+Data Analysis page render, on synthetic datasets at 1x, 10x, 100x and 1000x.
+
+Results are written as JSON; pass an earlier result file with --compare to flag
+regressions between releases.
+
+Usage:
+python benchmarks/bench_helpers.py --scales 1,10,100 --output benchmarks/results/dev.json
+python benchmarks/bench_helpers.py --compare benchmarks/results/release.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+
+DISTRICT = 'HY'
+
+
+def measure(function, min_time: float = 0.2, max_runs: int = 50) -> dict:
+    """Runs function until min_time has passed (at least 3 times) and returns timing statistics in seconds."""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < 3 or (time.perf_counter() - started < min_time and len(timings) < max_runs):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'median': statistics.median(timings), 'min': min(timings), 'runs': len(timings)}
+
+
+def bench_functions(directory: str) -> dict:
+    from modules import helper_functions as hlp
+    from modules import snapshot
+
+    dataset = hlp.ImportData(os.path.join(directory, 'housing_data.csv'), date_format='%Y-%m-%d')
+    _, df = dataset.parse_csv()
+    store = hlp.DistrictStore(df)
+    precomputed = hlp.Precomputed(store)
+    calc = hlp.Calculations(df, store)
+    calc_precomputed = hlp.Calculations(df, store, precomputed)
+    visualize = hlp.Visualize(df, hlp.COLOR_PALETTE, store)
+    sma = calc.sma(f'{DISTRICT}_PPSM', [3,6,12])
+    # Where synthetic.write_dataset puts the snapshot (an ImportData outside DATA_DIR would look next to the CSV)
+    snapshot_dir = os.path.join(directory, 'snapshot', 'housing_data')
+    snapshot_df = snapshot.read_snapshot(snapshot_dir)
+    assert snapshot_df is not None and snapshot_df.shape == df.shape, f'no snapshot of shape {df.shape} in {snapshot_dir}'
+
+    cases = {
+        'ImportData.parse_csv': dataset.parse_csv,
+        'snapshot.read_snapshot': lambda: snapshot.read_snapshot(snapshot_dir),
+        'DistrictStore': lambda: hlp.DistrictStore(df),
+        'Precomputed': lambda: hlp.Precomputed(store),
+        'Calculations.calculate_sma': lambda: hlp.Calculations(df.copy(deep=False), store).calculate_sma(f'{DISTRICT}_PPSM', [3,6,12]),
+        'Calculations.sma': lambda: calc.sma(f'{DISTRICT}_PPSM', [3,6,12]),
+        'Calculations.sma (precomputed)': lambda: calc_precomputed.sma(f'{DISTRICT}_PPSM', [3,6,12]),
+        'Calculations.summary': lambda: calc.summary(DISTRICT, [3,6,12]),
+        'Calculations.summary (precomputed)': lambda: calc_precomputed.summary(DISTRICT, [3,6,12]),
+        'Calculations.calculate_monthly_distribution': lambda: calc.calculate_monthly_distribution(f'{DISTRICT}_NOS'),
+        'Visualize.draw_scatter_plots': lambda: visualize.draw_scatter_plots(list(sma.columns[1:]), 'lines', sma),
+        'Visualize.draw_box_subplots': lambda: visualize.draw_box_subplots(DISTRICT),
+        'Visualize.draw_box_subplots (quartiles)': lambda: visualize.draw_box_subplots(DISTRICT, quartiles=True),
+        'Visualize.draw_horizontal_bar': lambda: visualize.draw_horizontal_bar(DISTRICT, hlp.COLOR_PALETTE[5]),
+        'Visualize.draw_bar': lambda: visualize.draw_bar(DISTRICT),
+        'draw_multiple_graphs': lambda: hlp.draw_multiple_graphs(df, [f'{DISTRICT}_PPSM{rooms}' for rooms in hlp.ROOMS]),
+    }
+    results = {}
+    for name, function in cases.items():
+        results[name] = measure(function)
+        print(f'  {name:<45} {results[name]["median"] * 1000:10.2f} ms')
+    return results
+
+
+def render_page() -> dict:
+    """Headless render of the Data Analysis page; runs in a subprocess pointed at the synthetic data."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, 'pages', '2_Data Analysis.py'), default_timeout=600)
+    start = time.perf_counter()
+    app.run()
+    results = {'page: first render': {'median': time.perf_counter() - start, 'min': time.perf_counter() - start, 'runs': 1}}
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    switches = []
+    for district in list(app.sidebar.selectbox[0].options)[1:]:
+        start = time.perf_counter()
+        app.sidebar.selectbox[0].select(district).run()
+        switches.append(time.perf_counter() - start)
+    results['page: district switch (cold)'] = {'median': statistics.median(switches), 'min': min(switches), 'runs': len(switches)}
+    results['page: rerun (warm)'] = measure(app.run, max_runs=10)
+    return results
+
+
+def bench_page(directory: str) -> dict:
+    env = dict(os.environ, IN_MALMOE_DATA_DIR=directory, IN_MALMOE_LAZY_SECTIONS='0')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--render-page'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    results = json.loads(output.strip().splitlines()[-1])
+    for name, result in results.items():
+        print(f'  {name:<45} {result["median"] * 1000:10.2f} ms')
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    regressed = False
+    print(f'\nCompared with {baseline["meta"].get("label", "baseline")} (threshold x{threshold}):')
+    for scale, cases in results['results'].items():
+        for name, result in cases.items():
+            previous = baseline['results'].get(scale, {}).get(name)
+            if previous is None:
+                continue
+            ratio = result['median'] / previous['median']
+            if ratio > threshold:
+                regressed = True
+                print(f'  REGRESSION {scale:>6} {name:<45} x{ratio:.2f}')
+    if not regressed:
+        print('  no regressions')
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1,10,100,1000')
+    parser.add_argument('--output', help='result file, defaults to benchmarks/results/<label>.json')
+    parser.add_argument('--label', default=time.strftime('%Y%m%d-%H%M%S'))
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    parser.add_argument('--skip-page', action='store_true', help='only benchmark the helper functions')
+    parser.add_argument('--render-page', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render_page:
+        print(json.dumps(render_page()))
+        return 0
+
+    results = {
+        'meta': {'label': args.label, 'python': platform.python_version(), 'machine': platform.platform()},
+        'results': {},
+    }
+    for scale in (int(scale) for scale in args.scales.split(',')):
+        with tempfile.TemporaryDirectory(prefix=f'in-malmoe-{scale}x-') as directory:
+            synthetic.write_dataset(scale, directory)
+            print(f'{scale}x')
+            scale_results = bench_functions(directory)
+            if not args.skip_page:
+                scale_results.update(bench_page(directory))
+            results['results'][f'{scale}x'] = scale_results
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f'{args.label}.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            return 1 if compare(results, json.load(file), args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
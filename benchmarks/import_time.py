@@ -0,0 +1,77 @@
+"""
+Import-time budget for the modules every page imports on startup.
+
+Imports each module in a fresh interpreter under `python -X importtime`, after
+streamlit, pandas and numpy (which the pages need anyway), and fails if the median
+cumulative import time goes over its budget or if a deferred heavy dependency is
+imported eagerly again.
+
+Usage:
+python benchmarks/import_time.py [--runs 7] [--scale 1.0]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Median cumulative import time in milliseconds
+BUDGETS_MS = {
+    'modules.helper_functions': 40,
+    'modules.district_figures': 50,
+}
+
+# Imported on first use by the draw functions, never at module load
+DEFERRED_MODULES = ['plotly.express', 'plotly.subplots', 'streamlit_extras']
+
+PRELOADED = 'import streamlit, pandas, numpy'
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def cumulative_import_ms(module: str) -> float:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'{PRELOADED}; import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # The module itself is the top-level (least indented) entry with its name
+        if match and match[4] == module and len(match[3]) == 1:
+            return int(match[2]) / 1000
+    return 0.0
+
+
+def eagerly_imported(module: str) -> list[str]:
+    check = (f'import sys; {PRELOADED}; before = set(sys.modules); import {module}; '
+             f'print("\\n".join(set(sys.modules) - before))')
+    result = subprocess.run([sys.executable, '-c', check], cwd=ROOT, capture_output=True, text=True, check=True)
+    loaded = result.stdout.split()
+    return sorted({name for name in DEFERRED_MODULES for m in loaded if m == name or m.startswith(name + '.')})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply all budgets, e.g. on slow CI machines')
+    args = parser.parse_args()
+
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        cumulative_import_ms(module)  # warm the bytecode cache
+        median = statistics.median(cumulative_import_ms(module) for _ in range(args.runs))
+        limit = budget * args.scale
+        status = 'ok' if median <= limit else 'OVER BUDGET'
+        print(f'{module:<28} {median:7.1f} ms  (budget {limit:.0f} ms)  {status}')
+        failed |= median > limit
+
+        eager = eagerly_imported(module)
+        if eager:
+            print(f'{module:<28} imports deferred modules at load: {", ".join(eager)}')
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
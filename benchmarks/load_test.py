@@ -0,0 +1,213 @@
+"""
+Concurrent-session load test of Home.py and the Data Analysis page.
+
+Runs N simulated sessions spread over P worker processes. Each session opens both
+pages headlessly with Streamlit's AppTest and then replays random interactions:
+switching districts, ticking the sidebar checkboxes, opening lazy sections and
+returning to Home. Reports rerun latency percentiles per interaction, throughput
+and per-process memory.
+
+Within one worker process the sessions share every process-wide cache, like sessions
+on one Streamlit server. AppTest is not thread-safe, so reruns inside a process are
+serialized with a lock, much like script threads contending for the GIL on a real
+server; "latency" includes that queueing, "service" is the rerun alone.
+
+Usage:
+python benchmarks/load_test.py --sessions 16 --processes 2 --duration 30
+python benchmarks/load_test.py --sessions 8 --scale 100 --output /tmp/load.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+HOME = os.path.join(ROOT, 'Home.py')
+DATA_ANALYSIS = os.path.join(ROOT, 'pages', '2_Data Analysis.py')
+
+# Relative frequency of the replayed interactions. The map is opt-in (--with-map): the
+# checkbox stays ticked, so every later rerun of the session would include the map.
+ACTIONS = {
+    'select_district': 10,
+    'toggle_section': 3,
+    'toggle_abbreviation_table': 2,
+    'toggle_map': 0,
+    'rerun_home': 2,
+}
+
+
+def _rss() -> dict:
+    """Current and peak resident set size of this process in MiB, from /proc."""
+    memory = {}
+    try:
+        with open('/proc/self/status', encoding='utf-8') as file:
+            for line in file:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key = 'rss_mib' if line.startswith('VmRSS') else 'peak_rss_mib'
+                    memory[key] = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        memory['peak_rss_mib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return memory
+
+
+class Session:
+    def __init__(self, lock: threading.Lock, rng: random.Random, records: list, actions: dict):
+        from streamlit.testing.v1 import AppTest
+
+        self.lock = lock
+        self.rng = rng
+        self.records = records
+        self.actions = actions
+        self.home = AppTest.from_file(HOME, default_timeout=120)
+        self.page = AppTest.from_file(DATA_ANALYSIS, default_timeout=120)
+
+    def _run(self, action: str, app, interact=None):
+        queued = time.perf_counter()
+        with self.lock:
+            start = time.perf_counter()
+            if interact is not None:
+                interact(app)
+            app.run()
+            end = time.perf_counter()
+        self.records.append({
+            'action': action,
+            'latency': end - queued,
+            'service': end - start,
+            'error': app.exception[0].message if app.exception else None,
+        })
+
+    def open(self):
+        self._run('open_home', self.home)
+        self._run('open_data_analysis', self.page)
+
+    def step(self):
+        action = self.rng.choices(list(self.actions), weights=list(self.actions.values()))[0]
+        if action == 'select_district':
+            selectbox = self.page.sidebar.selectbox[0]
+            district = self.rng.choice([option for option in selectbox.options if option != selectbox.value])
+            self._run(action, self.page, lambda app: app.sidebar.selectbox[0].select(district))
+        elif action == 'toggle_section' and len(self.page.toggle):
+            i = self.rng.randrange(len(self.page.toggle))
+            self._run(action, self.page, lambda app: app.toggle[i].set_value(not app.toggle[i].value))
+        elif action in ('toggle_abbreviation_table', 'toggle_map'):
+            label = 'Show Abbreviation Table' if action == 'toggle_abbreviation_table' else 'Show Map'
+            def tick(app):
+                checkbox = next(checkbox for checkbox in app.sidebar.checkbox if checkbox.label == label)
+                checkbox.set_value(not checkbox.value)
+            self._run(action, self.page, tick)
+        else:
+            self._run('rerun_home', self.home)
+
+
+def run_worker(worker: int, sessions: int, duration: float, think_time: float, seed: int, actions: dict) -> dict:
+    """Runs `sessions` simulated sessions on threads of this process for `duration` seconds."""
+    lock = threading.Lock()
+    records = []
+    deadline = time.perf_counter() + duration
+
+    def simulate(i: int):
+        rng = random.Random(seed * 1000 + worker * 100 + i)
+        session = Session(lock, rng, records, actions)
+        session.open()
+        while time.perf_counter() < deadline:
+            session.step()
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=simulate, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'worker': worker, 'pid': os.getpid(), 'sessions': sessions,
+            'elapsed': time.perf_counter() - start, 'records': records, **_rss()}
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(workers: list[dict], elapsed: float) -> dict:
+    records = [record for worker in workers for record in worker['records']]
+    by_action = {}
+    for record in records:
+        by_action.setdefault(record['action'], []).append(record)
+
+    summary = {'reruns': len(records), 'elapsed_s': elapsed, 'throughput_rps': len(records) / elapsed, 'actions': {}, 'processes': []}
+    print(f'\n{"action":<28}{"count":>7}{"errors":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"service ms":>12}')
+    for action, action_records in sorted(by_action.items()):
+        latencies = [record['latency'] for record in action_records]
+        row = {
+            'count': len(action_records),
+            'errors': sum(record['error'] is not None for record in action_records),
+            'p50_ms': percentile(latencies, 0.5) * 1000,
+            'p90_ms': percentile(latencies, 0.9) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'service_mean_ms': statistics.mean(record['service'] for record in action_records) * 1000,
+        }
+        summary['actions'][action] = row
+        print(f'{action:<28}{row["count"]:>7}{row["errors"]:>8}{row["p50_ms"]:>10.1f}{row["p90_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["service_mean_ms"]:>12.1f}')
+
+    print(f'\n{len(records)} reruns in {elapsed:.1f}s -> {summary["throughput_rps"]:.1f} reruns/s')
+    for worker in workers:
+        process = {key: worker.get(key) for key in ('worker', 'pid', 'sessions', 'rss_mib', 'peak_rss_mib')}
+        summary['processes'].append(process)
+        print(f'process {worker["pid"]}: {worker["sessions"]} sessions, RSS {worker.get("rss_mib", float("nan")):.0f} MiB (peak {worker.get("peak_rss_mib", float("nan")):.0f} MiB)')
+
+    errors = sorted({record['error'] for record in records if record['error']})
+    for error in errors[:5]:
+        print(f'error: {error}')
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=8, help='simulated concurrent sessions in total')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes the sessions are spread over')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds of interactions per session after opening the pages')
+    parser.add_argument('--think-time', type=float, default=0.0, help='mean pause in seconds between interactions')
+    parser.add_argument('--scale', type=int, help='run against a synthetic dataset of this scale (see benchmarks/synthetic.py)')
+    parser.add_argument('--with-map', action='store_true', help='also tick the sidebar map checkbox')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the summary as JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='in-malmoe-load-') as directory:
+        if args.scale:
+            import synthetic
+            synthetic.write_dataset(args.scale, directory)
+            os.environ['IN_MALMOE_DATA_DIR'] = directory
+
+        actions = dict(ACTIONS, toggle_map=1) if args.with_map else ACTIONS
+        per_process = math.ceil(args.sessions / args.processes)
+        start = time.perf_counter()
+        with ProcessPoolExecutor(args.processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(run_worker, worker, min(per_process, args.sessions - worker * per_process), args.duration, args.think_time, args.seed, actions)
+                for worker in range(args.processes) if args.sessions - worker * per_process > 0
+            ]
+            workers = [future.result() for future in futures]
+        summary = report(workers, time.perf_counter() - start)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
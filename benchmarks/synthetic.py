@@ -0,0 +1,124 @@
+"""
+Synthetic datasets shaped like housing_data.csv for benchmarks and load tests.
+
+Scale grows along both axes: longer and finer histories (monthly, then daily rows)
+and more districts and room-count classes. The real district prefixes are always
+present, so the pages render against the synthetic data unchanged.
+
+Also writes raw sale records for modules/transactions.py (write_transactions).
+
+Usage:
+python benchmarks/synthetic.py 100 /tmp/in-malmoe-100x
+IN_MALMOE_DATA_DIR=/tmp/in-malmoe-100x streamlit run Home.py
+"""
+import hashlib
+import itertools
+import os
+import shutil
+import string
+import sys
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules import snapshot  # noqa: E402
+from modules.transactions import CITY  # noqa: E402
+
+REAL_DISTRICTS = ['CE', 'C', 'FO', 'HY', 'KB', 'LB', 'RGH', 'SI', 'VI', 'MMA']
+REAL_ROOMS = ['1R', '2R', '3R', '4PR']
+
+# scale -> (pandas frequency, number of rows, number of districts, room classes)
+SCALES = {
+    1: ('MS', 48, 10, REAL_ROOMS),
+    10: ('MS', 160, 30, REAL_ROOMS),
+    100: ('D', 1200, 40, REAL_ROOMS),
+    1000: ('D', 4800, 80, REAL_ROOMS + ['5R', '6PR']),
+}
+
+
+def district_keys(count: int) -> list[str]:
+    extra = (''.join(letters) for letters in itertools.product(string.ascii_uppercase, repeat=3))
+    keys = list(REAL_DISTRICTS)
+    for key in extra:
+        if len(keys) >= count:
+            break
+        keys.append(f'X{key}')
+    return keys[:count]
+
+
+def make_housing_frame(scale: int, seed: int = 0) -> pd.DataFrame:
+    """Random-walk prices and Poisson sales counts in the wide housing_data.csv layout."""
+    frequency, rows, districts, rooms = SCALES[scale]
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2000-01-01', periods=rows, freq=frequency)
+    data = {'DATE': dates}
+    for district in district_keys(districts):
+        level = rng.uniform(12000, 40000)
+        base = level * np.exp(np.cumsum(rng.normal(0.002, 0.02, rows)))
+        data[f'{district}_PPSM'] = np.round(base, 2)
+        for room in rooms:
+            data[f'{district}_PPSM{room}'] = np.round(base * rng.uniform(0.85, 1.15) * np.exp(rng.normal(0, 0.03, rows)), 2)
+        data[f'{district}_NOS'] = rng.poisson(60 if frequency == 'MS' else 2, rows)
+    return pd.DataFrame(data)
+
+
+def write_dataset(scale: int, directory: str, seed: int = 0) -> str:
+    """
+    Writes a synthetic housing_data.csv plus its compiled snapshot into directory, next to
+    copies of the real inflation and REI datasets and district geometry. Returns the housing CSV path.
+    """
+    os.makedirs(directory, exist_ok=True)
+    df = make_housing_frame(scale, seed)
+    path = os.path.join(directory, 'housing_data.csv')
+    # Daily rows do not fit the MM-YYYY format of the real file, so dates are written in
+    # ISO format and the app reads the compiled snapshot instead of parsing the CSV.
+    df.to_csv(path, sep=';', decimal=',', index=False, date_format='%Y-%m-%d')
+    with open(path, 'rb') as file:
+        version = hashlib.sha1(file.read()).hexdigest()
+    snapshot.write_snapshot(df, os.path.join(directory, 'snapshot', 'housing_data'), version)
+    for file_name in ('inflation_rate.csv', 'real_estate_index.csv', 'malmoe_districts.geojson'):
+        shutil.copy(os.path.join(ROOT, file_name), os.path.join(directory, file_name))
+    return path
+
+
+def write_transactions(rows: int, directory: str, shards: int = 4, seed: int = 0, chunk_rows: int = 1_000_000) -> list[str]:
+    """
+    Writes `rows` random sale records (date, district, rooms, price, area) for the real
+    districts since 2018, split over `shards` CSV files and generated chunk by chunk.
+    There are none for the all-Malmö CITY series, which transactions.py derives itself.
+    Returns the file paths; see modules/transactions.py.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    districts = np.array([district for district in REAL_DISTRICTS if district != CITY])
+    levels = rng.uniform(15000, 40000, len(districts))
+    days = pd.date_range('2018-12-01', '2022-11-30', freq='D').to_numpy()
+    paths = []
+    for shard in range(shards):
+        path = os.path.join(directory, f'sales_{shard:03d}.csv')
+        remaining = rows // shards + (shard < rows % shards)
+        header = True
+        while remaining > 0:
+            n = min(chunk_rows, remaining)
+            district = rng.integers(0, len(districts), n)
+            rooms = rng.choice([1, 1.5, 2, 2.5, 3, 4, 5, 6], n)
+            area = np.round(rng.normal(25, 4, n) * rooms + 10, 1).clip(12)
+            ppsm = levels[district] * np.exp(rng.normal(0, 0.15, n))
+            pd.DataFrame({
+                'date': days[rng.integers(0, len(days), n)],
+                'district': districts[district],
+                'rooms': rooms,
+                'price': np.round(ppsm * area, -3),
+                'area': area,
+            }).to_csv(path, mode='w' if header else 'a', header=header, index=False, date_format='%Y-%m-%d')
+            header = False
+            remaining -= n
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    scale, directory = int(sys.argv[1]), sys.argv[2]
+    print(write_dataset(scale, directory))
@@ -0,0 +1,275 @@
+"""
+Read-only HTTP API serving the housing metrics the dashboard shows.
+
+Shares the app's data layer: series come from the DistrictStore, SMA windows and
+summary figures from the Precomputed tables and forecasts from the Forecasts of the
+current data version, so a request is a lookup rather than a pandas computation. Responses are JSON, or Arrow IPC
+streams with ?format=arrow (or Accept: application/vnd.apache.arrow.stream).
+
+Every response carries an ETag derived from the data version and the request, so
+If-None-Match is answered with 304 before anything is built, and built bodies (plain
+and gzipped) are kept in a bounded cache until the data changes.
+
+Endpoints:
+GET /v1/districts                                    every series: district, metric, rooms
+GET /v1/series/HY?metric=PPSM&rooms=2R&sma=3,6,12    one series with SMA windows
+GET /v1/metric/PPSM?rooms=                           one metric for every district
+GET /v1/summary/HY?months=3,6,12                     mean, sales and price development
+GET /v1/forecast/HY?metric=NOS                       forecast and prediction interval
+
+Usage:
+python -m modules.api --port 8080
+curl -H 'Accept-Encoding: gzip' --compressed http://127.0.0.1:8080/v1/series/HY
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from modules import helper_functions as hlp
+from modules.forecast import Forecasts
+from modules.instrumentation import span
+from modules.precompute import Precomputed, rolling_means
+from modules.store import ALL_ROOMS, DistrictStore
+
+PREFIX = '/v1/'
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+JSON_TYPE = 'application/json'
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+
+
+class NotFound(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _ints(values: str, name: str) -> list[int]:
+    try:
+        result = [int(value) for value in values.split(',') if value]
+    except ValueError:
+        raise BadRequest(f'{name} must be a comma-separated list of integers')
+    if any(value < 1 for value in result):
+        raise BadRequest(f'{name} must be positive')
+    return result
+
+
+def _dates(dates: np.ndarray) -> list[str]:
+    return list(np.datetime_as_string(dates, unit='D'))
+
+
+def districts(dataset: hlp.ImportData, query: dict) -> pd.DataFrame:
+    store = DistrictStore.from_dataset(dataset)
+    return pd.DataFrame({
+        'district': [key[0] for key in store.keys],
+        'name': [hlp.DISTRICT_NAMES.get(key[0], key[0]) for key in store.keys],
+        'metric': [key[1] for key in store.keys],
+        'rooms': [key[2] for key in store.keys],
+        'first': _dates(store.dates[:1]) * len(store.keys),
+        'last': _dates(store.dates[-1:]) * len(store.keys),
+    })
+
+
+def series(dataset: hlp.ImportData, query: dict, district: str) -> pd.DataFrame:
+    precomputed = Precomputed.from_dataset(dataset)
+    store = precomputed.store
+    metric, rooms = query.get('metric', 'PPSM'), query.get('rooms', ALL_ROOMS)
+    key = (district, metric, rooms)
+    if key not in store.index:
+        raise NotFound(f'no series {district} {metric} {rooms}'.rstrip())
+    data = {'DATE': _dates(store.dates), metric: store.series(*key)}
+    for window in _ints(query.get('sma', ''), 'sma'):
+        if window in precomputed.windows:
+            data[f'SMA_{window}'] = precomputed.sma_series(*key, window)
+        else:
+            data[f'SMA_{window}'] = rolling_means(store.series(*key)[None, :], [window])[window][0]
+    return pd.DataFrame(data)
+
+
+def metric(dataset: hlp.ImportData, query: dict, name: str) -> pd.DataFrame:
+    store = DistrictStore.from_dataset(dataset)
+    rooms = query.get('rooms', ALL_ROOMS)
+    if (name, rooms) not in store.metric_slices:
+        raise NotFound(f'no metric {name} {rooms}'.rstrip())
+    names, values = store.metric(name, rooms)
+    return pd.DataFrame({'DATE': _dates(store.dates), **dict(zip(names, values))})
+
+
+def summary(dataset: hlp.ImportData, query: dict, district: str) -> pd.DataFrame:
+    precomputed = Precomputed.from_dataset(dataset)
+    if (district, 'PPSM', ALL_ROOMS) not in precomputed.store.index:
+        raise NotFound(f'no district {district}')
+    months = _ints(query.get('months', ','.join(map(str, precomputed.months))), 'months')
+    # The price development compares with the month before the period, which has to exist
+    if any(value >= len(precomputed.store.dates) for value in months):
+        raise BadRequest(f'months must be less than {len(precomputed.store.dates)}')
+    calc = hlp.Calculations(None, precomputed.store, precomputed)
+    rows = calc.summary(district, months)
+    return pd.DataFrame(rows, columns=['period', 'mean_ppsm', 'sales', 'price_development_%']).assign(months=months)
+
+
+def forecast(dataset: hlp.ImportData, query: dict, district: str) -> pd.DataFrame:
+    key = (district, query.get('metric', 'PPSM'), query.get('rooms', ALL_ROOMS))
+    forecasts = Forecasts.from_dataset(dataset)
+    if key not in forecasts.index:
+        raise NotFound(f'no forecast for {" ".join(key)}'.rstrip())
+    dates, mean, lower, upper = forecasts.forecast(*key)
+    return pd.DataFrame({'DATE': _dates(dates), 'forecast': mean, 'lower': lower, 'upper': upper})
+
+
+ROUTES = {'districts': districts, 'series': series, 'metric': metric, 'summary': summary, 'forecast': forecast}
+
+
+def encode(df: pd.DataFrame, version: str, arrow: bool) -> bytes:
+    """Arrow IPC stream or column-oriented JSON of an endpoint's frame, tagged with the data version."""
+    if arrow:
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata({'version': version})
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    # to_json writes NaN as null
+    return b'{"version":"%s","columns":%s,"data":%s}' % (
+        version.encode(), json.dumps(list(df.columns), separators=(',', ':')).encode(), df.to_json(orient='values').encode())
+
+
+class ResponseCache:
+    """Bounded LRU of built response bodies keyed by (version, request)."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body) -> None:
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, dataset: hlp.ImportData = hlp.HOUSING_DATA):
+        super().__init__((host, port), ApiHandler)
+        self.dataset = dataset
+        self.cache = ResponseCache()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{PREFIX.rstrip("/")}'
+
+    def start(self) -> 'ApiServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body leave in one segment instead of waiting on the client's delayed ACK
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._send(status, json.dumps({'error': message}).encode(), {'Content-Type': JSON_TYPE})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path[len(PREFIX):].strip('/').split('/') if url.path.startswith(PREFIX) else []
+        route = ROUTES.get(parts[0]) if parts else None
+        if route is None or len(parts) != (1 if parts[0] == 'districts' else 2):
+            return self._error(404, 'unknown endpoint')
+        query = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        arrow = query.pop('format', None) == 'arrow' or ARROW_TYPE in self.headers.get('Accept', '')
+
+        # Every request sees one version, even if a refresh publishes the next one meanwhile
+        hlp.ImportData.pin_versions()
+        version = self.server.dataset.version
+        request = (tuple(parts), tuple(sorted(query.items())), arrow)
+        etag = f'"{hashlib.sha1(repr((version, request)).encode()).hexdigest()[:20]}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding', 'X-Data-Version': version}
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            return self._send(304, headers=headers)
+
+        key = (version, request)
+        body = self.server.cache.get(key)
+        if body is None:
+            try:
+                with span(f'api.{parts[0]}'):
+                    result = route(self.server.dataset, query, *parts[1:])
+                    plain = encode(result, version, arrow)
+            except NotFound as error:
+                return self._error(404, str(error))
+            except BadRequest as error:
+                return self._error(400, str(error))
+            except Exception:
+                traceback.print_exc()
+                return self._error(500, 'internal error')
+            body = (plain, gzip.compress(plain, 6) if len(plain) >= GZIP_MIN_BYTES else None)
+            self.server.cache.put(key, body)
+
+        plain, compressed = body
+        headers['Content-Type'] = ARROW_TYPE if arrow else JSON_TYPE
+        if compressed is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            headers['Content-Encoding'] = 'gzip'
+            return self._send(200, compressed, headers)
+        self._send(200, plain, headers)
+
+    do_HEAD = do_GET
+
+
+def main() -> int:
+    from modules.refresh import REFRESHER
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    server = ApiServer(args.host, args.port)
+    # Same background refresh as the app when IN_MALMOE_REFRESH_INTERVAL is set
+    REFRESHER.start()
+    print(f'Serving {server.dataset.path} on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
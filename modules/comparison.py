@@ -0,0 +1,228 @@
+"""
+Cross-district and cross-region analytics: rankings, correlation matrices and lead/lag.
+
+All pairwise statistics are computed for whole sets of series at once with matrix
+products over missing-value masks (pairwise-complete Pearson correlation), so the
+cost grows with the number of series without Python loops over pairs. Lead/lag scans
+one correlation matrix per lag; when the scan is large the lags are spread over a
+process pool that lives as long as the scan. Results are cached per (housing, REI) dataset version.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modules.instrumentation import span
+from modules.precompute import Precomputed
+from modules.store import ALL_ROOMS
+
+# Multiply-adds of a lead/lag scan above which it is split over processes
+POOL_THRESHOLD = 50_000_000
+MIN_PERIODS = 6
+
+
+def returns(values: np.ndarray) -> np.ndarray:
+    """Period-over-period log returns of every row; NaN where either value is missing."""
+    values = np.asarray(values, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.diff(np.log(np.where(values > 0, values, np.nan)), axis=1)
+    return result
+
+
+def pairwise_corr(a: np.ndarray, b: np.ndarray, min_periods: int = MIN_PERIODS) -> np.ndarray:
+    """
+    Pearson correlation of every row of a (n x T) with every row of b (m x T), over the
+    periods where both are present. NaN where fewer than min_periods periods overlap.
+    """
+    # float64 throughout: the sums below cancel badly in float32
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    mask_a, mask_b = ~np.isnan(a), ~np.isnan(b)
+    xa, xb = np.where(mask_a, a, 0.0), np.where(mask_b, b, 0.0)
+    ma, mb = mask_a.astype(float), mask_b.astype(float)
+    n = ma @ mb.T
+    sum_a, sum_b = xa @ mb.T, ma @ xb.T
+    sq_a, sq_b = (xa * xa) @ mb.T, ma @ (xb * xb).T
+    products = xa @ xb.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * products - sum_a * sum_b
+        var = (n * sq_a - sum_a ** 2) * (n * sq_b - sum_b ** 2)
+        corr = cov / np.sqrt(var)
+    corr[(n < min_periods) | ~np.isfinite(corr)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def _lag_block(a: np.ndarray, b: np.ndarray, lags: list[int], min_periods: int) -> np.ndarray:
+    """Correlations of a[t] with b[t + lag] for each lag, as a (lags, n, m) array."""
+    length = a.shape[1]
+    blocks = []
+    for lag in lags:
+        if lag >= 0:
+            blocks.append(pairwise_corr(a[:, :length - lag], b[:, lag:], min_periods))
+        else:
+            blocks.append(pairwise_corr(a[:, -lag:], b[:, :length + lag], min_periods))
+    return np.stack(blocks)
+
+
+def lagged_corr(a: np.ndarray, b: np.ndarray, max_lag: int, min_periods: int = MIN_PERIODS, workers: int = None) -> np.ndarray:
+    """
+    Correlations of a[t] with b[t + lag] for lag in -max_lag..max_lag, as a
+    (2 * max_lag + 1, n, m) array. A positive best lag means a leads b.
+    """
+    lags = list(range(-max_lag, max_lag + 1))
+    workers = min(os.cpu_count() if workers is None else workers, len(lags))
+    work = a.shape[0] * b.shape[0] * a.shape[1] * len(lags)
+    if workers <= 1 or work < POOL_THRESHOLD:
+        return _lag_block(a, b, lags, min_periods)
+    chunks = [lags[i::workers] for i in range(workers)]
+    # Spawned, as the scan may run on a Streamlit script thread, and shut down with the
+    # scan, so no worker processes outlive it inside the server
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(_lag_block, [a] * len(chunks), [b] * len(chunks), chunks, [min_periods] * len(chunks)))
+    by_lag = {lag: block for chunk, blocks in zip(chunks, results) for lag, block in zip(chunk, blocks)}
+    return np.stack([by_lag[lag] for lag in lags])
+
+
+def best_lags(corr: np.ndarray, max_lag: int, row_names: list[str], column_names: list[str], same: bool = False) -> pd.DataFrame:
+    """Long table of the lag with the strongest correlation for every pair, strongest first."""
+    filled = np.where(np.isnan(corr), -np.inf, np.abs(corr))
+    best = filled.argmax(axis=0)
+    rows, columns = np.indices(best.shape)
+    strongest = corr[best, rows, columns]
+    table = pd.DataFrame({
+        'leader': np.array(row_names)[rows.ravel()],
+        'follower': np.array(column_names)[columns.ravel()],
+        'lag': best.ravel() - max_lag,
+        'correlation': strongest.ravel(),
+        'same_period': corr[max_lag].ravel(),
+    })
+    if same:
+        table = table[rows.ravel() < columns.ravel()]
+    table = table.dropna(subset=['correlation'])
+    # Report every pair with the leader first
+    flip = table['lag'] < 0
+    table.loc[flip, ['leader', 'follower']] = table.loc[flip, ['follower', 'leader']].to_numpy()
+    table.loc[flip, 'lag'] = -table.loc[flip, 'lag']
+    return table.reindex(table['correlation'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+def annual(dates: np.ndarray, values: np.ndarray, min_months: int = 12):
+    """Calendar-year means of every row of a monthly array; NaN for years with fewer than min_months values."""
+    years = pd.DatetimeIndex(dates).year.to_numpy()
+    unique = np.unique(years)
+    one_hot = (years[None, :] == unique[:, None]).astype(float)
+    valid = ~np.isnan(values)
+    sums = np.where(valid, values, 0.0) @ one_hot.T
+    counts = valid.astype(float) @ one_hot.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return unique, np.where(counts >= min_months, sums / counts, np.nan)
+
+
+class Comparison:
+    """
+    Comparison tables over one version of the housing data and the real estate index.
+
+    Every result is computed once per set of arguments and kept with the instance, and
+    instances are cached per dataset version, so every session shares them.
+
+    Example:
+    comparison = Comparison.from_datasets(hlp.HOUSING_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+    comparison.correlations('PPSM')
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, precomputed: Precomputed, rei: pd.DataFrame = None):
+        self.precomputed = precomputed
+        self.store = precomputed.store
+        self.rei = rei
+        self._results = {}
+        self._results_lock = threading.Lock()
+
+    @classmethod
+    def from_datasets(cls, housing, rei=None) -> 'Comparison':
+        key = (housing.path, housing.version, rei.version if rei is not None else None)
+        comparison = cls._cache.get(key)
+        if comparison is None:
+            with cls._lock:
+                comparison = cls._cache.get(key)
+                if comparison is None:
+                    comparison = cls(Precomputed.from_dataset(housing), rei.load() if rei is not None else None)
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != housing.path}
+                    cls._cache[key] = comparison
+        return comparison
+
+    def _memo(self, key: tuple, compute):
+        result = self._results.get(key)
+        if result is None:
+            with span(f'comparison.{key[0]}'):
+                result = compute()
+            with self._results_lock:
+                self._results[key] = result
+        return result
+
+    def series(self, metric: str = 'PPSM', rooms: str = ALL_ROOMS, districts: list[str] = None):
+        """(districts, 2D array) of one metric, optionally limited to some districts."""
+        names, values = self.store.metric(metric, rooms)
+        if districts is None:
+            return names, values
+        rows = [names.index(district) for district in districts if district in names]
+        return [names[row] for row in rows], values[rows]
+
+    def ranking(self, metric: str = 'PPSM', rooms: str = ALL_ROOMS) -> pd.DataFrame:
+        """Latest value, trailing means and changes per district, highest latest value first."""
+        def compute():
+            names, values = self.series(metric, rooms)
+            rows = [self.store.index[(name, metric, rooms)] for name in names]
+            values = values.astype(float)
+            last = values[:, -1]
+            table = pd.DataFrame({'district': names, 'latest': last})
+            for j, months in enumerate(self.precomputed.months):
+                table[f'mean_{months}m'] = self.precomputed.means[j, rows]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    table[f'change_{months}m_%'] = np.round((last / values[:, -months - 1] - 1) * 100, 1)
+            table['rank'] = table['latest'].rank(ascending=False, method='min').astype('Int64')
+            return table.sort_values('latest', ascending=False).reset_index(drop=True)
+        return self._memo(('ranking', metric, rooms), compute)
+
+    def correlations(self, metric: str = 'PPSM', rooms: str = ALL_ROOMS, on_returns: bool = True) -> pd.DataFrame:
+        """District x district correlation of monthly returns (or levels)."""
+        def compute():
+            names, values = self.series(metric, rooms)
+            data = returns(values) if on_returns else values
+            return pd.DataFrame(pairwise_corr(data, data), index=names, columns=names)
+        return self._memo(('correlations', metric, rooms, on_returns), compute)
+
+    def lead_lag(self, metric: str = 'PPSM', rooms: str = ALL_ROOMS, max_lag: int = 6) -> pd.DataFrame:
+        """Strongest lagged correlation of monthly returns for every pair of districts."""
+        def compute():
+            names, values = self.series(metric, rooms)
+            data = returns(values)
+            return best_lags(lagged_corr(data, data, max_lag), max_lag, names, names, same=True)
+        return self._memo(('lead_lag', metric, rooms, max_lag), compute)
+
+    def regions(self, metric: str = 'PPSM', rooms: str = ALL_ROOMS) -> tuple:
+        """
+        Districts against the REI regions on the calendar years both cover: growth over
+        those years per series, and the correlation of annual changes (NaN while fewer
+        than three changes overlap). Returns (growth table, district x region correlations).
+        """
+        def compute():
+            names, values = self.series(metric, rooms)
+            years, district_years = annual(self.store.dates, values)
+            rei = self.rei.assign(YEAR=pd.DatetimeIndex(self.rei['DATE']).year).set_index('YEAR').drop(columns='DATE')
+            common = [year for year in years if year in rei.index and not np.isnan(district_years[:, list(years).index(year)]).all()]
+            district_common = district_years[:, [list(years).index(year) for year in common]]
+            region_common = rei.loc[common].to_numpy(dtype=float).T
+
+            growth = pd.DataFrame({
+                'series': names + list(rei.columns),
+                'kind': ['district'] * len(names) + ['region'] * len(rei.columns),
+            })
+            if len(common) > 1:
+                levels = np.vstack([district_common, region_common])
+                growth[f'growth_{common[0]}_{common[-1]}_%'] = np.round((levels[:, -1] / levels[:, 0] - 1) * 100, 1)
+                growth = growth.sort_values(growth.columns[-1], ascending=False).reset_index(drop=True)
+            corr = pairwise_corr(returns(district_common), returns(region_common), min_periods=3)
+            return growth, pd.DataFrame(corr, index=names, columns=rei.columns)
+        return self._memo(('regions', metric, rooms), compute)
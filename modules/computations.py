@@ -0,0 +1,110 @@
+"""
+Reuse of page computations whose declared inputs did not change.
+
+Every chart and metric of a page is a named slot (e.g. 'data_analysis.sma') computed
+from a tuple of inputs: the data version(s), the district and the options that affect
+it. The session keeps the result of each slot's latest inputs, so a rerun triggered by
+an unrelated widget (the abbreviation table, the map, a section further down) hands
+back the same objects without recomputing, rebuilding or even deserializing them.
+Results that are worth sharing are also kept process-wide per (slot, inputs), so other
+sessions with the same inputs reuse them as well.
+
+Inputs must be hashable and cover everything the result depends on; results must not
+be modified by the caller, as they are handed out again.
+
+Example:
+sum_info = reuse('data_analysis.summary', (hlp.HOUSING_DATA.version, district_key),
+                 lambda: calc.summary(district_key, [3,6,12]))
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from modules.figure_cache import FIGURE_CACHE
+from modules.instrumentation import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+SESSION_KEY = '_computations'
+
+
+class ComputationCache:
+    """Bounded LRU of computation results shared by all sessions of a process, keyed by (slot, inputs)."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.session_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            self.misses += 1
+        with span(f'compute.{key[0]}'):
+            result = compute()
+        with self._lock:
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+
+COMPUTATIONS = ComputationCache()
+
+
+def _session_results() -> dict:
+    """{slot: (inputs, result)} of the current Streamlit session; a throwaway dict outside of one."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return {}
+    import streamlit as st
+
+    return st.session_state.setdefault(SESSION_KEY, {})
+
+
+def reuse(slot: str, inputs: tuple, compute, shared: bool = True):
+    """
+    Result of compute() for inputs, recomputed only when the slot's inputs change.
+
+    shared also keeps the result for other sessions; leave it off for results that are
+    cached elsewhere already or are cheaper to recompute than to keep.
+    """
+    results = _session_results()
+    latest = results.get(slot)
+    if latest is not None and latest[0] == inputs:
+        COMPUTATIONS.session_hits += 1
+        return latest[1]
+    if shared:
+        result = COMPUTATIONS.get_or_compute((slot, inputs), compute)
+    else:
+        with span(f'compute.{slot}'):
+            result = compute()
+    results[slot] = (inputs, result)
+    return result
+
+
+def reuse_figure(slot: str, inputs: tuple, build) -> go.Figure:
+    """
+    Figure of a slot, built through the shared FIGURE_CACHE (as JSON) and kept
+    deserialized in the session while its inputs stay the same. build must draw the
+    figure itself: a figure that is cached already, e.g. by DistrictFigures.figure,
+    goes through reuse(slot, inputs, ..., shared=False) instead, so the cache does not
+    hold it twice.
+    """
+    return reuse(slot, inputs, lambda: FIGURE_CACHE.get_or_build((slot,) + tuple(inputs), build), shared=False)
@@ -0,0 +1,99 @@
+"""
+Inflation-adjusted (real) prices from the KPI in inflation_rate.csv.
+
+inflation_rate.csv holds the 12-month change of the KPI in percent, so a price index is
+chained from it once per version, one monthly step of (1 + rate / 100) ** (1 / 12) at a
+time. The index is looked up for the housing months with a sorted date index (as of the
+latest index month, so a KPI release lagging the housing data by a month reuses the last
+known value), and every price series is divided by it in one array operation. Real
+prices are in kronor of the latest housing month; sale counts are left as they are.
+"""
+import threading
+import numpy as np
+import pandas as pd
+from modules.comparison import Comparison
+from modules.forecast import Forecasts
+from modules.instrumentation import span
+from modules.precompute import Precomputed
+from modules.store import DistrictStore, parse_column
+
+RATE_COLUMN = 'KPI'
+PRICE_METRICS = {'PPSM'}
+
+
+def price_index(df: pd.DataFrame, column: str = RATE_COLUMN):
+    """(sorted month dates, index) chained from 12-month inflation rates in percent; the first month is 1."""
+    rates = df[['DATE', column]].dropna().drop_duplicates('DATE', keep='last').sort_values('DATE')
+    steps = (1 + rates[column].to_numpy(dtype=float) / 100) ** (1 / 12)
+    index = np.cumprod(steps) / steps[0]
+    return rates['DATE'].to_numpy().astype('datetime64[ns]'), index
+
+
+def index_at(index_dates: np.ndarray, index: np.ndarray, dates) -> np.ndarray:
+    """Index value as of every date (the latest index month at or before it); NaN before the first."""
+    positions = np.searchsorted(index_dates, np.asarray(dates, dtype='datetime64[ns]'), side='right') - 1
+    return np.where(positions >= 0, index[np.clip(positions, 0, None)], np.nan)
+
+
+def deflate_frame(df: pd.DataFrame, factors: np.ndarray, columns: list[str]) -> pd.DataFrame:
+    """df with the given columns multiplied by factors (one per row); the other columns are shared, not copied."""
+    dtype = np.float32 if all(df[column].dtype.itemsize <= 4 for column in columns) else float
+    prices = (df[columns].to_numpy(dtype=float) * factors[:, None]).astype(dtype)
+    real = df.copy(deep=False)
+    real[columns] = prices
+    return real
+
+
+class RealPrices:
+    """
+    The housing data, its derived tables and the REI in real terms, for one version of
+    the housing, inflation and REI datasets. Built once per combination of versions and
+    shared by every session, so switching between real and nominal prices costs nothing.
+
+    Example:
+    real = RealPrices.from_datasets(hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+    real.store.series('HY', 'PPSM')
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, housing: pd.DataFrame, inflation: pd.DataFrame, rei: pd.DataFrame = None, column: str = RATE_COLUMN):
+        self.index_dates, self.index = price_index(inflation, column)
+        self.base = pd.Timestamp(housing['DATE'].max())
+        base_index = index_at(self.index_dates, self.index, [self.base])[0]
+        self.factors = base_index / index_at(self.index_dates, self.index, housing['DATE'])
+
+        price_columns = [name for name in housing.columns if (parse_column(name) or (None, None))[1] in PRICE_METRICS]
+        self.df = deflate_frame(housing, self.factors, price_columns)
+        self.store = DistrictStore(self.df)
+        self.precomputed = Precomputed(self.store)
+        self.forecasts = Forecasts(self.store)
+
+        self.rei = None
+        if rei is not None:
+            # The REI is annual: deflate by the mean index of each calendar year
+            years = pd.DatetimeIndex(self.index_dates).year
+            annual = pd.Series(self.index).groupby(years).mean()
+            rei_years = pd.DatetimeIndex(rei['DATE']).year
+            rei_factors = base_index / annual.reindex(rei_years).to_numpy()
+            self.rei = deflate_frame(rei, rei_factors, list(rei.columns.drop('DATE')))
+        self.comparison = Comparison(self.precomputed, self.rei)
+
+    @classmethod
+    def from_datasets(cls, housing, inflation, rei=None) -> 'RealPrices':
+        key = (housing.path, housing.version, inflation.version, rei.version if rei is not None else None)
+        prices = cls._cache.get(key)
+        if prices is None:
+            with cls._lock:
+                prices = cls._cache.get(key)
+                if prices is None:
+                    with span('data.deflate'):
+                        prices = cls(housing.load(), inflation.load(), rei.load() if rei is not None else None)
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != housing.path}
+                    cls._cache[key] = prices
+        return prices
+
+    @property
+    def label(self) -> str:
+        """e.g. 'in Nov 2022 kronor'"""
+        return f'in {self.base:%b %Y} kronor'
@@ -0,0 +1,84 @@
+import os
+import pandas as pd
+import streamlit as st
+from modules import memory
+from modules.computations import COMPUTATIONS
+from modules.figure_cache import FIGURE_CACHE
+from modules.instrumentation import INSTRUMENTATION
+from modules.refresh import REFRESHER
+
+# When set, the diagnostics view also requires ?diagnostics=<token>
+TOKEN_ENV = 'IN_MALMOE_DIAGNOSTICS_TOKEN'
+
+
+def _query_params() -> dict:
+    if hasattr(st, 'query_params'):
+        return {key: st.query_params.get_all(key) for key in st.query_params}
+    return st.experimental_get_query_params()
+
+
+def requested() -> bool:
+    """True when the Home page was opened with ?diagnostics (and the right token, if one is configured)."""
+    values = _query_params().get('diagnostics')
+    if values is None:
+        return False
+    token = os.environ.get(TOKEN_ENV)
+    return token is None or token in values
+
+
+def render():
+    """Hidden diagnostics view: per-stage latency percentiles, recent reruns and the Prometheus export."""
+    st.markdown('# Diagnostics')
+    st.caption(f'Process {os.getpid()} · {len(INSTRUMENTATION.reruns)} recent reruns')
+
+    st.subheader('Stages')
+    summary = pd.DataFrame(INSTRUMENTATION.summary())
+    if summary.empty:
+        st.info('No timings recorded in this process yet.')
+    else:
+        st.dataframe(summary.round(2), use_container_width=True, hide_index=True)
+
+    st.subheader('Recent reruns')
+    reruns = [{
+        'started': pd.Timestamp(rerun['started'], unit='s'),
+        'page': rerun['page'],
+        'session': (rerun['session'] or '')[:8],
+        'total_ms': round(rerun['total'] * 1000, 1),
+        'spans': ', '.join(f'{stage} {seconds * 1000:.1f}' for stage, seconds in rerun['spans']),
+    } for rerun in reversed(INSTRUMENTATION.reruns)]
+    st.dataframe(pd.DataFrame(reruns), use_container_width=True, hide_index=True)
+
+    st.subheader('Figure cache')
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Figures', len(FIGURE_CACHE))
+    col2.metric('Size', f'{FIGURE_CACHE.size / 1024:.0f} KiB')
+    col3.metric('Hits / misses', f'{FIGURE_CACHE.hits} / {FIGURE_CACHE.misses}')
+
+    st.subheader('Computation reuse')
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Shared results', len(COMPUTATIONS))
+    col2.metric('Session hits', COMPUTATIONS.session_hits)
+    col3.metric('Shared hits / misses', f'{COMPUTATIONS.hits} / {COMPUTATIONS.misses}')
+
+    st.subheader('Data refresh')
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Housing data version', REFRESHER.dataset.version[:12])
+    col2.metric('Last refresh', '-' if REFRESHER.last_run is None else pd.Timestamp(REFRESHER.last_run, unit='s').strftime('%Y-%m-%d %H:%M'))
+    col3.metric('Last published', (REFRESHER.last_version or '-')[:12])
+    if REFRESHER.last_error:
+        st.warning(REFRESHER.last_error)
+
+    st.subheader('Memory')
+    tables = memory.report()
+    rss = memory.rss()
+    col1, col2, col3 = st.columns(3)
+    col1.metric('Resident set size', '-' if rss is None else f'{rss / 2**20:.1f} MiB')
+    col2.metric('Tables (private / mapped)', f'{tables["private"].sum() / 1024:.0f} / {tables["mapped"].sum() / 1024:.0f} KiB')
+    col3.metric('Compact dtypes', 'on' if REFRESHER.dataset.compact else 'off')
+    tables[['private', 'mapped']] = (tables[['private', 'mapped']] / 1024).round(1)
+    st.dataframe(tables.rename(columns={'private': 'private_kib', 'mapped': 'mapped_kib'}), use_container_width=True, hide_index=True)
+
+    st.subheader('Prometheus')
+    st.download_button('Download metrics', INSTRUMENTATION.prometheus_text(), file_name='in_malmoe.prom', mime='text/plain')
+    with st.expander('Show metrics'):
+        st.code(INSTRUMENTATION.prometheus_text(), language='text')
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+from modules import helper_functions as hlp
+from modules.deflator import RealPrices
+from modules.figure_cache import FIGURE_CACHE, FigureCache
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+# Charts of the Data Analysis page, in the order they are drawn
+CHART_IDS = ['sma', 'rooms_lines', 'rooms_scatter', 'boxes', 'sales_bar', 'monthly_pie']
+# Charts drawn over time that follow the page's date range
+WINDOWED_CHART_IDS = ['sma', 'rooms_lines', 'rooms_scatter']
+# Charts that can show the forecast of their series
+FORECAST_CHART_IDS = ['sma', 'rooms_lines']
+# Charts of prices, which can be drawn in real terms
+REAL_CHART_IDS = ['sma', 'rooms_lines', 'rooms_scatter', 'boxes']
+WARM_UP_ENV = 'IN_MALMOE_WARM_UP'
+
+
+class DistrictFigures:
+    """
+    Builds the figures of the Data Analysis page and caches them per (dataset version, district, chart id).
+
+    Example:
+    fig = DISTRICT_FIGURES.figure('HY', 'sma')
+    """
+
+    def __init__(self, dataset: hlp.ImportData = hlp.HOUSING_DATA, cache: FigureCache = FIGURE_CACHE):
+        self.dataset = dataset
+        self.cache = cache
+        self._warmed_up = set()
+        self._lock = threading.Lock()
+
+    def figure(self, district_key: str, chart_id: str, window=None, forecast: bool = False, real: bool = False) -> go.Figure:
+        """
+        window is a (start, end) date range from hlp.zoom_range for the time-series charts;
+        forecast adds the forecasts of the plotted series (see modules/forecast.py);
+        real draws prices adjusted for inflation (see modules/deflator.py).
+        """
+        key = (self.dataset.version, district_key, chart_id)
+        if window is not None and chart_id in WINDOWED_CHART_IDS:
+            key += (window,)
+        else:
+            window = None
+        forecast = forecast and chart_id in FORECAST_CHART_IDS
+        if forecast:
+            key += ('forecast',)
+        real = real and chart_id in REAL_CHART_IDS
+        if real:
+            key += ('real', hlp.INFLATION_DATA.version)
+        return self.cache.get_or_build(key, lambda: self.build(district_key, chart_id, window, forecast, real))
+
+    def build(self, district_key: str, chart_id: str, window=None, forecast: bool = False, real: bool = False) -> go.Figure:
+        if real:
+            prices = RealPrices.from_datasets(self.dataset, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+            df, store, precomputed = prices.df, prices.store, prices.precomputed
+            get_forecasts = lambda: prices.forecasts
+        else:
+            df = self.dataset.load()
+            store = hlp.DistrictStore.from_dataset(self.dataset)
+            precomputed = hlp.Precomputed.from_dataset(self.dataset)
+            get_forecasts = lambda: hlp.Forecasts.from_dataset(self.dataset)
+        calc = hlp.Calculations(df, store, precomputed)
+        visualize = hlp.Visualize(df, hlp.COLOR_PALETTE, store)
+        ppsm_mean = store.series(district_key, 'PPSM').mean()
+        room_columns = [store.column(district_key, 'PPSM', rooms) for rooms in hlp.ROOMS]
+
+        if chart_id == 'sma':
+            sma = hlp.date_window(calc.sma(f"{district_key}_PPSM", [3,6,12]), window)
+            forecasts = get_forecasts().frame({f"{district_key}_PPSM": (district_key, 'PPSM', '')}) if forecast else None
+            fig = visualize.draw_scatter_plots(list(sma.columns[1:]), 'lines', sma, forecast=forecasts)
+            fig.update_layout(title='Average Price per Square Meter with Simple Moving Average (SMA)')
+        elif chart_id == 'rooms_lines':
+            forecasts = get_forecasts().frame({store.column(district_key, 'PPSM', rooms): (district_key, 'PPSM', rooms) for rooms in hlp.ROOMS}) if forecast else None
+            fig = visualize.draw_scatter_plots(room_columns, 'lines', hlp.date_window(df, window), forecast=forecasts)
+            fig.update_layout(title='Average Price per Square Meter by Number of Room(s)')
+            fig.add_hline(y=ppsm_mean, line_dash="dot",
+                      annotation_text=f"{district_key}_PPSM mean value",
+                      annotation_position="bottom right")
+        elif chart_id == 'rooms_scatter':
+            fig = visualize.draw_scatter_plots(room_columns, 'markers', hlp.date_window(df, window))
+            fig.update_layout(title='Cluster Points grouped by Number of Room(s)')
+        elif chart_id == 'boxes':
+            fig = visualize.draw_box_subplots(district_key)
+        elif chart_id == 'sales_bar':
+            #TOTAL NUMBER OF APARTMENT SALES BY MONTH FROM DECEMBER 2018-
+            fig = visualize.draw_horizontal_bar(district_key, hlp.COLOR_PALETTE[5])
+            fig.update_layout(title='Number of Apartment Sales by Month from December 2018-')
+        elif chart_id == 'monthly_pie':
+            fig = calc.calculate_monthly_distribution(f'{district_key}_NOS')[0]
+            fig.update_layout(title=f'Monthly Sales of Apartments as a Percentage of Total Sales in {hlp.DISTRICT_NAMES[district_key]}')
+        else:
+            raise ValueError(f'Unknown chart id: {chart_id}')
+        if real:
+            title = fig.layout.title.text
+            fig.update_layout(title=f'{title} ({prices.label})' if title else f'Prices {prices.label}')
+        return fig
+
+    def warm_up(self, district_keys: list[str] = None) -> float:
+        """Renders every chart of the given districts (all by default) into the cache; returns the seconds spent."""
+        start = time.perf_counter()
+        for district_key in district_keys or hlp.DISTRICTS.values():
+            for chart_id in CHART_IDS:
+                self.figure(district_key, chart_id)
+        return time.perf_counter() - start
+
+    def start_warm_up(self) -> None:
+        """
+        Pre-renders all districts on a background thread, once per dataset version,
+        when the IN_MALMOE_WARM_UP environment variable is set.
+        """
+        if not os.environ.get(WARM_UP_ENV):
+            return
+        version = self.dataset.version
+        with self._lock:
+            if version in self._warmed_up:
+                return
+            self._warmed_up.add(version)
+        threading.Thread(target=self.warm_up, name='figure-warm-up', daemon=True).start()
+
+
+DISTRICT_FIGURES = DistrictFigures()
+
+
+if __name__ == '__main__':
+    seconds = DISTRICT_FIGURES.warm_up()
+    print(f'Rendered {len(FIGURE_CACHE)} figures ({FIGURE_CACHE.size / 1024:.0f} KiB) in {seconds:.2f}s')
@@ -0,0 +1,70 @@
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def _as_float(x) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb(x, y, threshold: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; in between, every bucket keeps the point
+    forming the largest triangle with the point kept before it and the mean of the next
+    bucket, which preserves the visual shape (peaks, dips, trends) of a line.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = _as_float(x)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    # Mean of every bucket in one pass; the last point acts as the bucket after the last one
+    sizes = np.append(np.diff(edges), 1)
+    mean_x = np.add.reduceat(x, edges) / sizes
+    mean_y = np.add.reduceat(y, edges) / sizes
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        areas = np.abs((x[a] - mean_x[i + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a]))
+        a = start + int(np.argmax(areas))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax(x, y, threshold: int) -> np.ndarray:
+    """Indices of the minimum and maximum of threshold // 2 equal buckets, plus the end points."""
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    kept = [0, n - 1]
+    for bucket in np.array_split(np.arange(1, n - 1), threshold // 2 - 1):
+        if len(bucket):
+            kept += [bucket[np.argmin(y[bucket])], bucket[np.argmax(y[bucket])]]
+    return np.unique(kept)
+
+
+def downsample(x, y, threshold: int, method: str = 'lttb'):
+    """
+    Returns (x, y) reduced to about threshold points, ignoring missing values.
+    Series that already fit are returned unchanged.
+
+    Example:
+    x, y = downsample(df['DATE'], df['KPI'], 1400)
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    if threshold is None or len(y) <= threshold:
+        return x, y
+    valid = np.flatnonzero(~np.isnan(y))
+    select = lttb if method == 'lttb' else minmax
+    kept = valid[select(x[valid], y[valid], threshold)]
+    return x[kept], y[kept]
@@ -0,0 +1,229 @@
+"""
+Static export of the Home page and of every district of the Data Analysis page.
+
+Writes a site that any file server or CDN can serve without Streamlit:
+
+index.html                  Home: the texts, the district map, the REI and the KPI charts
+districts/<KEY>.html        one page per district: summary figures and all charts
+figures/<page>/<id>.json    every figure as Plotly JSON, for other front ends
+plotly.min.js               shared by all pages
+manifest.json               data versions and files of the export
+
+The pages show the charts as the app draws them before any option is changed;
+real prices, forecasts, zooming and the comparison page need the live app. Districts
+are rendered in parallel, one task per district on a process pool. The export is
+skipped when the manifest already matches the current data versions (see --force).
+
+Usage:
+python -m modules.export --output site --workers 4
+python -m modules.refresh && python -m modules.export --output /var/www/in-malmoe
+"""
+import argparse
+import html
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from modules.instrumentation import span
+
+MANIFEST = 'manifest.json'
+PLOTLY_JS = 'plotly.min.js'
+SUMMARY_MONTHS = [3, 6, 12]
+
+PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<script src="{root}{plotly_js}"></script>
+<style>
+body {{ font-family: sans-serif; margin: 0 auto; max-width: 1400px; padding: 1rem 2rem; color: #31333f; }}
+nav a {{ margin-right: 1rem; }}
+.grid {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(560px, 1fr)); gap: 1rem; }}
+.metrics {{ display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem; margin: 1rem 0; }}
+.metric {{ border: 1px solid #ccc; border-left: 0.5rem solid #9AD8E1; border-radius: 5px; padding: 0.5rem 1rem; }}
+.metric b {{ display: block; font-size: 1.6rem; }}
+.caption {{ color: #808495; font-size: 0.8rem; }}
+footer {{ margin-top: 2rem; color: #808495; font-size: 0.8rem; }}
+</style>
+</head>
+<body>
+<nav>{nav}</nav>
+{body}
+<footer>Data versions {versions} · exported {exported}</footer>
+</body>
+</html>
+"""
+
+
+def _write(path: str, content: str) -> None:
+    """Writes a file atomically, so a file server never hands out a half-written one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+
+def figure_html(figure_json: str, div_id: str) -> str:
+    """A div drawing the figure with plotly.min.js, from the JSON that is also written to figures/."""
+    data = figure_json.replace('</', '<\\/')
+    return (f'<div id="{div_id}" class="chart"></div>\n'
+            f'<script>(function () {{ var fig = {data}; '
+            f'Plotly.newPlot("{div_id}", fig.data, fig.layout, {{responsive: true}}); }})();</script>')
+
+
+def nav_html(root: str) -> str:
+    from modules import helper_functions as hlp
+
+    links = [f'<a href="{root}index.html">Home</a>']
+    links += [f'<a href="{root}districts/{key}.html">{html.escape(name)}</a>' for name, key in hlp.DISTRICTS.items()]
+    return ' '.join(links)
+
+
+def page_html(title: str, body: str, root: str, versions: dict) -> str:
+    return PAGE.format(title=html.escape(title), root=root, plotly_js=PLOTLY_JS, nav=nav_html(root), body=body,
+                       versions=html.escape(', '.join(f'{name} {version[:12]}' for name, version in versions.items())),
+                       exported=time.strftime('%Y-%m-%d %H:%M'))
+
+
+def versions() -> dict:
+    from modules import helper_functions as hlp
+    from modules.geography import GEOJSON_FILE, DistrictGeometry
+
+    result = {os.path.basename(dataset.path): dataset.version
+              for dataset in (hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)}
+    result[GEOJSON_FILE] = DistrictGeometry.from_file().version
+    return result
+
+
+def _check_versions(expected: dict) -> None:
+    if versions() != expected:
+        raise RuntimeError('the data changed during the export; run it again')
+
+
+def export_home(output: str, expected: dict) -> list[str]:
+    """Writes index.html and the Home figures; returns the written paths relative to output."""
+    from modules import helper_functions as hlp
+    from modules import home_figures
+    from modules.geography import SCHEMATIC_CAPTION, DistrictGeometry
+
+    _check_versions(expected)
+    written, charts = [], {}
+    for chart_id in home_figures.HOME_CHART_IDS:
+        with span(f'export.home.{chart_id}'):
+            charts[chart_id] = home_figures.figure(chart_id).to_json()
+        path = f'figures/home/{chart_id}.json'
+        _write(os.path.join(output, path), charts[chart_id])
+        written.append(path)
+
+    caption = f'<p class="caption">{SCHEMATIC_CAPTION}</p>' if DistrictGeometry.from_file().schematic else ''
+    body = f"""<div class="grid"><div>{figure_html(charts['map'], 'map')}{caption}</div><div>
+<h1>in-Malmö</h1>
+<p>{html.escape(hlp.APP_DESCRIPTION)}</p>
+</div></div>
+<hr>
+<div class="grid"><div>
+<h3>A sharp price correction is coming</h3>
+<p>{html.escape(hlp.INTRODUCTION_DESCRIPTION)}</p>
+</div><div>{figure_html(charts['rei'], 'rei')}</div></div>
+<h3>Real Estate Index: A Key Indicator of the Health of the Market</h3>
+<p>{html.escape(hlp.REAL_ESTATE_INDEX_DESCRIPTION)}</p>
+<hr>
+<div class="grid"><div>{figure_html(charts['kpi'], 'kpi')}</div><div>
+<h3>Global recession may not bring down the demand?</h3>
+<p>{html.escape(hlp.RECESSION_DESCRIPTION)}</p>
+</div></div>
+<h4>The Role of the Consumer Price Index (KPI) and the Consumer Price Index at Fixed Rate (KPIF) in Economic Analysis</h4>
+<p>{html.escape(hlp.KPI_DESCRIPTION)}</p>"""
+    _write(os.path.join(output, 'index.html'), page_html('in-Malmö', body, '', expected))
+    return written + ['index.html']
+
+
+def export_district(output: str, district_key: str, expected: dict) -> list[str]:
+    """Writes districts/<district_key>.html and its figures; runs in a worker process."""
+    from modules import helper_functions as hlp
+    from modules.district_figures import CHART_IDS, DISTRICT_FIGURES
+
+    _check_versions(expected)
+    written, charts = [], {}
+    for chart_id in CHART_IDS:
+        # Built directly: a worker renders every figure once, so there is nothing to cache
+        with span(f'export.district.{chart_id}'):
+            charts[chart_id] = DISTRICT_FIGURES.build(district_key, chart_id).to_json()
+        path = f'figures/{district_key}/{chart_id}.json'
+        _write(os.path.join(output, path), charts[chart_id])
+        written.append(path)
+
+    store = hlp.DistrictStore.from_dataset(hlp.HOUSING_DATA)
+    calc = hlp.Calculations(hlp.HOUSING_DATA.load(), store, hlp.Precomputed.from_dataset(hlp.HOUSING_DATA))
+    metrics = ''.join(
+        f'<div class="metric">{period}<b>{int(mean)} kr/sqm</b>{sales} units · {development}% price development</div>'
+        for period, mean, sales, development in calc.summary(district_key, SUMMARY_MONTHS))
+    name = hlp.DISTRICT_NAMES[district_key]
+    chart = lambda chart_id: figure_html(charts[chart_id], chart_id)
+    body = f"""<h1>{html.escape(name)}</h1>
+<div class="grid"><div>{chart('sma')}</div><div class="metrics">{metrics}</div></div>
+<div class="grid"><div>{chart('rooms_lines')}</div><div>{chart('rooms_scatter')}</div></div>
+{chart('boxes')}
+<div class="grid"><div>{chart('sales_bar')}</div><div>{chart('monthly_pie')}</div></div>"""
+    path = f'districts/{district_key}.html'
+    _write(os.path.join(output, path), page_html(f'{name} - in-Malmö', body, '../', expected))
+    return written + [path]
+
+
+def export(output: str, workers: int = None, force: bool = False) -> dict:
+    """Exports the site into output; returns the manifest (unchanged when the export was up to date)."""
+    from modules import helper_functions as hlp
+
+    hlp.ImportData.pin_versions()
+    expected = versions()
+    manifest_path = os.path.join(output, MANIFEST)
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('versions') == expected:
+            return manifest
+
+    start = time.perf_counter()
+    district_keys = list(hlp.DISTRICTS.values())
+    workers = min(workers or os.cpu_count(), len(district_keys))
+    files = []
+    if workers > 1:
+        # Spawned, like the comparison pool, so workers do not inherit the parent's threads
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            districts = [executor.submit(export_district, output, key, expected) for key in district_keys]
+            files += export_home(output, expected)
+            for district in districts:
+                files += district.result()
+    else:
+        files += export_home(output, expected)
+        for key in district_keys:
+            files += export_district(output, key, expected)
+
+    from plotly.offline import get_plotlyjs
+    _write(os.path.join(output, PLOTLY_JS), get_plotlyjs())
+    manifest = {'versions': expected, 'exported': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'seconds': round(time.perf_counter() - start, 2), 'files': sorted(files) + [PLOTLY_JS]}
+    # Written last: a manifest matching the data means a complete export
+    _write(manifest_path, json.dumps(manifest, indent=2))
+    return manifest
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='site', help='directory to write the site to')
+    parser.add_argument('--workers', type=int, help='processes rendering districts (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='export even if the site matches the current data')
+    args = parser.parse_args()
+
+    manifest = export(args.output, args.workers, args.force)
+    print(f'{len(manifest["files"])} files in {args.output} (data {", ".join(v[:12] for v in manifest["versions"].values())}, '
+          f'exported {manifest["exported"]} in {manifest["seconds"]}s)')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
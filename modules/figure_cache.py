@@ -0,0 +1,77 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from modules.instrumentation import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+
+class FigureCache:
+    """
+    Size-bounded LRU cache of serialized Plotly figures shared by all sessions of a process.
+
+    Keys are tuples such as (dataset version, district, chart id). Figures are stored as
+    JSON, so a hit only has to deserialize instead of running Plotly Express again, and
+    the least recently used figures are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._figures = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._figures)
+
+    def __contains__(self, key) -> bool:
+        return key in self._figures
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def get_json(self, key) -> str:
+        with self._lock:
+            figure_json = self._figures.get(key)
+            if figure_json is None:
+                self.misses += 1
+                return None
+            self._figures.move_to_end(key)
+            self.hits += 1
+            return figure_json
+
+    def put_json(self, key, figure_json: str) -> None:
+        with self._lock:
+            previous = self._figures.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._figures[key] = figure_json
+            self._bytes += len(figure_json)
+            while self._bytes > self.max_bytes and len(self._figures) > 1:
+                _, evicted = self._figures.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_or_build(self, key, build) -> go.Figure:
+        """Returns the cached figure for key, calling build() and caching its result on a miss."""
+        import plotly.io as pio
+
+        figure_json = self.get_json(key)
+        if figure_json is None:
+            with span('figures.build'):
+                figure_json = build().to_json()
+            self.put_json(key, figure_json)
+        with span('figures.from_json'):
+            return pio.from_json(figure_json)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._figures.clear()
+            self._bytes = 0
+
+
+FIGURE_CACHE = FigureCache()
@@ -0,0 +1,224 @@
+"""
+Short-horizon forecasts of every PPSM and NOS series, fitted in one batch per data version.
+
+Two lightweight models are fitted to all series at once, vectorized over the series
+(and over a grid of smoothing parameters) rather than looping over them:
+
+- simple exponential smoothing (SES), with the smoothing parameter picked from a grid
+  by one-step-ahead squared error;
+- an AR(p) model with drift on the monthly changes, fitted by batched least squares.
+
+Each series keeps the model with the lower AIC. Forecasts and prediction intervals
+for the whole horizon are computed when fitting, so drawing them is a lookup.
+"""
+import threading
+import numpy as np
+import pandas as pd
+from modules.instrumentation import span
+from modules.store import ALL_ROOMS, DistrictStore
+
+HORIZON = 6
+LEVEL = 0.95
+METRICS = ('PPSM', 'NOS')
+ALPHAS = np.linspace(0.05, 1.0, 20)
+AR_ORDER = 2
+# Metrics that cannot go below zero
+NON_NEGATIVE = {'NOS'}
+
+
+def ses_fit(values: np.ndarray, alphas: np.ndarray = ALPHAS):
+    """
+    Simple exponential smoothing of every row of a 2D array for every alpha at once.
+
+    Missing values leave the level unchanged. Returns (alpha, final level, one-step
+    MSE, number of one-step errors) per row, for the alpha with the lowest MSE.
+    """
+    rows = values.shape[0]
+    level = np.full((rows, len(alphas)), np.nan)
+    sse = np.zeros((rows, len(alphas)))
+    count = np.zeros(rows)
+    for y in values.T:
+        valid = ~np.isnan(y)
+        started = valid & ~np.isnan(level[:, 0])
+        error = y[:, None] - level
+        sse += np.where(started[:, None], error ** 2, 0.0)
+        count += started
+        level = np.where(valid[:, None], np.where(np.isnan(level), y[:, None], level + alphas * error), level)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = sse / count[:, None]
+    best = np.argmin(np.where(np.isnan(mse), np.inf, mse), axis=1)
+    picked = np.arange(rows), best
+    return alphas[best], level[picked], mse[picked], count
+
+
+def ses_forecast(level: np.ndarray, alpha: np.ndarray, mse: np.ndarray, horizon: int):
+    """(mean, standard deviation) per row and step; the variance grows with alpha**2 per step."""
+    steps = np.arange(horizon)
+    mean = np.repeat(level[:, None], horizon, axis=1)
+    std = np.sqrt(mse[:, None] * (1 + steps * alpha[:, None] ** 2))
+    return mean, std
+
+
+def ar_fit(values: np.ndarray, order: int = AR_ORDER):
+    """
+    AR(order) with intercept on the first differences of every row, by least squares.
+
+    The normal equations of all rows are built and solved as one batch; periods with a
+    missing value in the target or a lag are left out. Returns (coefficients
+    [intercept, phi_1..phi_order], residual MSE, number of residuals) per row, NaN
+    where a row has too few complete periods.
+    """
+    changes = np.diff(values, axis=1)
+    length = changes.shape[1] - order
+    if length <= 0:
+        rows = values.shape[0]
+        return np.full((rows, order + 1), np.nan), np.full(rows, np.nan), np.zeros(rows)
+    target = changes[:, order:]
+    design = np.stack([np.ones_like(target)] + [changes[:, order - lag:order - lag + length] for lag in range(1, order + 1)], axis=2)
+    complete = ~np.isnan(target) & ~np.isnan(design).any(axis=2)
+    target = np.where(complete, target, 0.0)
+    design = np.where(complete[:, :, None], design, 0.0)
+
+    count = complete.sum(axis=1)
+    gram = np.einsum('snk,snl->skl', design, design) + 1e-9 * np.eye(order + 1)
+    moments = np.einsum('snk,sn->sk', design, target)
+    coefficients = np.linalg.solve(gram, moments[:, :, None])[:, :, 0]
+    residuals = np.where(complete, target - np.einsum('snk,sk->sn', design, coefficients), 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mse = (residuals ** 2).sum(axis=1) / (count - order - 1)
+    enough = count >= 2 * (order + 1) + 2
+    coefficients[~enough] = np.nan
+    mse[~enough] = np.nan
+    return coefficients, mse, count
+
+
+def ar_forecast(values: np.ndarray, coefficients: np.ndarray, mse: np.ndarray, horizon: int):
+    """(mean, standard deviation) per row and step of the AR model on changes, integrated back to levels."""
+    order = coefficients.shape[1] - 1
+    intercept, phi = coefficients[:, 0], coefficients[:, 1:]
+    last = values[:, -1]
+    # Most recent change first
+    recent = np.diff(values[:, -order - 1:], axis=1)[:, ::-1]
+    mean = np.empty((values.shape[0], horizon))
+    for step in range(horizon):
+        change = intercept + (phi * recent).sum(axis=1)
+        last = last + change
+        mean[:, step] = last
+        recent = np.concatenate([change[:, None], recent[:, :-1]], axis=1)
+
+    # psi weights of the changes, summed up for the levels
+    psi = np.zeros((values.shape[0], horizon))
+    psi[:, 0] = 1.0
+    for j in range(1, horizon):
+        psi[:, j] = sum(phi[:, i - 1] * psi[:, j - i] for i in range(1, min(j, order) + 1))
+    level_psi = np.cumsum(psi, axis=1)
+    std = np.sqrt(mse[:, None] * np.cumsum(level_psi ** 2, axis=1))
+    return mean, std
+
+
+class Forecasts:
+    """
+    Fitted models, forecasts and prediction intervals of the PPSM and NOS series of a
+    DistrictStore, cached per dataset version like Precomputed.
+
+    Example:
+    forecasts = Forecasts.from_dataset(hlp.HOUSING_DATA)
+    dates, mean, lower, upper = forecasts.forecast('HY', 'PPSM')
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, store: DistrictStore, horizon: int = HORIZON, level: float = LEVEL, metrics=METRICS):
+        rows = [row for row, key in enumerate(store.keys) if key[1] in metrics]
+        values = store.values[rows].astype(float)
+        self.keys = [store.keys[row] for row in rows]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.horizon = horizon
+        self.level = level
+        last = store.dates[-1].astype('datetime64[M]')
+        self.dates = (last + np.arange(1, horizon + 1)).astype('datetime64[ns]')
+        self.last_date = store.dates[-1]
+
+        self.alpha, ses_level, ses_mse, ses_count = ses_fit(values)
+        self.coefficients, ar_mse, ar_count = ar_fit(values, AR_ORDER)
+        ses_mean, ses_std = ses_forecast(ses_level, self.alpha, ses_mse, horizon)
+        ar_mean, ar_std = ar_forecast(values, self.coefficients, ar_mse, horizon)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ses_aic = np.log(ses_mse) + 2 * 2 / ses_count
+            ar_aic = np.log(ar_mse) + 2 * (AR_ORDER + 2) / ar_count
+        use_ar = np.isfinite(ar_aic) & np.isfinite(ar_mean).all(axis=1) & ~(ar_aic >= ses_aic)
+        self.model = np.where(use_ar, 'ar', 'ses')
+        self.mse = np.where(use_ar, ar_mse, ses_mse)
+        self.last = values[:, -1]
+        self.mean = np.where(use_ar[:, None], ar_mean, ses_mean)
+        std = np.where(use_ar[:, None], ar_std, ses_std)
+        # Imported here: statistics pulls in fractions, which pages do not need at startup
+        from statistics import NormalDist
+        z = NormalDist().inv_cdf(0.5 + level / 2)
+        self.lower, self.upper = self.mean - z * std, self.mean + z * std
+        non_negative = np.array([key[1] in NON_NEGATIVE for key in self.keys])
+        for array in (self.mean, self.lower, self.upper):
+            array[non_negative] = np.maximum(array[non_negative], 0.0)
+        self._frames = {}
+
+    @classmethod
+    def from_dataset(cls, dataset) -> 'Forecasts':
+        """Returns the forecasts for the current version of an ImportData dataset, fitting them once per version."""
+        key = (dataset.path, dataset.version)
+        forecasts = cls._cache.get(key)
+        if forecasts is None:
+            with cls._lock:
+                forecasts = cls._cache.get(key)
+                if forecasts is None:
+                    store = DistrictStore.from_dataset(dataset)
+                    with span('forecast.fit'):
+                        forecasts = cls(store)
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path}
+                    cls._cache[key] = forecasts
+        return forecasts
+
+    @classmethod
+    def install(cls, dataset, version: str, forecasts: 'Forecasts') -> None:
+        """Adds forecasts fitted ahead for the next version of a dataset; the current version's stay until the one after."""
+        with cls._lock:
+            keep = {version, dataset.version}
+            cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path or k[1] in keep}
+            cls._cache[(dataset.path, version)] = forecasts
+
+    def forecast(self, district: str, metric: str, rooms: str = ALL_ROOMS):
+        """(dates, mean, lower, upper) of one series over the horizon."""
+        row = self.index[(district, metric, rooms)]
+        return self.dates, self.mean[row], self.lower[row], self.upper[row]
+
+    def frame(self, columns: dict) -> pd.DataFrame:
+        """
+        DATE plus {column}, {column}_LOWER and {column}_UPPER for every {column: key}, as
+        Visualize.draw_scatter_plots overlays them. The first row is the last observed
+        month, so the forecast line continues the series. Frames are kept per set of
+        columns, so redrawing a chart does not rebuild them.
+        """
+        key = tuple(columns.items())
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._frames[key] = self._frame(columns)
+        return frame
+
+    def _frame(self, columns: dict) -> pd.DataFrame:
+        data = {'DATE': np.concatenate([[self.last_date], self.dates])}
+        for column, key in columns.items():
+            row = self.index[key]
+            data[column] = np.concatenate([[self.last[row]], self.mean[row]])
+            data[f'{column}_LOWER'] = np.concatenate([[self.last[row]], self.lower[row]])
+            data[f'{column}_UPPER'] = np.concatenate([[self.last[row]], self.upper[row]])
+        return pd.DataFrame(data)
+
+    def parameters(self) -> pd.DataFrame:
+        """Chosen model and fitted parameters per series."""
+        table = pd.DataFrame(self.keys, columns=['district', 'metric', 'rooms'])
+        table['model'] = self.model
+        table['alpha'] = np.where(self.model == 'ses', self.alpha, np.nan)
+        for i, name in enumerate(['drift'] + [f'phi_{lag}' for lag in range(1, AR_ORDER + 1)]):
+            table[name] = np.where(self.model == 'ar', self.coefficients[:, i], np.nan)
+        table['rmse'] = np.sqrt(self.mse)
+        return table
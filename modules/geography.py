@@ -0,0 +1,251 @@
+"""
+District geometry and the choropleth maps drawn on it.
+
+malmoe_districts.geojson holds one Polygon or MultiPolygon feature per district, with
+a `district` property holding the key used in housing_data.csv. The bundled file is
+schematic (see its description) and says so with `"schematic": true`, so the maps note
+it; official boundaries can replace it as long as they keep the `district` property.
+
+The rings are simplified with Douglas-Peucker once per version of the file, to the
+size of a pixel at several zoom levels, so a map only sends the vertices its zoom can
+show. `python -m modules.snapshot` writes the simplified levels next to the data
+snapshot; processes load them from there, or simplify on first use when they are
+missing. Map figures go through the figure cache keyed by the data and geometry
+versions, so a rerun does not rebuild them.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import math
+import os
+import threading
+from typing import TYPE_CHECKING
+import numpy as np
+from modules.instrumentation import span
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+GEOJSON_FILE = 'malmoe_districts.geojson'
+# Web map zoom levels (512-pixel tiles) that get their own simplification
+ZOOMS = (8, 9, 10, 11, 12, 13)
+TILE_SIZE = 512
+SIDEBAR_WIDTH = 300
+SCHEMATIC_CAPTION = 'District boundaries are schematic, not official.'
+MAP_MEASURES = {
+    'PPSM': 'Price per sqm, latest month',
+    'NOS': 'Sales, last 12 months',
+    'CHANGE': 'Price development, last 3 months (%)',
+}
+
+
+def tolerance(zoom: float) -> float:
+    """Degrees of longitude covered by one pixel at a zoom level."""
+    return 360 / (TILE_SIZE * 2 ** zoom)
+
+
+def simplify(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification of an (n, 2) array of points. The end points stay,
+    and rings that would collapse below a triangle are returned unchanged.
+    """
+    if len(points) < 5:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        between = points[first + 1:last]
+        segment = end - start
+        length = math.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(*(between - start).T)
+        else:
+            distances = np.abs(segment[0] * (between[:, 1] - start[1]) - segment[1] * (between[:, 0] - start[0])) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            stack += [(first, middle), (middle, last)]
+    simplified = points[keep]
+    return simplified if len(simplified) >= 4 else points
+
+
+def simplify_geometry(geometry: dict, tolerance: float) -> dict:
+    """A GeoJSON Polygon or MultiPolygon with every ring simplified."""
+    def rings(polygon):
+        return [simplify(np.asarray(ring, dtype=float), tolerance).round(6).tolist() for ring in polygon]
+
+    if geometry['type'] == 'Polygon':
+        return {'type': 'Polygon', 'coordinates': rings(geometry['coordinates'])}
+    if geometry['type'] == 'MultiPolygon':
+        return {'type': 'MultiPolygon', 'coordinates': [rings(polygon) for polygon in geometry['coordinates']]}
+    raise ValueError(f'Unsupported geometry type: {geometry["type"]}')
+
+
+def _vertices(collection: dict) -> int:
+    count = 0
+    for feature in collection['features']:
+        geometry = feature['geometry']
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        count += sum(len(ring) for polygon in polygons for ring in polygon)
+    return count
+
+
+class DistrictGeometry:
+    """
+    The district features at every simplification level of ZOOMS, for one version of
+    the GeoJSON file, shared by all sessions of a process.
+
+    Example:
+    geometry = DistrictGeometry.from_file()
+    fig = geometry.choropleth({'HY': 1.0, 'C': 2.0}, hlp.CHART_WIDTH, 400)
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, collection: dict, version: str, levels: dict = None):
+        self.version = version
+        self.schematic = bool(collection.get('schematic', False))
+        self.districts = [feature['properties']['district'] for feature in collection['features']]
+        if levels is None:
+            with span('geometry.simplify'):
+                levels = {zoom: {'type': 'FeatureCollection', 'features': [
+                    {'type': 'Feature', 'id': feature['properties']['district'], 'properties': feature['properties'],
+                     'geometry': simplify_geometry(feature['geometry'], tolerance(zoom))}
+                    for feature in collection['features']]} for zoom in ZOOMS}
+        self.levels = levels
+        self.vertices = {'source': _vertices(collection), **{zoom: _vertices(level) for zoom, level in levels.items()}}
+        coordinates = np.array([point for level in levels[max(ZOOMS)]['features'] for point in _points(level['geometry'])])
+        (self.west, self.south), (self.east, self.north) = coordinates.min(axis=0), coordinates.max(axis=0)
+
+    @staticmethod
+    def path() -> str:
+        from modules.helper_functions import DATA_DIR
+        return os.path.join(DATA_DIR, GEOJSON_FILE)
+
+    @staticmethod
+    def levels_path(version: str) -> str:
+        from modules.helper_functions import SNAPSHOT_DIR
+        return os.path.join(SNAPSHOT_DIR, 'geometry', f'{version[:12]}.json')
+
+    @classmethod
+    def from_file(cls, path: str = None) -> 'DistrictGeometry':
+        """Geometry of the current version of the GeoJSON file, read and simplified once per version."""
+        path = path or cls.path()
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        geometry = cls._cache.get(key)
+        if geometry is None:
+            with cls._lock:
+                geometry = cls._cache.get(key)
+                if geometry is None:
+                    with open(path, 'rb') as file:
+                        content = file.read()
+                    version = hashlib.sha1(content).hexdigest()
+                    geometry = cls(json.loads(content), version, cls._read_levels(version))
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != path}
+                    cls._cache[key] = geometry
+        return geometry
+
+    @classmethod
+    def _read_levels(cls, version: str) -> dict:
+        try:
+            with open(cls.levels_path(version), encoding='utf-8') as file:
+                levels = json.load(file)
+        except (OSError, ValueError):
+            return None
+        levels = {int(zoom): level for zoom, level in levels.items()}
+        return levels if set(levels) == set(ZOOMS) else None
+
+    def write_levels(self) -> str:
+        """Stores the simplified levels for other processes; returns the file written."""
+        path = self.levels_path(self.version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.levels, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+        return path
+
+    def fit_zoom(self, width: int, height: int) -> float:
+        """Largest zoom at which every district fits into width x height pixels."""
+        # Web Mercator stretches latitudes by 1 / cos(latitude)
+        lat = math.radians((self.north + self.south) / 2)
+        lon_zoom = math.log2(360 * width / (TILE_SIZE * (self.east - self.west)))
+        lat_zoom = math.log2(360 * height * math.cos(lat) / (TILE_SIZE * (self.north - self.south)))
+        return min(lon_zoom, lat_zoom) - 0.1
+
+    def geojson(self, zoom: float) -> dict:
+        """The features simplified for the largest precomputed zoom that does not exceed zoom."""
+        fitting = [level for level in ZOOMS if level <= zoom]
+        return self.levels[max(fitting) if fitting else min(ZOOMS)]
+
+    def choropleth(self, values: dict, width: int, height: int, title: str = '', highlight: str = None,
+                   labels: dict = None, colorbar_title: str = '') -> go.Figure:
+        """
+        Map of the districts coloured by values ({district: value}), fitted to width x
+        height pixels; the highlight district gets a thicker outline.
+        """
+        import plotly.graph_objects as go
+
+        zoom = self.fit_zoom(width, height)
+        districts = [district for district in self.districts if district in values]
+        labels = labels or {}
+        fig = go.Figure(go.Choropleth(
+            geojson=self.geojson(zoom),
+            locations=districts,
+            z=[values[district] for district in districts],
+            text=[labels.get(district, district) for district in districts],
+            hovertemplate='%{text}: %{z:,.1f}<extra></extra>',
+            colorscale='Tealgrn',
+            marker_line_color=['#001219' if district == highlight else '#ffffff' for district in districts],
+            marker_line_width=[3 if district == highlight else 1 for district in districts],
+            colorbar=dict(title=colorbar_title, thickness=12),
+        ))
+        # No base map: the districts alone, so nothing but the figure has to load
+        fig.update_geos(fitbounds='locations', visible=False, projection_type='mercator')
+        fig.update_layout(title=title, margin=dict(l=0, r=0, t=40 if title else 0, b=0), height=height)
+        return fig
+
+
+def _points(geometry: dict):
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    for polygon in polygons:
+        for ring in polygon:
+            yield from ring
+
+
+def district_values(measure: str) -> dict:
+    """{district: value} of one of MAP_MEASURES, the same figures the Data Analysis page shows."""
+    from modules import helper_functions as hlp
+
+    precomputed = hlp.Precomputed.from_dataset(hlp.HOUSING_DATA)
+    store = precomputed.store
+    values = {}
+    for district in store.districts:
+        if (district, 'PPSM', '') not in store.index or (district, 'NOS', '') not in store.index:
+            continue
+        if measure == 'PPSM':
+            ppsm = store.series(district, 'PPSM')
+            valid = ppsm[~np.isnan(ppsm)]
+            values[district] = float(valid[-1]) if len(valid) else np.nan
+        elif measure == 'NOS':
+            values[district] = precomputed.summary(district, [12])[0][2]
+        elif measure == 'CHANGE':
+            values[district] = precomputed.summary(district, [3])[0][3]
+        else:
+            raise ValueError(f'Unknown measure: {measure}')
+    return values
+
+
+def map_figure(measure: str, width: int, height: int, highlight: str = None, title: bool = True) -> go.Figure:
+    """Choropleth of a measure of MAP_MEASURES for the current data and geometry versions."""
+    from modules import helper_functions as hlp
+
+    geometry = DistrictGeometry.from_file()
+    return geometry.choropleth(district_values(measure), width, height, MAP_MEASURES[measure] if title else '',
+                               highlight, hlp.DISTRICT_NAMES, '' if title else MAP_MEASURES[measure])
@@ -1,31 +1,216 @@
+from __future__ import annotations
+import hashlib
+import io
+import os
+import threading
+from typing import TYPE_CHECKING
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import streamlit as st
-import plotly.graph_objects as go
-import plotly.subplots as subplots
-from streamlit_extras.metric_cards import style_metric_cards
+from modules import downsample, snapshot
+from modules.memory import COMPACT_ENV, compact_frame
+from modules.instrumentation import INSTRUMENTATION, span, timed
+from modules.store import DistrictStore, parse_column
+from modules.precompute import MONTH_NAMES, Precomputed, trailing_summary
+from modules.forecast import Forecasts
+
+# Plotly Express, the graph objects and streamlit-extras are imported inside the
+# functions that draw with them, so importing this module stays cheap for new workers.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+# IN_MALMOE_DATA_DIR points the app at another copy of the datasets, e.g. synthetic benchmark data
+DATA_DIR = os.environ.get('IN_MALMOE_DATA_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshot')
+# IN_MALMOE_COMPACT_DTYPES=1 holds the datasets as int32/float32/categorical (see modules/memory.py)
+COMPACT_DTYPES = os.environ.get(COMPACT_ENV, '0') == '1'
 
 class ImportData:
-    def __init__(self) -> None:
-        pass
+    """
+    Loads one of the app's CSV datasets once per process and shares it across sessions.
+
+    The parsed frame is cached per file and re-read only when the file's modification
+    time or size changes. `version` is the content hash of the file behind the cached
+    frame, so derived results can be keyed on it. Decimal commas are parsed as numbers
+    and `DATE` is parsed with `date_format`.
+
+    When a snapshot compiled from the same file version exists (see modules/snapshot.py),
+    it is memory-mapped instead of parsing the CSV. With `compact` the frame uses
+    compact dtypes, and its snapshot is kept apart from the full-width one.
+
+    Example:
+    df = ImportData('inflation_rate.csv', date_format='%Y-%m-%d').load()
+    """
+    _cache = {}
+    _lock = threading.Lock()
+    _pinned = threading.local()
+
+    def __init__(self, file_name: str, date_format: str, delimiter: str = ';', compact: bool = None) -> None:
+        self.path = os.path.join(DATA_DIR, file_name)
+        self.compact = COMPACT_DTYPES if compact is None else compact
+        name = os.path.splitext(file_name)[0]
+        self.snapshot_dir = os.path.join(SNAPSHOT_DIR, f'{name}-compact' if self.compact else name)
+        self.date_format = date_format
+        self.delimiter = delimiter
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_file(self, path: str = None) -> bytes:
+        with span('data.read_file'):
+            with open(path or self.path, 'rb') as file:
+                return file.read()
+
+    @timed('data.hash')
+    def _version(self, content: bytes) -> str:
+        return hashlib.sha1(content).hexdigest()
+
+    def parse_csv(self, path: str = None, content: bytes = None):
+        """
+        Parses the CSV, or another file in the same format such as a staged next version.
+        content is the file's bytes when the caller has read them already, so a version
+        is read from disk once and hashed and parsed from the same bytes.
+        """
+        if content is None:
+            content = self._read_file(path)
+        version = self._version(content)
+        with span('data.read_csv'):
+            df = pd.read_csv(io.BytesIO(content), delimiter=self.delimiter, decimal=',')
+        with span('data.parse_dates'):
+            df['DATE'] = pd.to_datetime(df['DATE'].astype(str), format=self.date_format)
+        if self.compact:
+            with span('data.compact'):
+                df = compact_frame(df)
+        return version, df
+
+    def _read(self):
+        content = self._read_file()
+        version = self._version(content)
+        with span('data.load_snapshot'):
+            df = snapshot.read_snapshot(self.snapshot_dir, version)
+        if df is None:
+            version, df = self.parse_csv(content=content)
+        return version, df
+
+    @classmethod
+    def pin_versions(cls):
+        """
+        Called at the start of a rerun: until the next call, this thread keeps getting the
+        dataset versions it saw first, even if a background refresh publishes new ones.
+        """
+        cls._pinned.entries = {}
+
+    def _entry(self):
+        pinned = getattr(ImportData._pinned, 'entries', None)
+        if pinned is not None and self.path in pinned:
+            return pinned[self.path]
+        signature = self._signature()
+        entry = ImportData._cache.get(self.path)
+        if entry is None or entry[0] != signature:
+            with ImportData._lock:
+                entry = ImportData._cache.get(self.path)
+                if entry is None or entry[0] != signature:
+                    version, df = self._read()
+                    entry = (signature, version, df)
+                    ImportData._cache[self.path] = entry
+        if pinned is not None:
+            pinned[self.path] = entry
+        return entry
+
+    def publish(self, staged_path: str, version: str, df: pd.DataFrame) -> None:
+        """
+        Moves a fully built next version into place and makes it the cached frame in one
+        step, so no rerun of this process waits for it to be read. Frames handed out
+        before stay valid for the reruns still using them.
+        """
+        with ImportData._lock:
+            os.replace(staged_path, self.path)
+            ImportData._cache[self.path] = (self._signature(), version, df)
+
+    @property
+    def version(self) -> str:
+        return self._entry()[1]
+
+    def load(self) -> pd.DataFrame:
+        # The cached frame is shared by every session; callers get a shallow copy so
+        # that adding or replacing columns never touches the shared one.
+        return self._entry()[2].copy(deep=False)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._cache.clear()
+
+def year_month_frame(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """
+    Returns a new frame with YEAR and MONTH taken from df['DATE'] followed by the given columns.
+    df is not modified, and DATE is only converted when it is not a datetime column yet.
+    """
+    dates = df['DATE']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+    data = {'YEAR': dates.dt.year, 'MONTH': dates.dt.month}
+    for column in columns:
+        data[column] = df[column]
+    return pd.DataFrame(data)
 
 class Calculations:
-    def __init__(self, df: pd.DataFrame):
+    """
+    Metrics over the housing data.
+
+    Apart from calculate_sma, which adds its SMA columns to self.df for backwards
+    compatibility, the methods never modify self.df, so one frame can be shared
+    by every session and thread.
+    """
+    def __init__(self, df: pd.DataFrame, store: DistrictStore = None, precomputed: Precomputed = None):
         self.df = df
+        self.store = store or DistrictStore(df)
+        # Optional lookup table of SMA windows, summaries and monthly distributions;
+        # anything it does not cover is computed on demand as before.
+        self.precomputed = precomputed
+
+    def _precomputed_key(self, column: str):
+        key = parse_column(column)
+        if self.precomputed is None or key not in self.store.index:
+            return None
+        return key
 
     def calculate_mean(self, column: str):
         return self.df[column].mean()
 
-    def calculate_sma(self, column: str, n: list[int]) -> list[str]:
-        sma_columns = [f'{column}']
+    @timed('calculations.sma')
+    def sma(self, column: str, n: list[int]) -> pd.DataFrame:
+        """
+        Returns a new frame with DATE, the column and one SMA_{column}_{i} column per window.
+
+        Example:
+        calc.sma('HY_PPSM', [3, 6, 12]).columns -> DATE, HY_PPSM, SMA_HY_PPSM_3, SMA_HY_PPSM_6, SMA_HY_PPSM_12
+        """
+        key = self._precomputed_key(column)
+        data = {'DATE': self.df['DATE'], column: self.df[column]}
         for i in n:
-            sma_column = f'SMA_{column}_{i}'
-            self.df[sma_column] = self.df[column].rolling(window=i).mean()
-            sma_columns.append(sma_column)
-        return sma_columns
+            if key is not None and i in self.precomputed.windows:
+                data[f'SMA_{column}_{i}'] = self.precomputed.sma_series(*key, i)
+            else:
+                data[f'SMA_{column}_{i}'] = self.df[column].rolling(window=i).mean()
+        return pd.DataFrame(data)
+
+    def calculate_sma(self, column: str, n: list[int]) -> list[str]:
+        sma = self.sma(column, n)
+        for sma_column in sma.columns[2:]:
+            self.df[sma_column] = sma[sma_column]
+        return list(sma.columns[1:])
 
+    @timed('calculations.monthly_distribution')
     def calculate_monthly_distribution(self, column:str):
+        import plotly.express as px
+        key = self._precomputed_key(column)
+        if key is not None:
+            monthly_sums = pd.DataFrame({'MONTH': MONTH_NAMES, column: self.precomputed.monthly_distribution(*key)})
+            fig = px.pie(monthly_sums, values=f'{column}', names='MONTH',color_discrete_sequence=px.colors.sequential.RdBu)
+            return fig, monthly_sums
+
         month_dict = {
             1: 'Jan',
             2: 'Feb',
@@ -41,22 +226,17 @@ class Calculations:
             12: 'Dec'
             }
         
-        self.df['DATE'] = pd.to_datetime(self.df['DATE'])
-        self.df['MONTH'] = self.df['DATE'].dt.month
-        self.df['YEAR'] = self.df['DATE'].dt.month
-        columns = ['YEAR', 'MONTH', f'{column}']
-        df_new = self.df[columns]
-        monthly_sums = df_new.groupby(columns[:2])[f'{column}'].sum()
+        df_new = year_month_frame(self.df, [column])
+        monthly_sums = df_new.groupby('MONTH')[f'{column}'].sum()
         monthly_sums = monthly_sums.reset_index()
         monthly_sums['MONTH'] = monthly_sums['MONTH'].map(month_dict)
-        monthly_sums = monthly_sums.drop(columns='YEAR')
-        monthly_sums = monthly_sums.reset_index(drop=True)
         fig = px.pie(monthly_sums, values=f'{column}', names='MONTH',color_discrete_sequence=px.colors.sequential.RdBu)
         return fig, monthly_sums
 
+    @timed('calculations.difference')
     def calculate_difference(self, andel: str, column_1: str):
-        self.df['DIFF'] = round(self.df[andel]/self.df[column_1] * 100,1)
-        dataframe = self.df[['DATE', 'DIFF']]
+        import plotly.graph_objects as go
+        dataframe = pd.DataFrame({'DATE': self.df['DATE'], 'DIFF': round(self.df[andel]/self.df[column_1] * 100,1)})
         fig = go.Figure(data=[go.Table(
             header=dict(values=list(dataframe.columns),
                         #fill_color='paleturquoise',
@@ -67,25 +247,95 @@ class Calculations:
         ])
         return dataframe, fig
 
+    @timed('calculations.summary')
     def summary(self, district_key: str, months: list[int]):
+        if self.precomputed is not None and set(months) <= set(self.precomputed.months):
+            return self.precomputed.summary(district_key, months)
+        series = np.stack([self.store.series(district_key, 'PPSM'), self.store.series(district_key, 'NOS')])
+        means, sums, pct_differences = trailing_summary(series, months)
         values = []
-        for i in months:
-            mean_sqm = self.df[f'{district_key}_PPSM'].tail(i).mean()
-            sum_value = self.df[f'{district_key}_NOS'].tail(i).sum()
-            last_element = self.df[f'{district_key}_PPSM'].iloc[-1]
-            nth_element = self.df[f'{district_key}_PPSM'].iloc[-i-1]
-            pct_difference = ((last_element-nth_element)/last_element)*100
-            pct_difference = round(pct_difference, 1)
-            values.append([f'{i} months', mean_sqm, sum_value, pct_difference])
+        for j, i in enumerate(months):
+            values.append([f'{i} months', means[j, 0], int(sums[j, 1]), pct_differences[j, 0]])
         return values    
 
-def draw_multiple_graphs(df: pd.DataFrame, columns: list[str]) -> go.Figure:
+# Set IN_MALMOE_LAZY_SECTIONS=0 to render every section eagerly
+LAZY_SECTIONS = os.environ.get('IN_MALMOE_LAZY_SECTIONS', '1') != '0'
+
+def lazy_section(label: str, key: str, container=st, default: bool = False) -> bool:
+    """
+    Decides whether a below-the-fold section should be computed and sent in this rerun.
+
+    In lazy mode a toggle is drawn in the container and the section is only built once
+    the user switches it on (the choice sticks for the session). Streamlit executes an
+    st.expander's body even when it is collapsed, which is why a toggle is used instead.
+
+    Example:
+    if hlp.lazy_section('Show box plots', 'box_plots'):
+        st.plotly_chart(fig)
+    """
+    if not LAZY_SECTIONS:
+        return True
+    return container.toggle(label, value=default, key=key)
+
+def plotly_chart(container, fig: go.Figure, **kwargs):
+    """st.plotly_chart on the given container, timed as the figure's serialization stage."""
+    with span('streamlit.plotly_chart'):
+        return container.plotly_chart(fig, **kwargs)
+
+# Streamlit does not report how wide a chart ends up; this is a half-width column of the
+# wide layout. Set IN_MALMOE_CHART_WIDTH=0 to always send every point.
+CHART_WIDTH = int(os.environ.get('IN_MALMOE_CHART_WIDTH', 700))
+POINTS_PER_PIXEL = 2
+
+def point_budget(width: int = CHART_WIDTH):
+    """Points per trace worth sending for a chart `width` pixels wide; None means no limit."""
+    return width * POINTS_PER_PIXEL if width else None
+
+def downsampled(x, y, width: int = CHART_WIDTH, method: str = 'lttb'):
+    """(x, y) of a trace reduced to the point budget of the chart width, see modules/downsample.py."""
+    budget = point_budget(width)
+    if budget is None or len(y) <= budget:
+        return x, y
+    with span('figures.downsample'):
+        return downsample.downsample(x, y, budget, method)
+
+def zoom_range(container, dates, key: str, width: int = CHART_WIDTH):
+    """
+    Date range slider for charts whose series are longer than the point budget.
+
+    Plotly's zoom happens in the browser on the points that were sent, so zooming in is
+    done with this slider instead: the chart is re-rendered for the chosen range, at
+    full resolution once the range fits the budget. Returns (start, end), or None when
+    the whole range is shown (or the series fits and no slider is drawn).
+
+    Example:
+    window = hlp.zoom_range(col, df['DATE'], 'zoom_kpi')
+    fig = hlp.draw_multiple_graphs(hlp.date_window(df, window), ['KPI'])
+    """
+    budget = point_budget(width)
+    if budget is None or len(dates) <= budget:
+        return None
+    first, last = pd.Timestamp(np.min(dates)).to_pydatetime(), pd.Timestamp(np.max(dates)).to_pydatetime()
+    start, end = container.slider('Date range', min_value=first, max_value=last, value=(first, last), key=key, format='YYYY-MM-DD')
+    if (start, end) == (first, last):
+        return None
+    return pd.Timestamp(start), pd.Timestamp(end)
+
+def date_window(df: pd.DataFrame, window) -> pd.DataFrame:
+    """Rows of df with DATE within a zoom_range window; df itself when window is None."""
+    if window is None:
+        return df
+    return df[(df['DATE'] >= window[0]) & (df['DATE'] <= window[1])]
+
+@timed('figures.draw_multiple_graphs')
+def draw_multiple_graphs(df: pd.DataFrame, columns: list[str], width: int = CHART_WIDTH) -> go.Figure:
         """
         Plots the specified columns of a Pandas dataframe using Plotly.
 
         Parameters:
         - df: Pandas dataframe containing the data to plot.
         - columns: List of column labels to plot.
+        - width: Chart width in pixels the traces are downsampled for (None sends every point).
 
         Returns:
         - Plotly Figure object containing the plotted data.
@@ -93,9 +343,11 @@ def draw_multiple_graphs(df: pd.DataFrame, columns: list[str]) -> go.Figure:
         Example:
         draw_multiple_graphs(df, ['PPSM', 'SMA'])
         """
+        import plotly.graph_objects as go
         fig = go.Figure()
         for column in columns:
-            fig.add_trace(go.Scatter(x=df['DATE'], y=df[column], name=column))
+            x, y = downsampled(df['DATE'].to_numpy(), df[column].to_numpy(), width)
+            fig.add_trace(go.Scatter(x=x, y=y, name=column))
         return fig
 
 def update_colors_multiple_graphs(colors: list[str], fig: go.Figure):
@@ -106,6 +358,7 @@ def update_colors_multiple_graphs(colors: list[str], fig: go.Figure):
         print("Warning: The number of traces doesn't match the number of colors.")
 
 def draw_line(df: pd.DataFrame, x_data: str, y_data: str, graph_title:str, x_axis_title: str, y_axis_title: str):
+    import plotly.express as px
     fig = px.line(df, x=x_data, y=y_data, markers=True)
     fig.update_traces(hovertemplate=None)
     fig.update_layout(
@@ -120,6 +373,7 @@ def draw_line(df: pd.DataFrame, x_data: str, y_data: str, graph_title:str, x_axi
     return fig
 
 def draw_histogram(df: pd.DataFrame, title: str, x_data: str, y_data: str, mean_value_trace=None):
+    import plotly.graph_objects as go
     fig = go.Figure(
         data=[go.Bar(x=df[x_data], y=df[y_data])], 
         layout_title_text=title)
@@ -131,6 +385,7 @@ def draw_histogram(df: pd.DataFrame, title: str, x_data: str, y_data: str, mean_
 
 
 def draw_distribution_bar(df: pd.DataFrame, x_axis: str, y_axis: str, y1_axis: str, title:str):
+    import plotly.graph_objects as go
     fig = go.Figure()
     fig.add_trace(go.Bar(x=df[x_axis],
                     y=df[y_axis],
@@ -166,6 +421,7 @@ def draw_distribution_bar(df: pd.DataFrame, x_axis: str, y_axis: str, y1_axis: s
     return fig
 
 def draw_horizontal_bar(df: pd.DataFrame, x_axis: str, date_column: str, y1_axis:str, title:str):
+    import plotly.graph_objects as go
     fig = go.Figure()
     fig.add_trace(go.Bar(x=df[x_axis],
                     y=df[date_column],
@@ -199,6 +455,7 @@ def draw_horizontal_bar(df: pd.DataFrame, x_axis: str, date_column: str, y1_axis
     return fig
                
 def create_scatter_1(df: pd.DataFrame, date_column:str, columns: list[str]) -> go.Figure:
+    import plotly.graph_objects as go
     data = []
     colors = ['red', 'blue', 'green', 'orange']
     for i, col in enumerate(columns):
@@ -208,11 +465,23 @@ def create_scatter_1(df: pd.DataFrame, date_column:str, columns: list[str]) -> g
     return fig
 
 def draw_chart_bar(df: pd.DataFrame, x_data: str, y_data, title: str):
+    import plotly.express as px
     fig = px.bar(df, x=x_data, y=y_data, title=title)
     avg_line = px.line(df, x=x_data, y=df[y_data].mean())
     fig.add_traces(avg_line.data)
     return fig
 
+def draw_heatmap(df: pd.DataFrame, title: str, zmin: float = -1, zmax: float = 1):
+    """Heatmap of a matrix-shaped frame, e.g. a correlation matrix, with values printed in the cells."""
+    import plotly.graph_objects as go
+    fig = go.Figure(data=go.Heatmap(
+        z=df.to_numpy(), x=list(df.columns), y=list(df.index),
+        zmin=zmin, zmax=zmax, colorscale='RdBu', reversescale=True,
+        text=np.round(df.to_numpy(), 2), texttemplate='%{text}'))
+    fig.update_layout(title=title, yaxis_autorange='reversed')
+    return fig
+
+@timed('data.transform_dtype')
 def transform_dtype(df: pd.DataFrame, column_to_change: str):
     df[column_to_change] = df[column_to_change].str.replace(',', '.')
     df[column_to_change] = pd.to_numeric(df[column_to_change])
@@ -221,12 +490,14 @@ def transform_date(df: pd.DataFrame, column_to_transform: str):
     df[column_to_transform] = pd.to_datetime(df[column_to_transform])
 
 def draw_piechart(df: pd.DataFrame, color_palette):
+    import plotly.graph_objects as go
     nos_columns = ['CE_NOS', 'C_NOS', 'FO_NOS', 'HY_NOS', 'KB_NOS', 'LB_NOS', 'RGH_NOS', 'SI_NOS', 'VI_NOS', 'MMA_NOS']
     nos_values = df[nos_columns].sum().tolist()
     fig = go.Figure(data=[go.Pie(labels=nos_columns, values=nos_values, marker=color_palette)])
     return fig
 
 def draw_pie(df: pd.DataFrame, columns: list, info_dict: dict, colors):
+    import plotly.graph_objects as go
     labels = list(info_dict.keys())
     values = df[columns].sum().tolist()
     fig = go.Figure(data=[go.Pie(labels=labels, values=values, marker={'colors':colors})])
@@ -234,16 +505,28 @@ def draw_pie(df: pd.DataFrame, columns: list, info_dict: dict, colors):
 
 
 class Visualize:
-    def __init__(self, df: pd.DataFrame, color_theme: list[str]):
+    def __init__(self, df: pd.DataFrame, color_theme: list[str], store: DistrictStore = None):
         self.df = df
         self.color_theme = color_theme
+        self.store = store or DistrictStore(df)
 
-    def draw_scatter_plots(self, columns: list[str], type: str) -> go.Figure:
+    def draw_scatter_plots(self, columns: list[str], type: str, df: pd.DataFrame = None, width: int = CHART_WIDTH,
+                           forecast: pd.DataFrame = None) -> go.Figure:
+        """
+        forecast is an optional frame from Forecasts.frame(); columns it covers get their
+        forecast as a dashed line with the prediction interval as a band (lines only).
+        """
+        import plotly.graph_objects as go
+        # df lets callers plot a derived frame, e.g. Calculations.sma(), instead of self.df
+        df = self.df if df is None else df
+        dates = df['DATE'].to_numpy()
         data = []
         if type == 'markers':
             for i, col in enumerate(columns):
+                # Cluster points keep their extremes rather than the line shape
+                x, y = downsampled(dates, df[col].to_numpy(), width, method='minmax')
                 trace = go.Scatter(
-                    x=self.df[col], y=self.df['DATE'],
+                    x=y, y=x,
                     mode=f'{type}', 
                     name=col, 
                     marker={'color': self.color_theme[i]})
@@ -251,31 +534,88 @@ class Visualize:
             fig = go.Figure(data=data)
         else:
             for i, col in enumerate(columns):
+                x, y = downsampled(dates, df[col].to_numpy(), width)
                 trace = go.Scatter(
-                    x=self.df['DATE'], y=self.df[col],
+                    x=x, y=y,
                     mode=f'{type}', 
                     name=col, 
                     marker={'color': self.color_theme[i]})
                 data.append(trace)
+            if forecast is not None:
+                data += self.forecast_traces(columns, forecast)
             fig = go.Figure(data=data)     
         fig.update_layout(hovermode='x unified')     
         return fig
 
+    def forecast_traces(self, columns: list[str], forecast: pd.DataFrame) -> list:
+        import plotly.graph_objects as go
+        dates = forecast['DATE'].to_numpy()
+        traces = []
+        for i, col in enumerate(columns):
+            if col not in forecast:
+                continue
+            traces.append(go.Scatter(
+                x=np.concatenate([dates, dates[::-1]]),
+                y=np.concatenate([forecast[f'{col}_UPPER'].to_numpy(), forecast[f'{col}_LOWER'].to_numpy()[::-1]]),
+                fill='toself', fillcolor=self.color_theme[i], opacity=0.2, line={'width': 0},
+                hoverinfo='skip', showlegend=False, name=f'{col} interval'))
+            traces.append(go.Scatter(
+                x=dates, y=forecast[col].to_numpy(), mode='lines', name=f'{col} forecast',
+                line={'color': self.color_theme[i], 'dash': 'dash'}))
+        return traces
+
     def draw_box_1plots(self, district_key: str):
-        fig = subplots.make_subplots(1, 4)
-        fig.add_trace(px.box(self.df, y=f"{district_key}_PPSM1R"), row=1, col=1)
-        fig.add_trace(px.box(self.df, y=f"{district_key}_PPSM2R"), row=1, col=2)
-        fig.add_trace(px.box(self.df, y=f"{district_key}_PPSM1R"), row=1, col=3)
-        fig.add_trace(px.box(self.df, y=f"{district_key}_PPSM2R"), row=1, col=4)
+        return self.draw_box_subplots(district_key)
+
+    def draw_box_subplots(self, district_key: str, quartiles: bool = False) -> go.Figure:
+        """
+        Draws the box plots of all room-count series of a district as one figure with a subplot per series.
+
+        The values come straight from the DistrictStore and the district's PPSM mean is computed
+        once and drawn across every subplot. With quartiles=True, only the precomputed box
+        statistics are sent to the browser instead of every data point.
 
+        Example:
+        visualize.draw_box_subplots('HY', quartiles=True)
+        """
+        import plotly.graph_objects as go
+        import plotly.subplots as subplots
+        rows = [self.store.index[(district_key, 'PPSM', rooms)] for rooms in ROOMS]
+        values = self.store.values[rows]
+        names = [self.store.column(district_key, 'PPSM', rooms) for rooms in ROOMS]
+        ppsm_mean = self.store.series(district_key, 'PPSM').mean()
+
+        fig = subplots.make_subplots(1, len(ROOMS), subplot_titles=names)
+        if quartiles:
+            q1, median, q3 = np.nanpercentile(values, [25, 50, 75], axis=1)
+            iqr = q3 - q1
+            lower = np.where(values >= (q1 - 1.5*iqr)[:, None], values, np.nan)
+            upper = np.where(values <= (q3 + 1.5*iqr)[:, None], values, np.nan)
+            lower_fences = np.nanmin(lower, axis=1)
+            upper_fences = np.nanmax(upper, axis=1)
+        for i, name in enumerate(names):
+            if quartiles:
+                trace = go.Box(
+                    x=[name], q1=[q1[i]], median=[median[i]], q3=[q3[i]],
+                    lowerfence=[lower_fences[i]], upperfence=[upper_fences[i]],
+                    name=name, marker=dict(color=self.color_theme[i]))
+            else:
+                trace = go.Box(y=values[i], name=name, boxpoints='all', marker=dict(color=self.color_theme[i]))
+            fig.add_trace(trace, row=1, col=i + 1)
+        fig.add_hline(y=ppsm_mean, line_dash="dot",
+                  annotation_text=f"{district_key}_PPSM mean value",
+                  annotation_position="bottom right",
+                  row='all', col='all')
+        fig.update_layout(showlegend=False)
         return fig
     def draw_box_plots(self, district_key: str):
-        columns = [f"{district_key}_PPSM1R", f"{district_key}_PPSM2R", f"{district_key}_PPSM3R", f"{district_key}_PPSM4PR"]
-        data = [go.Box(y=self.df[column], name=column) for column in columns]
+        import plotly.graph_objects as go
+        data = [go.Box(y=self.store.series(district_key, 'PPSM', rooms), name=self.store.column(district_key, 'PPSM', rooms)) for rooms in ROOMS]
         fig = go.Figure(data=data)
         return fig
     
     def draw_metrics(self, sum_info, columns):
+        from streamlit_extras.metric_cards import style_metric_cards
         j = 0
         for i in range(len(sum_info)):
           for column in columns:
@@ -291,7 +631,7 @@ class Visualize:
         style_metric_cards()
 
     def set_color(self, district_key, y):
-        reference = self.df[f'{district_key}_NOS'].mean()
+        reference = self.store.series(district_key, 'NOS').mean()
         if(y >= 2*reference):
             return "#00BFA0"
         elif(y >= reference):
@@ -300,12 +640,13 @@ class Visualize:
             return "#E60049"
 
     def draw_horizontal_bar(self, district_key: str, color):
+        import plotly.graph_objects as go
         fig = go.Figure(
             data=[go.Bar(
-                x=self.df[f'{district_key}_NOS'],
-                y=self.df['DATE'],
+                x=self.store.series(district_key, 'NOS'),
+                y=self.store.dates,
                 orientation='h',
-                name=f'{district_key}_NOS',
+                name=self.store.column(district_key, 'NOS'),
                 marker=dict(color=f'{color}'
                #marker=dict(color = list(map(self.set_color, district_key, self.df[f'{district_key}_NOS']))
                 ))]
@@ -313,6 +654,7 @@ class Visualize:
         return fig
     
     def draw_bar(self, district_key: str):
+        import plotly.express as px
         month_dict = {
             1: 'Jan',
             2: 'Feb',
@@ -328,15 +670,12 @@ class Visualize:
             12: 'Dec'
             }
 
-        self.df['DATE'] = pd.to_datetime(self.df['DATE'])
-        self.df['MONTH'] = self.df['DATE'].dt.month
-        self.df['YEAR'] = self.df['DATE'].dt.month
-        columns = ['YEAR', 'MONTH', f'{district_key}']
-        df_new = self.df[columns]
-        monthly_sums = df_new.groupby(columns[:2])[f'{district_key}'].sum()
+        column = f'{district_key}_NOS'
+        df_new = year_month_frame(self.df, [column])
+        monthly_sums = df_new.groupby(['YEAR', 'MONTH'])[column].sum()
         monthly_sums = monthly_sums.reset_index()
         monthly_sums['MONTH'] = monthly_sums['MONTH'].map(month_dict)
-        fig = px.bar(monthly_sums,x='MONTH',y=f'{district_key}_NOS',title='Total Sales of Apartment by month' ,color_discrete_sequence=px.colors.sequential.Plasma)
+        fig = px.bar(monthly_sums,x='MONTH',y=column,title='Total Sales of Apartment by month' ,color_discrete_sequence=px.colors.sequential.Plasma)
         fig.update_traces(texttemplate='%{text:.2s}', textposition='outside')
         fig.update_layout(uniformtext_minsize=8, uniformtext_mode='hide')
 
@@ -358,6 +697,27 @@ REAL_ESTATE_INDEX_DESCRIPTION = 'A real estate index is a statistical measure th
 KPI_DESCRIPTION = 'The consumer price index (KPI) is a measure of the average change over time in the prices paid by consumers for a basket of goods and services. It is calculated by taking the cost of a fixed basket of goods and services at a given time and comparing it to the cost of the same basket in a base year. The KPI is commonly used to measure inflation, as it shows the overall change in prices that consumers are paying for goods and services. The consumer price index at fixed rate (KPIF) is a variant of the KPI that is used to measure inflation in the eurozone (the 19 European Union countries that have adopted the euro as their currency). Like the KPI, the KPIF measures the change in the prices paid by consumers for a basket of goods and services over time. However, the basket of goods and services used to calculate the KPIF is fixed in terms of the amount of each item consumed, rather than the amount of money spent on each item. This means that the KPIF takes into account changes in the prices of goods and services as well as changes in the quantities consumed. To interpret the KPI or the KPIF, it is important to consider the specific basket of goods and services being measured and the time frame being considered. For example, a KPI that measures the prices of goods and services consumed by urban households may show a different trend than a KPI that measures the prices of goods and services consumed by rural households.There are some differences between the KPI and the KPIF. The most significant difference is that the KPIF takes into account changes in the quantities of goods and services consumed, while the KPI does not. In addition, the KPIF is specific to the eurozone, while the KPI can be used to measure inflation in any country.'
 HOW_TO_USE_DESCRIPTION = "On the home page, you'll find some general information about Malmö's housing market and Swedish inflation. This page is a good starting point for getting an overview of the current market conditions. To dive deeper into the data, head over to the Data Analyser page. Here, you can browse through a variety of graphs and charts that visualize the housing market data in different ways. Use the navigation buttons to switch between different views and customize the data being displayed. As you explore the data, try to draw your own conclusions about the trends and patterns you see. The data visualizations are a powerful tool for understanding the housing market and making informed decisions. I hope you enjoy using our web app and find it helpful in your analysis of the housing market! If you have any questions or feedback, don't hesitate to contact us."
 
+# Datasets shared by all pages
+HOUSING_DATA = ImportData('housing_data.csv', date_format='%m-%Y')
+INFLATION_DATA = ImportData('inflation_rate.csv', date_format='%Y-%m-%d')
+REAL_ESTATE_INDEX_DATA = ImportData('real_estate_index.csv', date_format='%Y')
+
+# City districts shown on the Data Analysis page and their column prefixes
+DISTRICTS = {
+    'Centrum':'C',
+    'Fosie-Oxie':'FO',
+    'Hyllie':'HY',
+    'Kirseberg':'KB',
+    'Limhamn-Bunkeflo':'LB',
+    'Rosengård-Husie':'RGH',
+    'Södra Innerstaden':'SI',
+    'Västra Innerstaden':'VI'
+}
+DISTRICT_NAMES = {key: name for name, key in DISTRICTS.items()}
+
+# Room-count classes of the PPSMxR series
+ROOMS = ['1R', '2R', '3R', '4PR']
+
 ##COLORS
 palette = ['rgb(255, 173, 173)','rgb(255, 214, 165)','rgb(253, 255, 182)','rgb(202, 255, 191)','rgb(155, 246, 255)','rgb(160, 196, 255)','rgb(189, 178, 255)','rgb(255, 198, 255)']
 GRAPH_COLORS_4 = ['#000000', '#2a9d8f', '#eb5e28', '#c1121f']
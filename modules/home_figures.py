@@ -0,0 +1,58 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+from modules import helper_functions as hlp
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+# Charts of the Home page, in the order they are drawn
+HOME_CHART_IDS = ['map', 'rei', 'kpi']
+
+
+def rei_figure(window=None, real: bool = False) -> go.Figure:
+    """Real Estate Index of the Swedish regions; real deflates it by the KPI (see modules/deflator.py)."""
+    df, title = hlp.REAL_ESTATE_INDEX_DATA.load(), 'Real Estate Index (REI) in Sweden from 1970-'
+    if real:
+        from modules.deflator import RealPrices
+        prices = RealPrices.from_datasets(hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+        df, title = prices.rei, f'Real Estate Index (REI) in Sweden from 1980-, {prices.label}'
+    fig = hlp.draw_multiple_graphs(hlp.date_window(df, window), df.columns[1:])
+    fig.update_layout(
+        title=title,
+        xaxis_title = 'DATE',
+        yaxis_title = 'REI',
+        font_family="Courier New",
+        title_font_family="Times New Roman",
+        hovermode='x unified')
+    return fig
+
+
+def kpi_figure(window=None) -> go.Figure:
+    df_inflation = hlp.INFLATION_DATA.load()
+    fig = hlp.draw_multiple_graphs(hlp.date_window(df_inflation, window),['KPIF',"KPI"])
+    fig.update_layout(
+        title='Consumer Price Index w/o fixed rate, KPIF & KPI',
+        xaxis_title = 'DATE',
+        yaxis_title = 'in %',
+        font_family="Courier New",
+        title_font_family="Times New Roman",
+        hovermode='x unified')
+    fig.data[0].update(marker={
+    'color': '#463f3a'
+    })
+    fig.data[1].update(marker={
+        'color':'#2a9d8f'
+    })
+    return fig
+
+
+def figure(chart_id: str) -> go.Figure:
+    """Home chart by id, as shown before any option is changed."""
+    if chart_id == 'map':
+        from modules.geography import map_figure
+        return map_figure('PPSM', hlp.CHART_WIDTH, 450)
+    elif chart_id == 'rei':
+        return rei_figure()
+    elif chart_id == 'kpi':
+        return kpi_figure()
+    raise ValueError(f'Unknown chart id: {chart_id}')
@@ -0,0 +1,193 @@
+import os
+import numpy as np
+import pandas as pd
+from modules.precompute import SMA_WINDOWS, SUMMARY_MONTHS, Precomputed, monthly_sums
+from modules.store import ALL_ROOMS, DistrictStore, parse_column
+
+STATE_FILE = 'rolling_state.npz'
+
+
+def appended_months(previous: DistrictStore, store: DistrictStore):
+    """Number of months store adds after previous; None when it changes or drops an earlier month or series."""
+    n = len(previous.dates)
+    if previous.keys != store.keys or len(store.dates) < n:
+        return None
+    if not np.array_equal(previous.dates, store.dates[:n]):
+        return None
+    if not np.array_equal(previous.values, store.values[:, :n], equal_nan=True):
+        return None
+    return len(store.dates) - n
+
+
+class RollingState:
+    """
+    Running window sums of every housing series, updated in O(windows) per appended month.
+
+    Keeps the last max(window) + 1 values of each series in a ring buffer together with
+    per-window sums and counts and the all-time sum and count, so the SMA values, the
+    summary figures and the series means behind the mean lines are available for the
+    latest month without going back over the history.
+
+    Example:
+    state = RollingState.from_frame(df)
+    state.append('2023-01', {'HY_PPSM': 27100, 'HY_NOS': 81, ...})
+    state.summary('HY', [3, 6, 12])
+    """
+
+    def __init__(self, columns: list[str], windows: list[int] = None):
+        self.columns = list(columns)
+        self.keys = [parse_column(column) for column in self.columns]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.windows = sorted(set(windows or SMA_WINDOWS + SUMMARY_MONTHS))
+        self.capacity = max(self.windows) + 1
+        n = len(self.columns)
+        self.buffer = np.full((n, self.capacity), np.nan)
+        self.position = 0
+        self.length = 0
+        self.sums = np.zeros((len(self.windows), n))
+        self.counts = np.zeros((len(self.windows), n), dtype=np.int64)
+        self.total_sums = np.zeros(n)
+        self.total_counts = np.zeros(n, dtype=np.int64)
+        self.last_date = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, windows: list[int] = None) -> 'RollingState':
+        columns = [column for column in df.columns if parse_column(column) is not None]
+        state = cls(columns, windows)
+        values = df[columns].to_numpy(dtype=float)
+        for date, row in zip(df['DATE'].to_numpy(), values):
+            state.append_values(date, row)
+        return state
+
+    def append_values(self, date, values: np.ndarray) -> None:
+        """Adds one month given as an array aligned with self.columns (NaN for missing values)."""
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        entering = np.where(valid, values, 0.0)
+        for j, window in enumerate(self.windows):
+            if self.length >= window:
+                leaving = self.buffer[:, (self.position - window) % self.capacity]
+                leaving_valid = ~np.isnan(leaving)
+                self.sums[j] -= np.where(leaving_valid, leaving, 0.0)
+                self.counts[j] -= leaving_valid
+            self.sums[j] += entering
+            self.counts[j] += valid
+        self.total_sums += entering
+        self.total_counts += valid
+        self.buffer[:, self.position] = values
+        self.position = (self.position + 1) % self.capacity
+        self.length += 1
+        self.last_date = np.datetime64(date, 'ns')
+
+    def describes(self, store: DistrictStore) -> bool:
+        """Whether the state holds the series of store and ends with its last month."""
+        return (set(self.keys) == set(store.keys) and self.length == len(store.dates)
+                and self.last_date == np.datetime64(store.dates[-1], 'ns'))
+
+    def extend(self, store: DistrictStore, previous: Precomputed = None) -> Precomputed:
+        """
+        Appends the months of store after the state's last one. Given the Precomputed
+        tables of the months before, returns those of store: the SMA of each appended
+        month and the summaries are read from the window sums, and the monthly totals
+        add up, so nothing is recomputed over the history.
+        """
+        start = self.length
+        rows = np.array([self.index[key] for key in store.keys])
+        windows = previous.windows if previous is not None else []
+        tails = {window: np.empty((len(rows), len(store.dates) - start), dtype=store.values.dtype) for window in windows}
+        values = np.full(len(self.columns), np.nan)
+        for month, position in enumerate(range(start, len(store.dates))):
+            values[rows] = store.values[:, position]
+            self.append_values(store.dates[position], values)
+            for window, tail in tails.items():
+                tail[:, month] = self.sma(window)[rows]
+        if previous is None:
+            return None
+        sma = {window: np.concatenate([previous.sma[window], tails[window]], axis=1) for window in windows}
+        means, sums, pct_differences = self.trailing_summary(previous.months)
+        monthly = previous.monthly + monthly_sums(store.values[:, start:], store.dates[start:])
+        return Precomputed.from_tables(store, sma, previous.months, (means[:, rows], sums[:, rows], pct_differences[:, rows]), monthly)
+
+    def append(self, date, row: dict) -> None:
+        """Adds one month given as {column: value}; columns missing from row count as missing values."""
+        self.append_values(date, [row.get(column, np.nan) for column in self.columns])
+
+    def _row(self, district: str, metric: str, rooms: str = ALL_ROOMS) -> int:
+        return self.index[(district, metric, rooms)]
+
+    def value(self, months_back: int = 0) -> np.ndarray:
+        """Values of all series months_back months before the latest one."""
+        if months_back >= min(self.length, self.capacity):
+            return np.full(len(self.columns), np.nan)
+        return self.buffer[:, (self.position - 1 - months_back) % self.capacity]
+
+    def sma(self, window: int) -> np.ndarray:
+        """Latest SMA of all series, NaN where the window is not full of valid values."""
+        j = self.windows.index(window)
+        with np.errstate(invalid='ignore'):
+            return np.where(self.counts[j] == window, self.sums[j] / window, np.nan)
+
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.total_sums / self.total_counts
+
+    def trailing_summary(self, months: list[int]):
+        """The tables of precompute.trailing_summary for the latest month, each (len(months), columns)."""
+        positions = [self.windows.index(i) for i in months]
+        sums, counts = self.sums[positions], self.counts[positions]
+        last = self.value()
+        nth = np.stack([self.value(i) for i in months])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+            pct_differences = np.round((last - nth) / last * 100, 1)
+        return means, sums, pct_differences
+
+    def summary(self, district_key: str, months: list[int]):
+        """Same rows as Calculations.summary for the latest month."""
+        ppsm = self._row(district_key, 'PPSM')
+        nos = self._row(district_key, 'NOS')
+        means, sums, pct_differences = self.trailing_summary(months)
+        return [[f'{i} months', means[j, ppsm], int(sums[j, nos]), pct_differences[j, ppsm]] for j, i in enumerate(months)]
+
+    def save(self, directory: str, version: str) -> str:
+        """Writes the state next to the dataset snapshot, tagged with the dataset version it describes."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, STATE_FILE)
+        tmp_path = os.path.join(directory, 'rolling_state.tmp.npz')
+        np.savez(
+            tmp_path,
+            version=np.array(version),
+            columns=np.array(self.columns),
+            windows=np.array(self.windows),
+            buffer=self.buffer,
+            position=np.array(self.position),
+            length=np.array(self.length),
+            sums=self.sums,
+            counts=self.counts,
+            total_sums=self.total_sums,
+            total_counts=self.total_counts,
+            last_date=np.array(self.last_date if self.last_date is not None else np.datetime64('NaT', 'ns')),
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, directory: str, version: str = None) -> 'RollingState':
+        """Reads a saved state; returns None if there is none or it belongs to another dataset version."""
+        try:
+            with np.load(os.path.join(directory, STATE_FILE)) as data:
+                if version is not None and str(data['version']) != version:
+                    return None
+                state = cls(data['columns'].tolist(), data['windows'].tolist())
+                state.buffer = data['buffer']
+                state.position = int(data['position'])
+                state.length = int(data['length'])
+                state.sums = data['sums']
+                state.counts = data['counts']
+                state.total_sums = data['total_sums']
+                state.total_counts = data['total_counts']
+                last_date = data['last_date'][()]
+                state.last_date = None if np.isnat(last_date) else last_date
+        except (OSError, KeyError, ValueError):
+            return None
+        return state
@@ -0,0 +1,168 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the Prometheus histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_FILE_ENV = 'IN_MALMOE_METRICS_FILE'
+METRIC_NAME = 'in_malmoe_stage_duration_seconds'
+
+
+class Histogram:
+    """Bucketed durations of one stage plus a window of recent samples for p50/p99."""
+
+    def __init__(self, recent: int = 2048):
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=recent)
+
+    def observe(self, seconds: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.recent:
+            return float('nan')
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Instrumentation:
+    """
+    Named timing spans per rerun and session, aggregated into per-stage histograms.
+
+    A page calls start_rerun() at the top and finish_rerun() at the end; everything timed
+    with span() or @timed in between is attributed to that rerun. Spans outside a rerun
+    (e.g. background warm-up) only feed the histograms. When IN_MALMOE_METRICS_FILE is
+    set, the histograms are written there in the Prometheus text format after reruns.
+
+    Example:
+    with span('figures.build'):
+        fig = build()
+    """
+
+    def __init__(self, reruns: int = 200, write_interval: float = 10.0):
+        self.histograms = {}
+        self.reruns = deque(maxlen=reruns)
+        self.write_interval = write_interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        rerun = getattr(self._local, 'rerun', None)
+        if rerun is not None:
+            rerun['spans'].append((stage, seconds))
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str):
+        """Decorator form of span()."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def start_rerun(self, page: str) -> None:
+        self._local.rerun = {
+            'page': page,
+            'session': _session_id(),
+            'started': time.time(),
+            'start': time.perf_counter(),
+            'spans': [],
+        }
+
+    def finish_rerun(self) -> None:
+        rerun = getattr(self._local, 'rerun', None)
+        if rerun is None:
+            return
+        self._local.rerun = None
+        rerun['total'] = time.perf_counter() - rerun.pop('start')
+        self.observe(f'rerun.{rerun["page"]}', rerun['total'])
+        with self._lock:
+            self.reruns.append(rerun)
+        self.maybe_write_prometheus()
+
+    def summary(self) -> list[dict]:
+        """count, mean, p50 and p99 per stage, slowest p99 first."""
+        with self._lock:
+            rows = [{
+                'stage': stage,
+                'count': histogram.count,
+                'mean_ms': histogram.sum / histogram.count * 1000,
+                'p50_ms': histogram.quantile(0.5) * 1000,
+                'p99_ms': histogram.quantile(0.99) * 1000,
+            } for stage, histogram in self.histograms.items()]
+        return sorted(rows, key=lambda row: row['p99_ms'], reverse=True)
+
+    def prometheus_text(self) -> str:
+        lines = [
+            f'# HELP {METRIC_NAME} Duration of the app\'s hot-path stages.',
+            f'# TYPE {METRIC_NAME} histogram',
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def maybe_write_prometheus(self) -> None:
+        path = os.environ.get(METRICS_FILE_ENV)
+        now = time.monotonic()
+        if not path or now - self._last_write < self.write_interval:
+            return
+        self._last_write = now
+        self.write_prometheus(path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.reruns.clear()
+
+
+def _session_id() -> str:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+INSTRUMENTATION = Instrumentation()
+span = INSTRUMENTATION.span
+timed = INSTRUMENTATION.timed
@@ -0,0 +1,143 @@
+"""
+Compact dtypes for the datasets and a report of what the process keeps in memory.
+
+In compact mode (IN_MALMOE_COMPACT_DTYPES=1) the datasets are held as int32 counts and
+indices, float32 prices and rates, datetime64 dates and categorical text, roughly halving
+the frames and every table derived from them. Columns read from a snapshot are
+memory-mapped and shared by the worker processes on a machine, so the report lists
+them apart from the bytes private to this process.
+"""
+import mmap
+import os
+import numpy as np
+import pandas as pd
+from modules.store import parse_column
+
+COMPACT_ENV = 'IN_MALMOE_COMPACT_DTYPES'
+COUNT_METRICS = {'NOS'}
+INT32 = np.iinfo(np.int32)
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns df with compact dtypes; columns that already have them are not copied.
+
+    Count columns (NOS) become int32 when they have no missing values and other housing
+    series float32 (exact for whole prices up to 16 million). In the other datasets
+    integers become int32 and floats float32. Text becomes categorical and DATE datetime64.
+    """
+    data = {}
+    for column in df.columns:
+        values = df[column]
+        key = parse_column(column)
+        if column == 'DATE' or pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values)
+        elif pd.api.types.is_bool_dtype(values):
+            pass
+        elif pd.api.types.is_numeric_dtype(values):
+            # Housing series: only counts are integers; other whole numbers such as the index keep their kind
+            integer = key[1] in COUNT_METRICS if key is not None else pd.api.types.is_integer_dtype(values)
+            if integer and _fits_int32(values.to_numpy()):
+                values = values.astype(np.int32, copy=False)
+            else:
+                values = values.astype(np.float32, copy=False)
+        elif values.dtype == object:
+            values = values.astype('category')
+        data[column] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def _fits_int32(array: np.ndarray) -> bool:
+    if array.size == 0:
+        return True
+    if np.issubdtype(array.dtype, np.floating) and (np.isnan(array).any() or (array != np.round(array)).any()):
+        return False
+    return INT32.min <= array.min() and array.max() <= INT32.max
+
+
+def is_mapped(array) -> bool:
+    """True when the array's memory comes from a memory-mapped file."""
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def nbytes(obj) -> tuple[int, int]:
+    """(private, mapped) bytes of an array, frame or a nesting of lists, tuples and dicts of them."""
+    private = mapped = 0
+    if isinstance(obj, pd.DataFrame):
+        for column in obj.columns:
+            p, m = nbytes(obj[column])
+            private, mapped = private + p, mapped + m
+    elif isinstance(obj, pd.Series):
+        array = obj.to_numpy() if not isinstance(obj.dtype, pd.CategoricalDtype) else None
+        if array is not None and is_mapped(array):
+            mapped += array.nbytes
+        else:
+            private += int(obj.memory_usage(index=False, deep=True))
+    elif isinstance(obj, np.ndarray):
+        if is_mapped(obj):
+            mapped += obj.nbytes
+        else:
+            private += obj.nbytes
+    elif isinstance(obj, dict):
+        return nbytes(list(obj.values()))
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            p, m = nbytes(item)
+            private, mapped = private + p, mapped + m
+    return private, mapped
+
+
+def dtype_summary(df: pd.DataFrame) -> str:
+    """e.g. 'float32 x50, int32 x10, datetime64[ns] x1'"""
+    counts = df.dtypes.astype(str).value_counts()
+    return ', '.join(f'{dtype} x{count}' for dtype, count in counts.items())
+
+
+def rss() -> int:
+    """Resident set size of this process in bytes, or None where /proc is not available."""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def report() -> pd.DataFrame:
+    """One row per loaded dataset and per cached derived table of this process."""
+    from modules import helper_functions as hlp
+    from modules.comparison import Comparison
+    from modules.deflator import RealPrices
+    from modules.figure_cache import FIGURE_CACHE
+    from modules.forecast import Forecasts
+    from modules.precompute import Precomputed
+    from modules.store import DistrictStore
+
+    rows = []
+    for path, (_, version, df) in list(hlp.ImportData._cache.items()):
+        private, mapped = nbytes(df)
+        rows.append({'table': os.path.basename(path), 'kind': 'dataset', 'version': version[:12],
+                     'shape': f'{df.shape[0]} x {df.shape[1]}', 'dtypes': dtype_summary(df), 'private': private, 'mapped': mapped})
+
+    derived = [
+        (DistrictStore, lambda store: [store.dates, store.values, store.metric_values]),
+        (Precomputed, lambda pre: [pre.sma, pre.means, pre.sums, pre.pct_differences, pre.monthly]),
+        (Comparison, lambda comparison: list(comparison._results.values())),
+        (Forecasts, lambda forecasts: [forecasts.mean, forecasts.lower, forecasts.upper, forecasts.alpha, forecasts.coefficients, forecasts.mse]),
+        (RealPrices, lambda real: [real.df, real.rei, real.store.values, real.store.metric_values, real.precomputed.sma,
+                                   real.precomputed.means, real.forecasts.mean, real.forecasts.lower, real.forecasts.upper]),
+    ]
+    for cls, parts in derived:
+        for key, obj in list(cls._cache.items()):
+            private, mapped = nbytes(parts(obj))
+            rows.append({'table': f'{cls.__name__} ({os.path.basename(key[0])})', 'kind': 'derived', 'version': key[1][:12],
+                         'shape': '', 'dtypes': '', 'private': private, 'mapped': mapped})
+    rows.append({'table': 'Figure cache', 'kind': 'derived', 'version': '', 'shape': f'{len(FIGURE_CACHE)} figures',
+                 'dtypes': 'JSON', 'private': FIGURE_CACHE.size, 'mapped': 0})
+    return pd.DataFrame(rows, columns=['table', 'kind', 'version', 'shape', 'dtypes', 'private', 'mapped'])
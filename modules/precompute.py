@@ -0,0 +1,141 @@
+import threading
+import numpy as np
+from modules.instrumentation import span
+from modules.store import ALL_ROOMS, DistrictStore
+
+SMA_WINDOWS = [3, 6, 12]
+SUMMARY_MONTHS = [3, 6, 12]
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def rolling_means(values: np.ndarray, windows: list[int]) -> dict[int, np.ndarray]:
+    """
+    Trailing means of every row of a 2D array for all windows from one cumulative sum.
+
+    Matches pandas' rolling(window).mean(): a position is NaN until a full window of
+    non-missing values is available. Sums are accumulated in float64 whatever the
+    dtype of values; the means have the dtype of values.
+    """
+    valid = ~np.isnan(values)
+    sums = np.zeros((values.shape[0], values.shape[1] + 1))
+    counts = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(np.where(valid, values, 0.0), axis=1, dtype=float, out=sums[:, 1:])
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+
+    means = {}
+    for window in windows:
+        result = np.full(values.shape, np.nan, dtype=values.dtype)
+        if window <= values.shape[1]:
+            window_sums = sums[:, window:] - sums[:, :-window]
+            window_counts = counts[:, window:] - counts[:, :-window]
+            result[:, window - 1:] = np.where(window_counts == window, window_sums / window, np.nan)
+        means[window] = result
+    return means
+
+
+def trailing_summary(values: np.ndarray, months: list[int]):
+    """
+    Mean, sum and price development (in % of the last value) over the last n months,
+    for every row of a 2D array and every n in months. Each result is (len(months), rows).
+
+    Like pandas' tail(n).mean() and .sum(), missing values are skipped: the mean is NaN
+    only when the whole window is missing and the sum is 0 then. The price development
+    is NaN when either of its two values is missing.
+    """
+    valid = ~np.isnan(values)
+    sums = np.stack([np.where(valid[:, -i:], values[:, -i:], 0.0).sum(axis=1, dtype=float) for i in months])
+    counts = np.stack([valid[:, -i:].sum(axis=1) for i in months])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+    last = values[:, -1].astype(float)
+    nth = np.stack([values[:, -i - 1] for i in months]).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct_differences = np.round((last - nth) / last * 100, 1)
+    return means, sums, pct_differences
+
+
+def monthly_sums(values: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """Totals per calendar month for every row of a 2D array, as a (12, rows) array."""
+    month_index = dates.astype('datetime64[M]').astype(np.int64) % 12
+    one_hot = (month_index[None, :] == np.arange(12)[:, None]).astype(float)
+    return one_hot @ np.nan_to_num(values).T
+
+
+class Precomputed:
+    """
+    Derived metrics for every series of a DistrictStore, computed in one batched pass.
+
+    Holds the SMA windows, the 3/6/12 month summaries and the monthly sales
+    distribution of all districts and room-counts, aligned with the store's rows,
+    so the page only has to look them up.
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, store: DistrictStore, windows: list[int] = SMA_WINDOWS, months: list[int] = SUMMARY_MONTHS):
+        self.store = store
+        self.windows = list(windows)
+        self.months = list(months)
+        self.sma = rolling_means(store.values, self.windows)
+        self.means, self.sums, self.pct_differences = trailing_summary(store.values, self.months)
+        self.monthly = monthly_sums(store.values, store.dates)
+
+    @classmethod
+    def from_tables(cls, store: DistrictStore, sma: dict, months: list[int], summary: tuple, monthly: np.ndarray) -> 'Precomputed':
+        """Metrics of store computed elsewhere, e.g. extended month by month by RollingState.extend."""
+        precomputed = cls.__new__(cls)
+        precomputed.store = store
+        precomputed.windows = list(sma)
+        precomputed.months = list(months)
+        precomputed.sma = sma
+        precomputed.means, precomputed.sums, precomputed.pct_differences = summary
+        precomputed.monthly = monthly
+        return precomputed
+
+    @classmethod
+    def cached(cls, dataset) -> 'Precomputed':
+        """Metrics of the current version of a dataset when this process has built them already, else None."""
+        return cls._cache.get((dataset.path, dataset.version))
+
+    @classmethod
+    def from_dataset(cls, dataset) -> 'Precomputed':
+        """Returns the precomputed metrics for the current version of an ImportData dataset."""
+        key = (dataset.path, dataset.version)
+        precomputed = cls._cache.get(key)
+        if precomputed is None:
+            with cls._lock:
+                precomputed = cls._cache.get(key)
+                if precomputed is None:
+                    store = DistrictStore.from_dataset(dataset)
+                    with span('calculations.precompute'):
+                        precomputed = cls(store)
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path}
+                    cls._cache[key] = precomputed
+        return precomputed
+
+    @classmethod
+    def install(cls, dataset, version: str, precomputed: 'Precomputed') -> None:
+        """Adds metrics built ahead for the next version of a dataset; the current version's stay until the one after."""
+        with cls._lock:
+            keep = {version, dataset.version}
+            cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path or k[1] in keep}
+            cls._cache[(dataset.path, version)] = precomputed
+
+    def _row(self, district: str, metric: str, rooms: str = ALL_ROOMS) -> int:
+        return self.store.index[(district, metric, rooms)]
+
+    def sma_series(self, district: str, metric: str, rooms: str, window: int) -> np.ndarray:
+        return self.sma[window][self._row(district, metric, rooms)]
+
+    def summary(self, district_key: str, months: list[int]):
+        """Same rows as Calculations.summary, read from the precomputed tables."""
+        ppsm = self._row(district_key, 'PPSM')
+        nos = self._row(district_key, 'NOS')
+        values = []
+        for i in months:
+            j = self.months.index(i)
+            values.append([f'{i} months', self.means[j, ppsm], int(self.sums[j, nos]), self.pct_differences[j, ppsm]])
+        return values
+
+    def monthly_distribution(self, district: str, metric: str, rooms: str = ALL_ROOMS) -> np.ndarray:
+        return self.monthly[:, self._row(district, metric, rooms)]
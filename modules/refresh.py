@@ -0,0 +1,226 @@
+"""
+Background refresh of the housing data.
+
+The next version of the dataset is built completely off the request path: the CSV is
+updated in a staged copy, parsed, compiled into a snapshot (kept next to the current
+one) and its DistrictStore, Precomputed tables and Forecasts are built. Only then is it published
+by swapping in the file and the cached entry together, so no rerun waits for a refresh
+or sees a half-written file. Other worker processes notice the new file on their next
+rerun and memory-map the snapshot that is already there.
+
+State a source keeps about what it fetched (the SCB validators) is staged the same way
+and only replaces the current state once the data it describes is published, so the
+data of a refresh that fails is fetched again by the next one.
+
+Usage:
+python -m modules.refresh                               # once, from SCB
+python -m modules.refresh --transactions sales/*.csv    # once, from raw sale records
+IN_MALMOE_REFRESH_INTERVAL=3600 streamlit run Home.py   # hourly, inside the app
+"""
+import argparse
+import functools
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from modules import helper_functions as hlp
+from modules import snapshot
+from modules.forecast import Forecasts
+from modules.instrumentation import span
+from modules.precompute import Precomputed
+from modules.store import DistrictStore
+
+INTERVAL_ENV = 'IN_MALMOE_REFRESH_INTERVAL'
+LOCK_FILE = 'refresh.lock'
+STAGED_SUFFIX = '.next'
+
+
+def staged(path: str) -> str:
+    """This process's staged copy of a file next to the dataset, moved over it when the refresh is published."""
+    return f'{path}.{os.getpid()}{STAGED_SUFFIX}'
+
+
+def scb_source(staged_path: str, base_url: str = None) -> bool:
+    """Updates the staged CSV from SCB; True when any table changed. The validators are staged as well."""
+    from modules.scb import SCBIngest
+
+    ingest = SCBIngest(staged_path, base_url=base_url)
+    summary = ingest.run()
+    if summary['errors'] and not summary.get('changed'):
+        raise RuntimeError(f'SCB refresh failed for {len(summary["errors"])} tables')
+    ingest.commit_state(staged(ingest.state_path))
+    return summary.get('changed', 0) > 0
+
+
+@contextmanager
+def _exclusive(path: str):
+    """Yields whether this process got the lock; only one process on the machine refreshes at a time."""
+    try:
+        import fcntl
+    except ImportError:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+class Refresher:
+    """
+    Builds and publishes new versions of a dataset, on demand or on a background thread.
+
+    source(staged_path) rewrites the staged copy of the CSV in place and returns whether
+    anything changed. Other files it stages with staged() next to the CSV are moved into
+    place once the data is current (published, or unchanged), and dropped when the
+    refresh fails.
+
+    Example:
+    REFRESHER.refresh()
+    """
+
+    def __init__(self, dataset: hlp.ImportData = hlp.HOUSING_DATA, source=scb_source):
+        self.dataset = dataset
+        self.source = source
+        self.last_run = None
+        self.last_version = None
+        self.last_error = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> str:
+        """Runs one refresh; returns the published version, or None when there was nothing new."""
+        with _exclusive(os.path.join(self.dataset.snapshot_dir, LOCK_FILE)) as acquired:
+            if not acquired:
+                return None
+            staged_path = staged(self.dataset.path)
+            shutil.copyfile(self.dataset.path, staged_path)
+            try:
+                if not self.source(staged_path):
+                    self._commit_staged()
+                    return None
+                with span('refresh.build'):
+                    version, df = self.dataset.parse_csv(staged_path)
+                    if version == self.dataset.version:
+                        self._commit_staged()
+                        return None
+                    snapshot.write_snapshot(df, self.dataset.snapshot_dir, version)
+                    df = snapshot.read_snapshot(self.dataset.snapshot_dir, version)
+                    store = DistrictStore(df)
+                    if self.dataset is hlp.HOUSING_DATA:
+                        precomputed = self._extend(df, store, version)
+                    else:
+                        precomputed = Precomputed(store)
+                    forecasts = Forecasts(store)
+                DistrictStore.install(self.dataset, version, store)
+                Precomputed.install(self.dataset, version, precomputed)
+                Forecasts.install(self.dataset, version, forecasts)
+                with span('refresh.publish'):
+                    self.dataset.publish(staged_path, version, df)
+                    self._commit_staged()
+                return version
+            finally:
+                for path in [staged_path] + self._staged_files():
+                    if os.path.exists(path):
+                        os.unlink(path)
+
+    def _staged_files(self) -> list[str]:
+        """Files other than the CSV that the source staged next to it in this process."""
+        directory = os.path.dirname(os.path.abspath(self.dataset.path))
+        suffix = f'.{os.getpid()}{STAGED_SUFFIX}'
+        csv_name = os.path.basename(self.dataset.path)
+        return [os.path.join(directory, name) for name in os.listdir(directory)
+                if name.endswith(suffix) and name != csv_name + suffix]
+
+    def _commit_staged(self) -> None:
+        """Moves the source's staged files into place, once the CSV they describe is current."""
+        suffix_length = len(f'.{os.getpid()}{STAGED_SUFFIX}')
+        for path in self._staged_files():
+            os.replace(path, path[:-suffix_length])
+
+    def _extend(self, df, store: DistrictStore, version: str) -> Precomputed:
+        """
+        Precomputed tables of the next version. When it only appends months to the current
+        one, the saved rolling state of the current version takes just those months, and
+        the tables this process already holds are extended from it; otherwise both are
+        built over the whole history. The state is saved for the next version either way.
+        """
+        from modules.incremental import RollingState, appended_months
+
+        previous = Precomputed.cached(self.dataset)
+        previous_store = previous.store if previous is not None else DistrictStore.from_dataset(self.dataset)
+        state = RollingState.load(self.dataset.snapshot_dir, self.dataset.version)
+        precomputed = None
+        if state is not None and state.describes(previous_store) and appended_months(previous_store, store) is not None:
+            with span('refresh.append'):
+                precomputed = state.extend(store, previous)
+        else:
+            state = RollingState.from_frame(df)
+        if precomputed is None:
+            precomputed = Precomputed(store)
+        state.save(self.dataset.snapshot_dir, version)
+        return precomputed
+
+    def _refresh_logged(self) -> None:
+        try:
+            version = self.refresh()
+            self.last_error = None
+            if version is not None:
+                self.last_version = version
+        except Exception as error:
+            self.last_error = f'{type(error).__name__}: {error}'
+        self.last_run = time.time()
+
+    def _loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self._refresh_logged()
+
+    def start(self, interval: float = None) -> None:
+        """
+        Refreshes every `interval` seconds on a daemon thread, once per process. Without an
+        interval this only happens when IN_MALMOE_REFRESH_INTERVAL is set.
+        """
+        interval = interval or float(os.environ.get(INTERVAL_ENV, 0))
+        if not interval:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, args=(interval,), name='data-refresh', daemon=True)
+            self._thread.start()
+
+
+REFRESHER = Refresher()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='PxWeb base URL, e.g. of modules/scb_stub.py')
+    parser.add_argument('--transactions', nargs='+', help='rebuild from these sale files instead of SCB (see modules/transactions.py)')
+    parser.add_argument('--workers', type=int, default=1, help='processes aggregating the sale files')
+    parser.add_argument('--interval', type=float, help='keep refreshing every INTERVAL seconds')
+    args = parser.parse_args()
+
+    if args.transactions:
+        from modules.transactions import transactions_source
+        source = functools.partial(transactions_source, paths=args.transactions, workers=args.workers)
+    else:
+        source = functools.partial(scb_source, base_url=args.url)
+    refresher = Refresher(source=source)
+    while True:
+        start = time.perf_counter()
+        version = refresher.refresh()
+        print(f'Published {version[:12]}' if version else 'Nothing new', f'({time.perf_counter() - start:.2f}s)')
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
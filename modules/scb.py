@@ -0,0 +1,332 @@
+"""
+Refreshes housing_data.csv from SCB's PxWeb API.
+
+Every (district, metric) table is fetched concurrently: asyncio schedules the requests
+and a shared requests.Session keeps a pool of keep-alive connections to the API.
+Each request is conditional on the ETag/Last-Modified of the previous fetch, so
+unchanged tables cost a 304 and no parsing. Failed requests and 429/5xx responses are
+retried with exponential backoff (honouring Retry-After). Changed tables are merged
+into the existing CSV, which is replaced atomically in the app's format (';'
+separated, decimal commas, DATE as mm-YYYY). The validators are only saved by
+commit_state(), once the CSV they describe is the current one.
+
+The table paths in TABLES and the region codes (the district keys of the CSV) are
+placeholders that have not been checked against SCB's table catalogue. Before querying
+the real API, point --tables or IN_MALMOE_SCB_TABLES at a JSON file with the verified
+IDs (see load_tables); the stub serves whatever the configuration names.
+
+Usage:
+python -m modules.scb --tables scb_tables.json           # the real API
+python -m modules.scb --url http://127.0.0.1:8765/api    # a stub, see modules/scb_stub.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from modules.instrumentation import span
+from modules.store import ALL_ROOMS, parse_column
+
+BASE_URL_ENV = 'IN_MALMOE_SCB_URL'
+BASE_URL = 'https://api.scb.se/OV0104/v1/doris/en/ssd'
+TABLES_ENV = 'IN_MALMOE_SCB_TABLES'
+# PxWeb table holding each metric, queried once per district. Placeholders, not verified
+# against SCB: override them with load_tables
+TABLES = {
+    'PPSM': 'BO/BO0501/BO0501X/MalmoPrisKvm',
+    'NOS': 'BO/BO0501/BO0501X/MalmoAntalSalda',
+}
+# District key of the CSV -> SCB Region code; districts not listed are queried by their
+# key, which is a placeholder as well
+REGIONS = {}
+# SCB room-count codes -> the rooms part of the CSV column names
+ROOM_CODES = {'TOT': ALL_ROOMS, '1': '1R', '2': '2R', '3': '3R', '4+': '4PR'}
+METRIC_ROOMS = {'PPSM': list(ROOM_CODES), 'NOS': ['TOT']}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STATE_FILE = 'scb_state.json'
+DATE_FORMAT = '%m-%Y'
+
+
+def load_tables(path: str = None) -> tuple[dict, dict]:
+    """
+    (tables, regions) to query, from a JSON file at path or $IN_MALMOE_SCB_TABLES, e.g.
+    {"tables": {"PPSM": "BO/...", "NOS": "BO/..."}, "regions": {"HY": "1280...", ...}}.
+    Entries missing from the file keep the placeholders of TABLES and REGIONS.
+    """
+    path = path or os.environ.get(TABLES_ENV)
+    if not path:
+        return dict(TABLES), dict(REGIONS)
+    with open(path, encoding='utf-8') as file:
+        config = json.load(file)
+    tables = {**TABLES, **config.get('tables', {})}
+    unknown = set(tables) - set(METRIC_ROOMS)
+    if unknown:
+        raise ValueError(f'{path}: no metric {", ".join(sorted(unknown))}; tables are given for {", ".join(METRIC_ROOMS)}')
+    return tables, {**REGIONS, **config.get('regions', {})}
+
+
+def pxweb_query(region: str, metric: str) -> dict:
+    return {
+        'query': [
+            {'code': 'Region', 'selection': {'filter': 'item', 'values': [region]}},
+            {'code': 'Rum', 'selection': {'filter': 'item', 'values': METRIC_ROOMS[metric]}},
+        ],
+        'response': {'format': 'json'},
+    }
+
+
+def parse_table(payload: dict, metric: str, districts: dict = None) -> dict:
+    """
+    Turns a PxWeb JSON response into one series per (district, metric, rooms).
+
+    Months are keyed like 2018M12 and '..' marks a missing value, as in SCB's tables.
+    districts maps SCB Region codes back to district keys; other codes are kept as they are.
+    """
+    districts = districts or {}
+    codes = [column['code'] for column in payload['columns']]
+    region, rooms, month = codes.index('Region'), codes.index('Rum'), codes.index('Tid')
+    series = {}
+    for row in payload['data']:
+        key = (districts.get(row['key'][region], row['key'][region]), metric, ROOM_CODES[row['key'][rooms]])
+        value = row['values'][0]
+        series.setdefault(key, {})[pd.Timestamp(row['key'][month].replace('M', '-'))] = np.nan if value in ('..', '.', '') else float(value)
+    return {key: pd.Series(values).sort_index() for key, values in series.items()}
+
+
+def read_housing_csv(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path, delimiter=';', decimal=',')
+    df['DATE'] = pd.to_datetime(df['DATE'].astype(str), format=DATE_FORMAT)
+    return df
+
+
+def _format_value(value: float) -> str:
+    # Whole numbers without decimals, like the hand-exported file
+    if np.isnan(value):
+        return ''
+    return str(int(value)) if value % 1 == 0 else repr(float(value)).replace('.', ',')
+
+
+def write_housing_csv(df: pd.DataFrame, path: str) -> None:
+    """Writes df in the format of housing_data.csv, replacing the file atomically."""
+    out = df.copy()
+    out['DATE'] = out['DATE'].dt.strftime(DATE_FORMAT)
+    for column in out.columns[1:]:
+        out[column] = out[column].map(_format_value)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    out.to_csv(tmp_path, sep=';', index=False, encoding='utf-8-sig')
+    os.replace(tmp_path, path)
+
+
+def merge_series(df: pd.DataFrame, series: dict) -> pd.DataFrame:
+    """
+    Returns df with the given (district, metric, rooms) series written into their columns.
+
+    Existing columns keep their names and order (including quirks like CE_PPSM_3R),
+    new series are appended as DISTRICT_METRICROOMS, and new months are added as rows.
+    """
+    columns = {parse_column(column): column for column in df.columns}
+    frame = df.set_index('DATE')
+    dates = frame.index
+    for values in series.values():
+        dates = dates.union(values.index)
+    frame = frame.reindex(dates)
+    for key, values in series.items():
+        column = columns.get(key) or f'{key[0]}_{key[1]}{key[2]}'
+        if column not in frame.columns:
+            frame[column] = np.nan
+        frame.loc[values.index, column] = values.to_numpy()
+    return frame.rename_axis('DATE').reset_index()
+
+
+class SCBIngest:
+    """
+    Fetches every (district, metric) table of the housing data and merges the changes
+    into csv_path. Validators and content hashes of the last fetch are kept next to the
+    CSV in scb_state.json, written by commit_state() once the merged CSV is in use.
+
+    Example:
+    ingest = SCBIngest('housing_data.csv', base_url='http://127.0.0.1:8765/api')
+    ingest.run()
+    ingest.commit_state()
+    """
+
+    def __init__(self, csv_path: str, base_url: str = None, districts: list[str] = None,
+                 concurrency: int = 4, retries: int = 4, backoff: float = 0.5, timeout: float = 10.0,
+                 tables_path: str = None):
+        self.csv_path = csv_path
+        self.tables, self.regions = load_tables(tables_path)
+        self.validators = None
+        self.region_districts = {region: district for district, region in self.regions.items()}
+        self.state_path = os.path.join(os.path.dirname(os.path.abspath(csv_path)), STATE_FILE)
+        self.base_url = (base_url or os.environ.get(BASE_URL_ENV) or BASE_URL).rstrip('/')
+        self.districts = districts
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, encoding='utf-8') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        # Validators from another endpoint (e.g. a stub) say nothing about this one
+        return state.get('tables', {}) if state.get('url') == self.base_url else {}
+
+    def commit_state(self, path: str = None) -> None:
+        """
+        Saves the validators of the last run() to path (default scb_state.json). Call it
+        once the CSV written by run() is the current one: validators saved before would
+        turn the next fetch of data that never got published into a 304.
+        """
+        if self.validators is None:
+            raise RuntimeError('commit_state() needs a run() first')
+        path = path or self.state_path
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'url': self.base_url, 'tables': self.validators}, file, indent=1)
+        os.replace(tmp_path, path)
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=0)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    async def fetch(self, session: requests.Session, semaphore: asyncio.Semaphore,
+                    district: str, metric: str, validators: dict) -> dict:
+        """One table, retried on connection errors and 429/5xx. Returns a result dict for run()."""
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        url = f'{self.base_url}/{self.tables[metric]}'
+        query = pxweb_query(self.regions.get(district, district), metric)
+        result = {'table': f'{district}/{metric}', 'district': district, 'metric': metric, 'attempts': 0}
+
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                result['attempts'] += 1
+                response = None
+                try:
+                    with span('ingest.fetch'):
+                        response = await asyncio.to_thread(
+                            session.post, url, json=query, headers=headers, timeout=self.timeout)
+                    if response.status_code not in RETRY_STATUSES:
+                        break
+                    result['error'] = f'HTTP {response.status_code}'
+                except requests.RequestException as error:
+                    result['error'] = f'{type(error).__name__}: {error}'
+                if attempt < self.retries:
+                    await asyncio.sleep(self._retry_delay(attempt, response))
+            else:
+                result['status'] = 'failed'
+                return result
+
+        result.pop('error', None)
+        if response.status_code == 304:
+            result['status'] = 'not_modified'
+            return result
+        if response.status_code != 200:
+            result.update(status='failed', error=f'HTTP {response.status_code}')
+            return result
+
+        digest = hashlib.sha1(response.content).hexdigest()
+        result['validators'] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha1': digest,
+        }
+        if digest == validators.get('sha1'):
+            # Server without validators, or one that ignores them: same content, nothing to merge
+            result['status'] = 'unchanged'
+            return result
+        result['status'] = 'changed'
+        result['series'] = parse_table(response.json(), metric, self.region_districts)
+        return result
+
+    async def fetch_all(self, tables: dict) -> list[dict]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        with self._session() as session:
+            tasks = [
+                self.fetch(session, semaphore, district, metric, tables.get(f'{district}/{metric}', {}))
+                for district in self.districts for metric in self.tables
+            ]
+            return await asyncio.gather(*tasks)
+
+    def run(self) -> dict:
+        """
+        Fetches all tables, merges the changed ones into the CSV and returns counts per
+        status. The new validators are kept for commit_state().
+        """
+        start = time.perf_counter()
+        df = read_housing_csv(self.csv_path) if os.path.exists(self.csv_path) else None
+        if self.districts is None:
+            if df is None:
+                raise ValueError(f'{self.csv_path} does not exist; pass the districts to fetch')
+            keys = (parse_column(column) for column in df.columns)
+            self.districts = sorted({key[0] for key in keys if key is not None})
+
+        tables = self._load_state()
+        results = asyncio.run(self.fetch_all(tables))
+
+        changed = [result for result in results if result['status'] == 'changed']
+        if changed:
+            with span('ingest.merge'):
+                series = {key: values for result in changed for key, values in result['series'].items()}
+                if df is None:
+                    df = pd.DataFrame({'DATE': pd.Series(dtype='datetime64[ns]')})
+                df = merge_series(df, series)
+            with span('ingest.write'):
+                write_housing_csv(df, self.csv_path)
+
+        # Failed tables keep their old validators, so they are fetched in full next time
+        for result in results:
+            if 'validators' in result:
+                tables[result['table']] = result['validators']
+        self.validators = tables
+
+        summary = {'elapsed_s': time.perf_counter() - start, 'rows': 0 if df is None else len(df)}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        summary['errors'] = {result['table']: result['error'] for result in results if result['status'] == 'failed'}
+        return summary
+
+
+def main() -> int:
+    from modules.helper_functions import HOUSING_DATA
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help=f'PxWeb base URL (default ${BASE_URL_ENV} or {BASE_URL})')
+    parser.add_argument('--csv', default=HOUSING_DATA.path, help='housing CSV to update')
+    parser.add_argument('--tables', help=f'JSON file with the SCB table paths and region codes (default ${TABLES_ENV})')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight (SCB allows 10 per 10 s)')
+    parser.add_argument('--retries', type=int, default=4)
+    args = parser.parse_args()
+
+    ingest = SCBIngest(args.csv, base_url=args.url, concurrency=args.concurrency, retries=args.retries,
+                       tables_path=args.tables)
+    summary = ingest.run()
+    # run() replaced the CSV itself, so its validators are current right away
+    ingest.commit_state()
+    print(json.dumps(summary, indent=2))
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,149 @@
+"""
+Local stand-in for SCB's PxWeb API, serving the housing tables of a CSV as SCB-shaped JSON.
+
+Supports ETag/Last-Modified with 304 responses, keep-alive connections, an artificial
+latency and a share of 503 responses, so modules/scb.py can be exercised end to end
+without touching the real API.
+
+Usage:
+python -m modules.scb_stub --port 8765 --latency 0.05 --fail-rate 0.1
+python -m modules.scb --url http://127.0.0.1:8765/api
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from modules.scb import ROOM_CODES, load_tables, read_housing_csv
+from modules.store import DistrictStore
+
+PREFIX = '/api/'
+
+
+def pxweb_payloads(df: pd.DataFrame, tables: dict, regions: dict) -> dict:
+    """{(table, region): JSON body} for every district and metric table of a housing frame."""
+    store = DistrictStore(df)
+    months = [f'{date.year}M{date.month:02d}' for date in pd.DatetimeIndex(store.dates)]
+    payloads = {}
+    for district in store.districts:
+        region = regions.get(district, district)
+        for metric, table in tables.items():
+            data = []
+            for code, rooms in ROOM_CODES.items():
+                if (district, metric, rooms) not in store.index:
+                    continue
+                for month, value in zip(months, store.series(district, metric, rooms)):
+                    text = '..' if np.isnan(value) else str(int(value)) if value % 1 == 0 else repr(float(value))
+                    data.append({'key': [region, code, month], 'values': [text]})
+            payload = {
+                'columns': [
+                    {'code': 'Region', 'text': 'region', 'type': 'd'},
+                    {'code': 'Rum', 'text': 'rooms', 'type': 'd'},
+                    {'code': 'Tid', 'text': 'month', 'type': 't'},
+                    {'code': metric, 'text': metric, 'type': 'c'},
+                ],
+                'data': data,
+            }
+            payloads[(table, region)] = json.dumps(payload, separators=(',', ':')).encode()
+    return payloads
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, df: pd.DataFrame, port: int = 0, latency: float = 0.0, fail_rate: float = 0.0,
+                 tables_path: str = None):
+        super().__init__(('127.0.0.1', port), StubHandler)
+        self.table_paths, self.regions = load_tables(tables_path)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.update(df)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}{PREFIX.rstrip("/")}'
+
+    def update(self, df: pd.DataFrame) -> None:
+        """Serves new data; tables whose content changed get a new ETag and Last-Modified."""
+        previous = getattr(self, 'tables', {})
+        now = formatdate(usegmt=True)
+        tables = {}
+        for key, body in pxweb_payloads(df, self.table_paths, self.regions).items():
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            old = previous.get(key)
+            tables[key] = (body, etag, old[2] if old is not None and old[1] == etag else now)
+        self.tables = tables
+
+    def start(self) -> 'StubServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        query = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if server.latency:
+            time.sleep(server.latency)
+        if random.random() < server.fail_rate:
+            return self._send(503, b'{"error":"busy"}', {'Retry-After': '0'})
+
+        table = self.path[len(PREFIX):] if self.path.startswith(PREFIX) else None
+        regions = [item for item in query.get('query', []) if item.get('code') == 'Region']
+        region = regions[0]['selection']['values'][0] if regions else None
+        entry = server.tables.get((table, region))
+        if entry is None:
+            return self._send(404, b'{"error":"no such table"}')
+
+        body, etag, last_modified = entry
+        headers = {'ETag': etag, 'Last-Modified': last_modified, 'Content-Type': 'application/json'}
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, headers=headers)
+        since = self.headers.get('If-Modified-Since')
+        if since and 'If-None-Match' not in self.headers and parsedate_to_datetime(since) >= parsedate_to_datetime(last_modified):
+            return self._send(304, headers=headers)
+        self._send(200, body, headers)
+
+
+def main() -> int:
+    from modules.helper_functions import HOUSING_DATA
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--csv', default=HOUSING_DATA.path, help='housing CSV whose tables are served')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--tables', help='JSON file with the table paths and region codes to serve (see modules/scb.py)')
+    args = parser.parse_args()
+
+    server = StubServer(read_housing_csv(args.csv), args.port, args.latency, args.fail_rate, args.tables)
+    print(f'Serving {args.csv} on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
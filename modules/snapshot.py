@@ -0,0 +1,104 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+META_FILE = 'meta.json'
+
+
+def _read_meta(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, META_FILE), encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(df: pd.DataFrame, directory: str, version: str, keep: int = 2) -> None:
+    """
+    Stores every column of df as its own .npy file next to a meta.json describing them.
+
+    Column files are named after the dataset version, and meta.json is swapped in last,
+    so readers either see the previous snapshot or the complete new one. The files of
+    the `keep` most recent versions stay listed in meta.json and on disk, so processes
+    that are still on an older version of the CSV can keep loading it; anything older is
+    unlinked (processes that have those files mapped keep reading the old pages).
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for i, column in enumerate(df.columns):
+        file_name = f'{version[:12]}_{i}.npy'
+        # Replaced rather than rewritten in place: other processes may have the file mapped
+        path = os.path.join(directory, file_name)
+        with open(path + '.tmp', 'wb') as file:
+            np.save(file, df[column].to_numpy())
+        os.replace(path + '.tmp', path)
+        columns.append({'name': column, 'file': file_name})
+
+    previous = _read_meta(directory) or {}
+    versions = {version: columns}
+    if previous.get('version') not in (None, version):
+        versions[previous['version']] = previous['columns']
+    for old_version, old_columns in previous.get('versions', {}).items():
+        if len(versions) < keep and old_version not in versions:
+            versions[old_version] = old_columns
+    versions = dict(list(versions.items())[:keep])
+
+    meta_path = os.path.join(directory, META_FILE)
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump({'version': version, 'columns': columns, 'versions': versions}, file, ensure_ascii=False)
+    os.replace(meta_path + '.tmp', meta_path)
+
+    in_use = {column['file'] for kept in versions.values() for column in kept}
+    for file_name in os.listdir(directory):
+        if file_name.endswith('.npy') and file_name not in in_use:
+            os.unlink(os.path.join(directory, file_name))
+
+
+def read_snapshot(directory: str, version: str = None) -> pd.DataFrame:
+    """
+    Memory-maps a snapshot written by write_snapshot.
+
+    Returns None when there is no snapshot of the requested version of the source file
+    (the current one or one of the versions kept by write_snapshot). The returned frame
+    is backed by read-only mappings, so every worker process on the machine shares the
+    same pages.
+    """
+    meta = _read_meta(directory)
+    if meta is None:
+        return None
+    try:
+        columns = meta['columns'] if version is None else meta.get('versions', {meta['version']: meta['columns']}).get(version)
+        if columns is None:
+            return None
+        data = {
+            column['name']: np.load(os.path.join(directory, column['file']), mmap_mode='r')
+            for column in columns
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(data, copy=False)
+
+
+def compile_all() -> None:
+    from modules import helper_functions as hlp
+    from modules.incremental import RollingState
+
+    for dataset in (hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA):
+        version, df = dataset.parse_csv()
+        write_snapshot(df, dataset.snapshot_dir, version)
+        print(f'{os.path.basename(dataset.path)} -> {dataset.snapshot_dir} ({len(df)} rows, version {version[:12]})')
+        if dataset is hlp.HOUSING_DATA:
+            # Running window sums, so appending the next month does not revisit the history
+            RollingState.from_frame(df).save(dataset.snapshot_dir, version)
+
+    # District geometry simplified for every zoom level of the maps
+    from modules.geography import DistrictGeometry
+    geometry = DistrictGeometry.from_file()
+    path = geometry.write_levels()
+    print(f'{os.path.basename(geometry.path())} -> {path} ({geometry.vertices["source"]} vertices, '
+          f'{geometry.vertices[min(geometry.levels)]}-{geometry.vertices[max(geometry.levels)]} simplified)')
+
+
+if __name__ == '__main__':
+    compile_all()
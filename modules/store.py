@@ -0,0 +1,119 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+from modules.instrumentation import span
+
+# DISTRICT_METRIC[ROOMS], tolerating the stray underscore in e.g. CE_PPSM_3R
+COLUMN_PATTERN = re.compile(r'^(?P<district>[A-Z]+)_(?P<metric>[A-Z]+?)_?(?P<rooms>\dP?R)?$')
+ALL_ROOMS = ''
+
+
+def parse_column(column: str):
+    """
+    Splits a wide housing column name into (district, metric, rooms).
+
+    rooms is ALL_ROOMS for the all-apartments series. Returns None for columns that
+    are not district series, such as DATE.
+
+    Example:
+    parse_column('CE_PPSM_3R') -> ('CE', 'PPSM', '3R')
+    """
+    match = COLUMN_PATTERN.match(column)
+    if match is None:
+        return None
+    return match['district'], match['metric'], match['rooms'] or ALL_ROOMS
+
+
+class DistrictStore:
+    """
+    Long-format view of the housing data keyed by (district, metric, rooms, date).
+
+    The series are held twice as contiguous 2D float arrays (one row per series):
+    once grouped by district and once grouped by (metric, rooms). Every series, every
+    district and every metric across districts is therefore a precomputed slice
+    (a view, not a copy) instead of a lookup over the ~60 wide columns.
+
+    The arrays are float32 when every series column is 32-bit or narrower (compact
+    dtypes, see modules/memory.py) and float64 otherwise.
+    """
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, df: pd.DataFrame):
+        self.dates = df['DATE'].to_numpy()
+        parsed = {column: parse_column(column) for column in df.columns}
+        parsed = {column: key for column, key in parsed.items() if key is not None}
+
+        by_district = sorted(parsed, key=lambda column: parsed[column])
+        self.keys = [parsed[column] for column in by_district]
+        self.columns = dict(zip(self.keys, by_district))
+        dtype = np.float32 if all(df[column].dtype.itemsize <= 4 for column in by_district) else float
+        self.values = np.ascontiguousarray(df[by_district].to_numpy(dtype=dtype).T)
+        self.index = {key: row for row, key in enumerate(self.keys)}
+        self.district_slices = self._group_slices([key[0] for key in self.keys])
+
+        order = sorted(range(len(self.keys)), key=lambda row: (self.keys[row][1], self.keys[row][2], self.keys[row][0]))
+        self.metric_keys = [self.keys[row] for row in order]
+        self.metric_values = np.ascontiguousarray(self.values[order])
+        self.metric_slices = self._group_slices([key[1:] for key in self.metric_keys])
+
+        self.values.flags.writeable = False
+        self.metric_values.flags.writeable = False
+
+    @staticmethod
+    def _group_slices(groups: list) -> dict:
+        slices = {}
+        start = 0
+        for i in range(1, len(groups) + 1):
+            if i == len(groups) or groups[i] != groups[start]:
+                slices[groups[start]] = slice(start, i)
+                start = i
+        return slices
+
+    @classmethod
+    def from_dataset(cls, dataset) -> 'DistrictStore':
+        """Returns the store for the current version of an ImportData dataset, building it once per version."""
+        key = (dataset.path, dataset.version)
+        store = cls._cache.get(key)
+        if store is None:
+            with cls._lock:
+                store = cls._cache.get(key)
+                if store is None:
+                    with span('data.district_store'):
+                        store = cls(dataset.load())
+                    cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path}
+                    cls._cache[key] = store
+        return store
+
+    @classmethod
+    def install(cls, dataset, version: str, store: 'DistrictStore') -> None:
+        """Adds a store built ahead for the next version of a dataset; the current version's stays until the one after."""
+        with cls._lock:
+            keep = {version, dataset.version}
+            cls._cache = {k: v for k, v in cls._cache.items() if k[0] != dataset.path or k[1] in keep}
+            cls._cache[(dataset.path, version)] = store
+
+    @property
+    def districts(self) -> list[str]:
+        return list(self.district_slices)
+
+    def series(self, district: str, metric: str, rooms: str = ALL_ROOMS) -> np.ndarray:
+        return self.values[self.index[(district, metric, rooms)]]
+
+    def column(self, district: str, metric: str, rooms: str = ALL_ROOMS) -> str:
+        """Name of the wide column holding the series, e.g. for labelling traces."""
+        return self.columns[(district, metric, rooms)]
+
+    def district(self, district: str):
+        """All series of a district as (keys, 2D array with one row per key)."""
+        rows = self.district_slices[district]
+        return self.keys[rows], self.values[rows]
+
+    def metric(self, metric: str, rooms: str = ALL_ROOMS):
+        """One metric across all districts as (districts, 2D array with one row per district)."""
+        rows = self.metric_slices[(metric, rooms)]
+        return [key[0] for key in self.metric_keys[rows]], self.metric_values[rows]
+
+    def date_position(self, date) -> int:
+        return int(np.searchsorted(self.dates, np.datetime64(date, 'ns')))
@@ -0,0 +1,201 @@
+"""
+Builds the monthly district x room-count grid of housing_data.csv (the *_PPSM,
+*_PPSMxR and *_NOS columns) from individual sale records.
+
+Sale files are read in chunks of CHUNK_ROWS rows with only the needed columns, and
+every chunk is reduced to sums and counts per (month, district, room class) before the
+next one is read, so memory stays bounded by the chunk size and the size of the grid,
+not by the number of sales. Files are independent shards: with several workers they
+are aggregated in a process pool and the partial grids are added up.
+
+PPSM is the mean price per square meter of the month's sales, NOS their number.
+Room counts are classed as 1R (< 2 rooms), 2R, 3R and 4PR (4 rooms or more). The
+all-Malmö MMA columns are derived from the districts like in the existing file.
+
+Usage:
+python -m modules.transactions sales/*.csv --workers 4
+python -m modules.transactions sales/*.csv --output /tmp/housing_data.csv --replace
+"""
+import argparse
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from modules.instrumentation import span
+from modules.scb import merge_series, read_housing_csv, write_housing_csv
+from modules.store import ALL_ROOMS, parse_column
+
+# Header names of the sale files
+COLUMNS = {'date': 'date', 'district': 'district', 'rooms': 'rooms', 'price': 'price', 'area': 'area'}
+CHUNK_ROWS = 500_000
+ROOM_CLASSES = np.array(['1R', '2R', '3R', '4PR'])
+# Prefix of the all-Malmö columns, derived from the districts rather than read from sales
+CITY = 'MMA'
+
+
+def aggregate_chunk(chunk: pd.DataFrame, districts: dict = None, date_format: str = None) -> pd.DataFrame:
+    """
+    Sums of price per square meter and sale counts per (DATE, district, rooms) for one
+    chunk of sale records. Rows with a missing or invalid value are skipped; with a
+    districts mapping (raw value -> district key) so are unknown districts.
+    """
+    dates = pd.to_datetime(chunk[COLUMNS['date']], format=date_format, errors='coerce').to_numpy()
+    district = chunk[COLUMNS['district']]
+    if districts is not None:
+        district = district.map(districts)
+    district = district.to_numpy(dtype=object)
+    rooms = pd.to_numeric(chunk[COLUMNS['rooms']], errors='coerce').to_numpy(dtype=float)
+    price = pd.to_numeric(chunk[COLUMNS['price']], errors='coerce').to_numpy(dtype=float)
+    area = pd.to_numeric(chunk[COLUMNS['area']], errors='coerce').to_numpy(dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        valid = ~np.isnat(dates) & pd.notna(district) & (rooms >= 1) & (price > 0) & (area > 0)
+    room_class = ROOM_CLASSES[np.clip(np.floor(rooms[valid]), 1, 4).astype(int) - 1]
+    rows = pd.DataFrame({
+        'DATE': dates[valid].astype('datetime64[M]').astype('datetime64[ns]'),
+        'district': district[valid],
+        'rooms': room_class,
+        'ppsm': price[valid] / area[valid],
+    })
+    return rows.groupby(['DATE', 'district', 'rooms'])['ppsm'].agg(['sum', 'count'])
+
+
+def aggregate_file(path: str, districts: dict = None, date_format: str = None,
+                   chunksize: int = CHUNK_ROWS, sep: str = ','):
+    """Grid of sums and counts for one sale file, read chunk by chunk. Returns (grid, rows read)."""
+    grid = None
+    rows = 0
+    for chunk in pd.read_csv(path, sep=sep, usecols=list(COLUMNS.values()), chunksize=chunksize, dtype={COLUMNS['district']: str}):
+        rows += len(chunk)
+        part = aggregate_chunk(chunk, districts, date_format)
+        grid = part if grid is None else grid.add(part, fill_value=0)
+    return grid, rows
+
+
+def aggregate(paths: list[str], workers: int = 1, **kwargs):
+    """
+    Grid of sums and counts over all sale files, one file per task when workers > 1.
+    Keyword arguments are passed on to aggregate_file. Returns (grid, rows read).
+    """
+    task = functools.partial(aggregate_file, **kwargs)
+    with span('transactions.aggregate'):
+        if workers > 1 and len(paths) > 1:
+            with ProcessPoolExecutor(min(workers, len(paths))) as executor:
+                parts = list(executor.map(task, paths))
+        else:
+            parts = [task(path) for path in paths]
+    grids = [grid for grid, _ in parts if grid is not None]
+    rows = sum(count for _, count in parts)
+    if not grids:
+        return None, rows
+    grid = grids[0]
+    for part in grids[1:]:
+        grid = grid.add(part, fill_value=0)
+    return grid, rows
+
+
+def grid_series(grid: pd.DataFrame) -> dict:
+    """
+    One monthly series per (district, metric, rooms), as merge_series expects.
+
+    Every month between the first and the last sale is present: NOS is 0 and PPSM is
+    missing for months without sales.
+    """
+    sums = grid['sum'].unstack(['district', 'rooms'])
+    counts = grid['count'].unstack(['district', 'rooms'])
+    months = pd.date_range(sums.index.min(), sums.index.max(), freq='MS')
+    sums, counts = sums.reindex(months).fillna(0), counts.reindex(months).fillna(0)
+
+    series = {}
+    for district in sorted(sums.columns.get_level_values('district').unique()):
+        district_sums, district_counts = sums[district], counts[district]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            series[(district, 'PPSM', ALL_ROOMS)] = (district_sums.sum(axis=1) / district_counts.sum(axis=1)).round()
+            for rooms in ROOM_CLASSES:
+                if rooms in district_sums.columns:
+                    series[(district, 'PPSM', rooms)] = (district_sums[rooms] / district_counts[rooms]).round()
+        series[(district, 'NOS', ALL_ROOMS)] = district_counts.sum(axis=1)
+    series = {key: values.replace([np.inf, -np.inf], np.nan) for key, values in series.items()}
+
+    # The whole city, as in the existing file: the mean of the district prices and the total sales
+    districts = sorted({key[0] for key in series})
+    if len(districts) > 1:
+        for rooms in [ALL_ROOMS, *ROOM_CLASSES]:
+            parts = [series[(district, 'PPSM', rooms)] for district in districts if (district, 'PPSM', rooms) in series]
+            if parts:
+                series[(CITY, 'PPSM', rooms)] = pd.concat(parts, axis=1).mean(axis=1)
+        series[(CITY, 'NOS', ALL_ROOMS)] = sum(series[(district, 'NOS', ALL_ROOMS)] for district in districts)
+    return series
+
+
+def _same_values(df: pd.DataFrame, other: pd.DataFrame) -> bool:
+    # Merging can turn integer columns into floats, and read_csv does not round-trip
+    # every last bit of a float, so compare values with a tight tolerance
+    return (list(df.columns) == list(other.columns) and df['DATE'].equals(other['DATE'])
+            and np.allclose(df.iloc[:, 1:].to_numpy(dtype=float), other.iloc[:, 1:].to_numpy(dtype=float), rtol=1e-12, atol=0, equal_nan=True))
+
+
+def update_csv(paths: list[str], csv_path: str, replace: bool = False, workers: int = 1, **kwargs) -> dict:
+    """
+    Aggregates the sale files into csv_path. By default the grid is merged into the
+    existing file (columns and months it covers are overwritten, the rest kept);
+    replace writes only the grid. Returns counts for reporting.
+    """
+    grid, rows = aggregate(paths, workers, **kwargs)
+    if grid is None:
+        return {'rows': rows, 'sales': 0, 'changed': False}
+    series = grid_series(grid)
+    if replace or not os.path.exists(csv_path):
+        before = None
+        df = merge_series(pd.DataFrame({'DATE': pd.Series(dtype='datetime64[ns]')}), series)
+    else:
+        before = read_housing_csv(csv_path)
+        df = merge_series(before, series)
+    changed = before is None or not _same_values(df, before)
+    if changed:
+        write_housing_csv(df, csv_path)
+    return {'rows': rows, 'sales': int(grid['count'].sum()), 'months': len(df), 'columns': len(series), 'changed': changed}
+
+
+def transactions_source(staged_path: str, paths: list[str], workers: int = 1) -> bool:
+    """Refresher source (see modules/refresh.py) that rebuilds the staged CSV from sale files."""
+    return update_csv(paths, staged_path, workers=workers, districts=district_codes())['changed']
+
+
+def district_codes() -> dict:
+    """Raw district values accepted in sale files: the district keys of the housing data and the district names."""
+    from modules.helper_functions import DISTRICTS, HOUSING_DATA
+
+    keys = (parse_column(column) for column in pd.read_csv(HOUSING_DATA.path, sep=';', nrows=0).columns)
+    codes = {key[0]: key[0] for key in keys if key is not None and key[0] != CITY}
+    codes.update({key: key for key in DISTRICTS.values()})
+    codes.update(DISTRICTS)
+    return codes
+
+
+def main() -> int:
+    from modules.helper_functions import HOUSING_DATA
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='sale files (CSV with date, district, rooms, price, area)')
+    parser.add_argument('--output', default=HOUSING_DATA.path, help='housing CSV to update')
+    parser.add_argument('--replace', action='store_true', help='write only the aggregated grid instead of merging it')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes, one file per task')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--sep', default=',')
+    parser.add_argument('--date-format', help='strftime format of the date column (default: inferred)')
+    parser.add_argument('--any-district', action='store_true', help='keep districts that are not in the app')
+    args = parser.parse_args()
+
+    summary = update_csv(
+        args.paths, args.output, replace=args.replace, workers=args.workers,
+        districts=None if args.any_district else district_codes(),
+        date_format=args.date_format, chunksize=args.chunksize, sep=args.sep,
+    )
+    print(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,8 +1,11 @@
 import pandas as pd
-import numpy as np
-import plotly.express as px
 import streamlit as st
 from modules import helper_functions as hlp
+from modules.computations import reuse, reuse_figure
+from modules.deflator import RealPrices
+from modules.district_figures import DISTRICT_FIGURES
+from modules.geography import SCHEMATIC_CAPTION, SIDEBAR_WIDTH, DistrictGeometry, map_figure
+from modules.refresh import REFRESHER
 from streamlit_extras.metric_cards import style_metric_cards
 
 
@@ -14,112 +17,89 @@ st.set_page_config(
 
 
 
-df = pd.read_csv('housing_data.csv', delimiter=";")
+hlp.INSTRUMENTATION.start_rerun('data_analysis')
+hlp.ImportData.pin_versions()
+df = hlp.HOUSING_DATA.load()
+store = hlp.DistrictStore.from_dataset(hlp.HOUSING_DATA)
+visualize = hlp.Visualize(df, hlp.COLOR_PALETTE, store)
+DISTRICT_FIGURES.start_warm_up()
+REFRESHER.start()
 
-calc = hlp.Calculations(df)
-visualize = hlp.Visualize(df, hlp.COLOR_PALETTE)
+district_dict = hlp.DISTRICTS
 
-district_dict = {
-    'Centrum':'C',
-    'Fosie-Oxie':'FO',
-    'Hyllie':'HY',
-    'Kirseberg':'KB',
-    'Limhamn-Bunkeflo':'LB',
-    'Rosengård-Husie':'RGH',
-    'Södra Innerstaden':'SI',
-    'Västra Innerstaden':'VI'
-}
-
-option = ["Centrum", "Fosie-Oxie", "Hyllie", "Kirseberg", "Limhamn-Bunkeflo", "Rosengård-Husie", "Södra Innerstaden", "Västra Innerstaden"]
+option = list(district_dict)
 load_dataset = st.sidebar.selectbox("Select City District", option)
 district_key = district_dict.get(load_dataset)
 
 
+def versions(real: bool) -> tuple:
+    """Data versions the district's charts and metrics depend on."""
+    return (hlp.HOUSING_DATA.version, hlp.INFLATION_DATA.version, hlp.REAL_ESTATE_INDEX_DATA.version) if real else (hlp.HOUSING_DATA.version,)
+
+
+def district_figure(chart_id: str, window=None, forecast: bool = False, real: bool = False):
+    """Chart of the selected district, reused in the session until one of its inputs changes."""
+    inputs = versions(real) + (district_key, window, forecast, real)
+    return reuse(f'data_analysis.{chart_id}', inputs, lambda: DISTRICT_FIGURES.figure(district_key, chart_id, window, forecast, real), shared=False)
+
+
+def district_summary(months: list[int], real: bool = False):
+    def compute():
+        if real:
+            prices = RealPrices.from_datasets(hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+            return hlp.Calculations(prices.df, prices.store, prices.precomputed).summary(district_key, months)
+        return hlp.Calculations(df, store, hlp.Precomputed.from_dataset(hlp.HOUSING_DATA)).summary(district_key, months)
+    return reuse('data_analysis.summary', versions(real) + (district_key, tuple(months), real), compute)
+
+
 def generate_sidebar():
     st.sidebar.header("Helping Tools")
     table = pd.DataFrame.from_dict(hlp.abbrev_dict, orient='index', columns=['Description'])
     show_table = st.sidebar.checkbox("Show Abbreviation Table")
     
-    coords = pd.DataFrame(np.random.randn(1, 2) / [100, 100] + [hlp.MALMÖ_COORDINATES[0], hlp.MALMÖ_COORDINATES[1]],columns=['lat', 'lon'])
     map_checkbox = st.sidebar.checkbox("Show Map")
     if map_checkbox:
-        st.sidebar.map(coords,10,use_container_width=True)
+        geometry = DistrictGeometry.from_file()
+        inputs = (hlp.HOUSING_DATA.version, geometry.version, district_key)
+        fig = reuse_figure('data_analysis.map', inputs, lambda: map_figure('PPSM', SIDEBAR_WIDTH, 260, district_key, title=False))
+        hlp.plotly_chart(st.sidebar, fig, use_container_width=True)
+        if geometry.schematic:
+            st.sidebar.caption(SCHEMATIC_CAPTION)
     if show_table:
       st.sidebar.table(table)
 
 COL_0, COL_01 = st.columns(2)
 COL_1, COL_2, COL_3, COL_4 = st.columns([3,1,1,1])
 COL_5, COL_6 = st.columns(2)
-COL_9, COL_10, COL_11, COL_12 = st.columns(4)
+COL_9 = st.container()
 COL_13, COL_14 = st.columns(2)
 
 
 if load_dataset in district_dict:
     generate_sidebar()
     COL_0.markdown(f'# {load_dataset}')
-    fig_graphs= visualize.draw_scatter_plots(calc.calculate_sma(f"{district_key}_PPSM", [3,6,12]),'lines')
-    fig_graphs.update_layout(title='Average Price per Square Meter with Simple Moving Average (SMA)')
-    COL_1.plotly_chart(fig_graphs, use_container_width=True)
-
+    window = hlp.zoom_range(st.sidebar, store.dates, 'zoom_district')
+    show_forecast = st.sidebar.checkbox("Show Forecast")
+    real = st.sidebar.checkbox("Show Real Prices (KPI-adjusted)", help="Prices adjusted for inflation, in kronor of the latest month")
+    hlp.plotly_chart(COL_1, district_figure('sma', window, show_forecast, real), use_container_width=True)
 
-    sum_info = calc.summary(f'{district_key}', [3,6,12])
+    sum_info = district_summary([3,6,12], real)
     visualize.draw_metrics(sum_info, [COL_2, COL_3, COL_4])
     
-    fig_lines = visualize.draw_scatter_plots([f'{district_key}_PPSM1R',f'{district_key}_PPSM2R',f'{district_key}_PPSM3R',f'{district_key}_PPSM4PR'], 'lines')
-    fig_lines.update_layout(title='Average Price per Square Meter by Number of Room(s)')
-    fig_lines.add_hline(y=df[f"{district_key}_PPSM"].mean(), line_dash="dot",
-              annotation_text=f"{district_key}_PPSM mean value",
-              annotation_position="bottom right")
-    COL_5.plotly_chart(fig_lines, use_container_width=True)    
-
-    fig_scatter = visualize.draw_scatter_plots([f'{district_key}_PPSM1R',f'{district_key}_PPSM2R',f'{district_key}_PPSM3R',f'{district_key}_PPSM4PR'], 'markers')
-    fig_scatter.update_layout(title='Cluster Points grouped by Number of Room(s)')
-    COL_6.plotly_chart(fig_scatter, use_container_width=True)
-    
-    fig_1 = px.box(df, y=f"{district_key}_PPSM1R", points='all')
-    fig_1.data[0].update(marker=dict(color=hlp.COLOR_PALETTE[0]))
-    fig_1.add_hline(y=df[f'{district_key}_PPSM'].mean(), line_dash="dot",
-              annotation_text=f"{district_key}_PPSM mean value",
-              annotation_position="bottom right")
-    fig_2 = px.box(df, y=f"{district_key}_PPSM2R", points='all')
-    fig_2.data[0].update(marker=dict(color=hlp.COLOR_PALETTE[1]))
-
-    fig_2.add_hline(y=df[f'{district_key}_PPSM'].mean(), line_dash="dot",
-              annotation_text=f"{district_key}_PPSM mean value",
-              annotation_position="bottom right")
-    fig_3 = px.box(df, y=f"{district_key}_PPSM3R", points='all')
-    fig_3.data[0].update(marker=dict(color=hlp.COLOR_PALETTE[2]))
-    
-    fig_3.add_hline(y=df[f'{district_key}_PPSM'].mean(), line_dash="dot",
-              annotation_text=f"{district_key}_PPSM mean value",
-              annotation_position="bottom right")
-    
-    fig_4 = px.box(df, y=f"{district_key}_PPSM4PR", points='all')
-    fig_4.data[0].update(marker=dict(color=hlp.COLOR_PALETTE[3]))
-
-    fig_4.add_hline(y=df[f'{district_key}_PPSM'].mean(), line_dash="dot",
-              annotation_text=f"{district_key}_PPSM mean value",
-              annotation_position="bottom right")
-
-
-
-    COL_9.plotly_chart(fig_1, use_container_width=True)
-    COL_10.plotly_chart(fig_2, use_container_width=True)
-    COL_11.plotly_chart(fig_3, use_container_width=True)
-    COL_12.plotly_chart(fig_4, use_container_width=True)
+    hlp.plotly_chart(COL_5, district_figure('rooms_lines', window, show_forecast, real), use_container_width=True)    
+    hlp.plotly_chart(COL_6, district_figure('rooms_scatter', window, real=real), use_container_width=True)
 
-    #TOTAL NUMBER OF APARTMENT SALES BY MONTH FROM DECEMBER 2018-
-    fig = visualize.draw_horizontal_bar(district_key, hlp.COLOR_PALETTE[5])
-    fig.update_layout(title='Number of Apartment Sales by Month from December 2018-')
-    COL_13.plotly_chart(fig, use_container_width=True)
-  
+    if hlp.lazy_section('Show price distribution by number of room(s)', 'section_boxes', COL_9):
+        hlp.plotly_chart(COL_9, district_figure('boxes', real=real), use_container_width=True)
 
-    fig = calc.calculate_monthly_distribution(f'{district_key}_NOS')
-    fig[0].update_layout(title=f'Monthly Sales of Apartments as a Percentage of Total Sales in {load_dataset}')
-    COL_14.plotly_chart(fig[0], use_container_width=True)
+    if hlp.lazy_section('Show number of sales by month', 'section_sales_bar', COL_13):
+        hlp.plotly_chart(COL_13, district_figure('sales_bar'), use_container_width=True)
+    if hlp.lazy_section('Show monthly distribution of sales', 'section_monthly_pie', COL_14):
+        hlp.plotly_chart(COL_14, district_figure('monthly_pie'), use_container_width=True)
 elif load_dataset is 'Malmö':
     st.markdown('IT WORKS')
 st.write('---')
 st.write("**All data has been updated on December 21, 2021.**", markdown=True)
 
 style_metric_cards()
+hlp.INSTRUMENTATION.finish_rerun()
@@ -0,0 +1,101 @@
+import pandas as pd
+import streamlit as st
+from modules import helper_functions as hlp
+from modules.comparison import Comparison
+from modules.computations import reuse_figure
+from modules.deflator import RealPrices
+from modules.refresh import REFRESHER
+
+
+st.set_page_config(
+    page_title="Compare Districts-Malmö",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+
+
+hlp.INSTRUMENTATION.start_rerun('compare')
+hlp.ImportData.pin_versions()
+store = hlp.DistrictStore.from_dataset(hlp.HOUSING_DATA)
+comparison = Comparison.from_datasets(hlp.HOUSING_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+REFRESHER.start()
+
+ROOM_OPTIONS = {'All apartments': '', '1 room': '1R', '2 rooms': '2R', '3 rooms': '3R', '4 rooms or more': '4PR'}
+
+def label(district_key: str) -> str:
+    return hlp.DISTRICT_NAMES.get(district_key, district_key)
+
+district_dict = {label(key): key for key in store.districts}
+chosen = st.sidebar.multiselect("Select City Districts", list(district_dict), default=list(hlp.DISTRICTS))
+selected = [district_dict[name] for name in chosen]
+rooms = ROOM_OPTIONS[st.sidebar.selectbox("Apartment Size", list(ROOM_OPTIONS))]
+max_lag = st.sidebar.slider("Max. Lead/Lag (months)", 1, 12, 6)
+real = st.sidebar.checkbox("Show Real Prices (KPI-adjusted)", help="Prices adjusted for inflation, in kronor of the latest month")
+title = 'Average Price per Square Meter'
+if real:
+    prices = RealPrices.from_datasets(hlp.HOUSING_DATA, hlp.INFLATION_DATA, hlp.REAL_ESTATE_INDEX_DATA)
+    comparison, title = prices.comparison, f'{title} ({prices.label})'
+
+st.markdown('# Compare Districts')
+if len(selected) < 2:
+    st.info('Select at least two districts to compare.')
+    hlp.INSTRUMENTATION.finish_rerun()
+    st.stop()
+
+COL_1, COL_2 = st.columns([2,1])
+COL_3 = st.container()
+COL_4, COL_5 = st.columns(2)
+COL_6, COL_7 = st.columns(2)
+
+# Everything the charts below depend on
+inputs = (hlp.HOUSING_DATA.version, hlp.REAL_ESTATE_INDEX_DATA.version) + ((hlp.INFLATION_DATA.version,) if real else ()) + (tuple(selected), rooms, real)
+names, values = comparison.series('PPSM', rooms, selected)
+
+def price_figure():
+    df = pd.DataFrame({'DATE': store.dates, **{label(name): row for name, row in zip(names, values)}})
+    fig = hlp.draw_multiple_graphs(df, [label(name) for name in names])
+    fig.update_layout(title=title, hovermode='x unified')
+    return fig
+
+hlp.plotly_chart(COL_1, reuse_figure('compare.prices', inputs, price_figure), use_container_width=True)
+
+ranking = comparison.ranking('PPSM', rooms)
+# Ranked again among the selected districts, so the ranks have no gaps
+ranking = ranking[ranking['district'].isin(selected)].assign(
+    rank=lambda table: table['latest'].rank(ascending=False, method='min').astype('Int64'),
+    district=lambda table: table['district'].map(label))
+COL_2.markdown('### Ranking')
+COL_2.dataframe(ranking[['rank', 'district', 'latest', 'change_3m_%', 'change_12m_%']], use_container_width=True, hide_index=True)
+
+if hlp.lazy_section('Show all ranking figures', 'section_ranking', COL_3):
+    COL_3.dataframe(ranking, use_container_width=True, hide_index=True)
+
+if hlp.lazy_section('Show correlation of monthly price changes', 'section_correlation', COL_4):
+    def correlation_figure():
+        correlations = comparison.correlations('PPSM', rooms).loc[names, names].rename(index=label, columns=label)
+        return hlp.draw_heatmap(correlations, 'Correlation of Monthly Price Changes')
+    hlp.plotly_chart(COL_4, reuse_figure('compare.correlation', inputs, correlation_figure), use_container_width=True)
+
+if hlp.lazy_section('Show lead/lag between districts', 'section_lead_lag', COL_5):
+    lead_lag = comparison.lead_lag('PPSM', rooms, max_lag)
+    lead_lag = lead_lag[lead_lag['leader'].isin(selected) & lead_lag['follower'].isin(selected)]
+    COL_5.markdown('### Lead/Lag')
+    COL_5.caption('Lag in months at which the monthly price changes of two districts correlate the most; the leader moves first.')
+    COL_5.dataframe(
+        lead_lag.assign(leader=lead_lag['leader'].map(label), follower=lead_lag['follower'].map(label)).round(2),
+        use_container_width=True, hide_index=True)
+
+if hlp.lazy_section('Show comparison with the Swedish regions (REI)', 'section_regions', COL_6):
+    growth, region_correlations = comparison.regions('PPSM', rooms)
+    growth = growth[(growth['kind'] == 'region') | growth['series'].isin(selected)]
+    COL_6.markdown('### Growth against the Real Estate Index')
+    COL_6.dataframe(growth.assign(series=growth['series'].map(label)), use_container_width=True, hide_index=True)
+    region_correlations = region_correlations.loc[names].rename(index=label)
+    if region_correlations.notna().any().any():
+        hlp.plotly_chart(COL_7, hlp.draw_heatmap(region_correlations, 'Correlation of Annual Price Changes'), use_container_width=True)
+    else:
+        COL_7.info('Too few years overlap with the Real Estate Index to correlate annual changes yet.')
+
+st.write('---')
+hlp.INSTRUMENTATION.finish_rerun()
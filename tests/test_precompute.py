@@ -0,0 +1,70 @@
+"""
+The 3/6/12 month summaries must match the original pandas semantics (tail(n).mean()
+and .sum() skip missing values) on series with gaps, however they are computed.
+
+Run with: python -m pytest tests
+"""
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules import helper_functions as hlp  # noqa: E402
+from modules.incremental import RollingState  # noqa: E402
+from modules.precompute import Precomputed  # noqa: E402
+from modules.store import DistrictStore  # noqa: E402
+
+MONTHS = [3, 6, 12]
+
+
+def pandas_summary(df: pd.DataFrame, district_key: str, months: list[int]):
+    """Calculations.summary as it was before the precomputed tables."""
+    values = []
+    for i in months:
+        mean_sqm = df[f'{district_key}_PPSM'].tail(i).mean()
+        sum_value = df[f'{district_key}_NOS'].tail(i).sum()
+        last_element = df[f'{district_key}_PPSM'].iloc[-1]
+        nth_element = df[f'{district_key}_PPSM'].iloc[-i-1]
+        pct_difference = round(((last_element-nth_element)/last_element)*100, 1)
+        values.append([f'{i} months', mean_sqm, sum_value, pct_difference])
+    return values
+
+
+@pytest.fixture(scope='module')
+def gappy():
+    """The housing data with a missing latest NOS, a missing PPSM inside the windows and a fully missing NOS window."""
+    df = hlp.HOUSING_DATA.parse_csv()[1]
+    df = df.astype({column: float for column in df.columns if column != 'DATE'})
+    df.loc[df.index[-1], 'HY_NOS'] = np.nan
+    df.loc[df.index[-2], 'C_PPSM'] = np.nan
+    df.loc[df.index[-12:], 'KB_NOS'] = np.nan
+    return df
+
+
+def assert_rows_equal(rows, expected):
+    assert len(rows) == len(expected)
+    for row, reference in zip(rows, expected):
+        assert row[0] == reference[0]
+        np.testing.assert_allclose(row[1], reference[1], rtol=1e-9)
+        assert row[2] == reference[2]
+        np.testing.assert_allclose(row[3], reference[3], rtol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('district', ['HY', 'C', 'KB', 'FO'])
+def test_summaries_skip_missing_values(gappy, district):
+    expected = pandas_summary(gappy, district, MONTHS)
+    store = DistrictStore(gappy)
+    precomputed = Precomputed(store)
+    assert_rows_equal(precomputed.summary(district, MONTHS), expected)
+    assert_rows_equal(hlp.Calculations(gappy, store).summary(district, MONTHS), expected)
+    assert_rows_equal(RollingState.from_frame(gappy).summary(district, MONTHS), expected)
+
+    # Tables extended month by month from the rolling state of an earlier version
+    previous = gappy.iloc[:-4].reset_index(drop=True)
+    state = RollingState.from_frame(previous)
+    extended = state.extend(store, Precomputed(DistrictStore(previous)))
+    assert_rows_equal(extended.summary(district, MONTHS), expected)
@@ -0,0 +1,63 @@
+"""
+A refresh that fails after fetching must not lose the data it fetched: the retry has to
+fetch and publish it again instead of getting a 304 for validators saved too early.
+
+Run with: python -m pytest tests
+"""
+import functools
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules import helper_functions as hlp  # noqa: E402
+from modules import refresh, snapshot  # noqa: E402
+from modules.scb import STATE_FILE, read_housing_csv, write_housing_csv  # noqa: E402
+from modules.scb_stub import StubServer  # noqa: E402
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """The housing data without its latest month, in a directory of its own."""
+    dataset = hlp.ImportData('housing_data.csv', date_format='%m-%Y', compact=False)
+    dataset.path = str(tmp_path / 'housing_data.csv')
+    dataset.snapshot_dir = str(tmp_path / 'snapshot' / 'housing_data')
+    write_housing_csv(read_housing_csv(hlp.HOUSING_DATA.path).iloc[:-1], dataset.path)
+    yield dataset
+    hlp.ImportData.clear()
+
+
+@pytest.fixture
+def server():
+    server = StubServer(read_housing_csv(hlp.HOUSING_DATA.path)).start()
+    yield server
+    server.shutdown()
+
+
+def test_retry_after_failed_build_publishes(dataset, server, monkeypatch, tmp_path):
+    refresher = refresh.Refresher(dataset, source=functools.partial(refresh.scb_source, base_url=server.url))
+    first_version = dataset.version
+    months = len(dataset.load())
+
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(snapshot, 'write_snapshot', fail)
+        with pytest.raises(OSError):
+            refresher.refresh()
+
+    assert dataset.version == first_version
+    assert not (tmp_path / STATE_FILE).exists()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(refresh.STAGED_SUFFIX)]
+
+    version = refresher.refresh()
+    assert version is not None and version != first_version
+    assert dataset.version == version
+    assert len(dataset.load()) == months + 1
+    assert (tmp_path / STATE_FILE).exists()
+
+    # With the validators saved, the next refresh gets 304s and has nothing to publish
+    assert refresher.refresh() is None